@@ -0,0 +1,77 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Compare wall time of the single-process H.264 encode with the chunked parallel encode.
+
+Usage: python -m benchmarks.bench_chunked_transcode [source_seconds] [workers] [ts|flv]
+Needs ffmpeg and ffprobe on PATH. A synthetic 1080p TS (or FLV) recording with a 2 second GOP is generated
+once, then encoded both ways with the same x264 settings and the output durations are compared to it. The chunk minimums are lowered for the run so that a
+short source still splits.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from src import chunked_transcode
+
+
+CONTAINERS = {'ts': 'mpegts', 'flv': 'flv'}
+
+
+def make_source(directory: str, seconds: int, container: str = 'ts') -> str:
+    path = os.path.join(directory, f'source.{container}')
+    subprocess.run([
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f'testsrc2=size=1920x1080:rate=30:duration={seconds}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-g', '60', '-b:v', '6000k',
+        '-c:a', 'aac', '-f', CONTAINERS[container], path,
+    ], check=True)
+    return path
+
+
+def run_single(source: str, output: str) -> float:
+    start = time.perf_counter()
+    subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-i', source, *chunked_transcode.X264_ARGS,
+                    '-c:a', 'copy', '-f', 'mp4', output], check=True)
+    return time.perf_counter() - start
+
+
+def run_chunked(source: str, output: str, workers: int) -> float:
+    start = time.perf_counter()
+    if not chunked_transcode.transcode(source, output, workers=workers):
+        raise RuntimeError('source was not split, use a longer source')
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 180
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else chunked_transcode.default_workers()
+    container = sys.argv[3] if len(sys.argv) > 3 else 'ts'
+    if not shutil.which('ffmpeg') or not shutil.which('ffprobe'):
+        print("ffmpeg/ffprobe not found on PATH, nothing to measure")
+        sys.exit(1)
+
+    chunked_transcode.MIN_CHUNKED_DURATION = min(chunked_transcode.MIN_CHUNKED_DURATION, seconds / 2)
+    chunked_transcode.MIN_CHUNK_SECONDS = min(chunked_transcode.MIN_CHUNK_SECONDS, 10)
+    with tempfile.TemporaryDirectory() as directory:
+        source = make_source(directory, seconds, container)
+        single_output = os.path.join(directory, 'single.mp4')
+        chunked_output = os.path.join(directory, 'chunked.mp4')
+        single = run_single(source, single_output)
+        chunked = run_chunked(source, chunked_output, workers)
+        source_duration = chunked_transcode.probe_duration(source)
+        print(f"{seconds}s 1080p {container} source, {workers} chunk workers, {os.cpu_count()} cores")
+        print(f"{'mode':<10} {'wall time':>10} {'video duration':>15} {'drift':>8}")
+        print(f"{'source':<10} {'':>10} {source_duration:>14.2f}s")
+        for mode, wall, output in (('single', single, single_output), ('chunked', chunked, chunked_output)):
+            duration = chunked_transcode.probe_duration(output)
+            print(f"{mode:<10} {wall:>9.1f}s {duration:>14.2f}s {duration - source_duration:>+7.2f}s")
+        print(f"speedup {single / chunked:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Report per-recording RSS and time-to-first-byte of each ffmpeg resource profile.
+
+Usage: python -m benchmarks.bench_ffmpeg_profiles [recordings] [settle_seconds]
+Needs ffmpeg on PATH. A synthetic FLV source is generated once and served from a local HTTP server,
+then every profile starts the given number of concurrent recordings against it. RSS is read from
+/proc, so the memory column is only filled in on Linux.
+"""
+
+import functools
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from src import ffmpeg_profiles
+
+SOURCE_SECONDS = 120
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def make_source(directory: str) -> str:
+    path = os.path.join(directory, 'source.flv')
+    subprocess.run([
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f'testsrc2=size=1280x720:rate=30:duration={SOURCE_SECONDS}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:duration={SOURCE_SECONDS}',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-g', '60', '-b:v', '3000k',
+        '-c:a', 'aac', '-f', 'flv', path,
+    ], check=True)
+    return path
+
+
+def build_command(profile: ffmpeg_profiles.FfmpegProfile, url: str, output: str) -> list[str]:
+    return [
+        'ffmpeg', '-y', '-loglevel', 'error', '-hide_banner',
+        '-rw_timeout', str(profile.rw_timeout),
+        '-thread_queue_size', str(profile.thread_queue_size),
+        '-analyzeduration', str(profile.analyzeduration),
+        '-probesize', str(profile.probesize),
+        '-fflags', '+discardcorrupt', '-re', '-i', url,
+        '-bufsize', profile.bufsize, '-sn', '-dn',
+        '-max_muxing_queue_size', str(profile.max_muxing_queue_size),
+        '-c', 'copy', '-map', '0', '-f', 'mpegts', output,
+    ]
+
+
+def read_peak_rss_kb(pid: int) -> int | None:
+    try:
+        with open(f'/proc/{pid}/status', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def run_profile(profile: ffmpeg_profiles.FfmpegProfile, url: str, directory: str,
+                recordings: int, settle: float) -> tuple[float | None, float | None]:
+    outputs = [os.path.join(directory, f'{profile.name.replace("/", "_")}_{i}.ts') for i in range(recordings)]
+    start = time.perf_counter()
+    processes = [subprocess.Popen(build_command(profile, url, output), stdin=subprocess.DEVNULL)
+                 for output in outputs]
+    first_byte: dict[int, float] = {}
+    try:
+        while time.perf_counter() - start < settle:
+            for i, output in enumerate(outputs):
+                if i not in first_byte and os.path.exists(output) and os.path.getsize(output) > 0:
+                    first_byte[i] = time.perf_counter() - start
+            time.sleep(0.01)
+        rss = [read_peak_rss_kb(p.pid) for p in processes]
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+        for output in outputs:
+            if os.path.exists(output):
+                os.remove(output)
+    rss = [r for r in rss if r is not None]
+    avg_rss = sum(rss) / len(rss) / 1024 if rss else None
+    avg_ttfb = sum(first_byte.values()) / len(first_byte) if first_byte else None
+    return avg_rss, avg_ttfb
+
+
+def main() -> None:
+    recordings = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    settle = float(sys.argv[2]) if len(sys.argv) > 2 else 15
+    if not shutil.which('ffmpeg'):
+        print("ffmpeg not found on PATH, nothing to measure")
+        sys.exit(1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        make_source(directory)
+        server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(QuietHandler, directory=directory))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_address[1]}/source.flv'
+
+        profiles = list(ffmpeg_profiles.PROFILES.values())
+        profiles.append(ffmpeg_profiles.get_profile(ffmpeg_profiles.AUTO_PROFILE, running=recordings * 10))
+        print(f"{recordings} concurrent recordings per profile, {settle:.0f}s each")
+        print(f"{'profile':<24} {'RSS/recording':>14} {'time to first byte':>20}")
+        for profile in profiles:
+            rss, ttfb = run_profile(profile, url, directory, recordings, settle)
+            rss_text = f"{rss:.1f} MiB" if rss is not None else "n/a"
+            ttfb_text = f"{ttfb * 1000:.0f} ms" if ttfb is not None else "no output"
+            print(f"{profile.name:<24} {rss_text:>14} {ttfb_text:>20}")
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
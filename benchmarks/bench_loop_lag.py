@@ -0,0 +1,52 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Measure event loop lag while JS signing runs concurrently with other coroutines.
+
+Usage: python -m benchmarks.bench_loop_lag [concurrency] [budget_ms]
+Exits with status 1 when the offloaded run exceeds the lag budget, so CI can catch regressions.
+"""
+
+import asyncio
+import sys
+from src import JS_SCRIPT_PATH, utils
+from src.loop_monitor import LoopLagMonitor
+
+JS_FILE = f'{JS_SCRIPT_PATH}/x-bogus.js'
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+
+
+async def sign_inline(query: str) -> str:
+    return utils.call_js(JS_FILE, 'sign', query, USER_AGENT)
+
+
+async def sign_offloaded(query: str) -> str:
+    return await utils.run_blocking(utils.call_js, JS_FILE, 'sign', query, USER_AGENT)
+
+
+async def measure(sign, concurrency: int, threshold: float) -> float:
+    monitor = LoopLagMonitor(asyncio.get_running_loop(), threshold=threshold)
+    monitor.start()
+    try:
+        await asyncio.gather(*(sign(f'room_id={i}&app_id=1128') for i in range(concurrency)))
+        await asyncio.sleep(monitor.interval * 2)
+    finally:
+        monitor.stop()
+    return monitor.max_lag
+
+
+def main() -> None:
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    budget_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 100
+    utils.get_js_context(JS_FILE)
+    results = {}
+    for label, sign in (('inline', sign_inline), ('offloaded', sign_offloaded)):
+        results[label] = asyncio.run(measure(sign, concurrency, budget_ms / 1000)) * 1000
+        print(f"{label:<10} concurrency={concurrency} max loop lag: {results[label]:.1f} ms")
+    if results['offloaded'] > budget_ms:
+        print(f"FAIL: offloaded max loop lag exceeds budget of {budget_ms:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
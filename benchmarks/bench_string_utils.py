@@ -0,0 +1,65 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Compare the per-poll string helpers before and after precompiling patterns.
+
+Usage: python -m benchmarks.bench_string_utils [polls_per_minute] [rooms]
+"""
+
+import re
+import sys
+import time
+from urllib.parse import parse_qs, urlparse
+from src import patterns, utils
+
+RSTR = r"[\/\\\:\*\？?\"\<\>\|&#.。,， ~！· ]"
+
+
+def legacy_remove_emojis(text: str, replace_text: str = '') -> str:
+    emoji_pattern = re.compile(patterns.EMOJI_PATTERN.pattern, flags=re.UNICODE)
+    return emoji_pattern.sub(replace_text, text)
+
+
+def legacy_clean_name(input_text: str) -> str:
+    cleaned_name = re.sub(RSTR, "_", input_text.strip()).strip("_")
+    cleaned_name = cleaned_name.replace("（", "(").replace("）", ")")
+    return legacy_remove_emojis(cleaned_name, "_").strip("_") or "空白昵称"
+
+
+def current_clean_name(input_text: str) -> str:
+    cleaned_name = patterns.FILENAME_ILLEGAL_PATTERN.sub("_", input_text.strip()).strip("_")
+    cleaned_name = cleaned_name.replace("（", "(").replace("）", ")")
+    return utils.remove_emojis(cleaned_name, "_").strip("_") or "空白昵称"
+
+
+def legacy_codec(url: str) -> str | None:
+    values = parse_qs(urlparse(url).query).get('codec', [])
+    return values[0] if values else None
+
+
+def run(label: str, polls: int, rooms: list[tuple[str, str]], clean, codec) -> float:
+    start = time.perf_counter()
+    for i in range(polls):
+        anchor_name, flv_url = rooms[i % len(rooms)]
+        clean(anchor_name)
+        codec(flv_url)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {polls} polls: {elapsed * 1000:.1f} ms ({elapsed / polls * 1e6:.2f} us/poll)")
+    return elapsed
+
+
+def main() -> None:
+    polls = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    room_count = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    rooms = [
+        (f"主播😀 No.{i}：直播间 ~ 欢迎！",
+         f"https://pull-flv-l1.douyincdn.com/stage/stream-{i}_or4.flv?expire=1730000000&sign=abc{i}&codec=h264")
+        for i in range(room_count)
+    ]
+    legacy = run("legacy", polls, rooms, legacy_clean_name, legacy_codec)
+    current = run("current", polls, rooms, current_clean_name, lambda u: patterns.get_query_param(u, 'codec'))
+    print(f"speedup: {legacy / current:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -303,6 +303,13 @@ class LiveMonitor:
 
             self.log(f"❌ 错误详情: {traceback.format_exc()}", "ERROR")
 
+    def recording_progress_info(self):
+        main_module = get_main_module()
+        if not main_module:
+            return ""
+        progress = main_module.ffmpeg_supervisor.get_progress(self.video_url)
+        return f" | 录制状态: {progress.summary()}" if progress else ""
+
     # --- 文件流处理 ---
     def file_feeder(self, file_path, process):
         self.log(f"📂 文件流处理启动: {file_path}", "DEBUG")
@@ -339,7 +346,8 @@ class LiveMonitor:
                     read_count += 1
                     if read_count % 100 == 0:  # 每读取约400KB打印一次
                         self.log(
-                            f"📊 已读取: {self.g_file_offset / 1024 / 1024:.2f} MB",
+                            f"📊 已读取: {self.g_file_offset / 1024 / 1024:.2f} MB"
+                            f"{self.recording_progress_info()}",
                             "DEBUG",
                         )
                 except Exception as e:
@@ -524,6 +532,18 @@ class LiveMonitor:
                         f"🔍 正在搜索音频文件... (已检查 {check_count * 2} 秒)", "DEBUG"
                     )
 
+                # 录制程序在打开文件时写入索引, 直接查询索引, 无需每次遍历下载目录
+                main_module = get_main_module()
+                if main_module:
+                    latest = main_module.record_catalog.latest(
+                        ".mp3", since=start_ts, under=DOWNLOAD_DIR
+                    )
+                    if latest and os.path.exists(latest):
+                        self.log(f"✅ 找到新文件: {os.path.basename(latest)}", "INFO")
+                        return latest
+                    time.sleep(2)
+                    continue
+
                 for dp, dn, filenames in os.walk(DOWNLOAD_DIR):
                     for f in filenames:
                         if f.endswith(".mp3"):
@@ -627,6 +647,7 @@ class LiveMonitor:
         main_module = get_main_module()  # 延迟导入
         if main_module:
             main_module.exit_recording = True
+            main_module.ffmpeg_supervisor.stop_all()
             self.log("✅ 已设置录制退出标志", "DEBUG")
         # 等待录制线程结束（可选，给一个短暂的超时）
         if self.rec_thread and self.rec_thread.is_alive():
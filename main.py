@@ -13,12 +13,13 @@ import asyncio
 import os
 import sys
 import builtins
+import functools
+import hashlib
 import subprocess
 import signal
 import threading
 import time
 import datetime
-import re
 import shutil
 import random
 import uuid
@@ -27,12 +28,36 @@ import urllib.request
 from urllib.error import URLError, HTTPError
 from typing import Any
 import configparser
-import httpx
 import argparse
-from src import spider, stream
+from src import spider, stream, hedge
 from src.proxy import ProxyDetector
+from src.loop_monitor import install_loop_monitor
+from src.stream_cache import stream_url_cache
+from src.hls_recorder import record_hls, UnsupportedPlaylistError
+from src.flv_recorder import record_flv
+from src.supervisor import ffmpeg_supervisor
+from src.ffmpeg_progress import PROGRESS_ARGS
+from src.multi_output import (
+    build_extra_outputs,
+    get_extra_output_path,
+    is_extra_output_path,
+    parse_extra_outputs,
+)
+from src.metrics import start_metrics_server
+from src.stream_hub import stream_hubs, start_stream_hub_server
+from src.session import SessionManager
+from src.storage_mover import StorageMover
+from src import catalog, job_store, mp4, storage
+from src import ffmpeg_profiles, chunked_transcode, conversion_planner
+from src.postprocess import (
+    PRIORITY_ENCODE,
+    PRIORITY_REMUX,
+    PostProcessPool,
+    postprocess_pool,
+    run_low_priority,
+)
 from src.utils import logger
-from src import utils
+from src import utils, patterns
 from msg_push import dingtalk, xizhi, tg_bot, send_email, bark, ntfy, pushplus
 from ffmpeg_install import (
     check_ffmpeg,
@@ -71,6 +96,9 @@ not_record_list = []
 start_display_time = datetime.datetime.now()
 global_proxy = False
 recording_time_list = {}
+record_platforms = {}
+stream_reconnect_delay = 5
+stream_min_valid_runtime = 10
 
 
 # ================= 路径处理函数 =================
@@ -161,7 +189,6 @@ if not os.path.exists(url_config_file):
             print(f"⚠️  无法复制URL配置文件: {e}")
 
 text_encoding = "utf-8-sig"
-rstr = r"[\/\\\:\*\？?\"\<\>\|&#.。,， ~！· ]"
 # 下载目录使用用户数据目录
 default_path = os.path.join(user_data_dir, "downloads")
 os.makedirs(default_path, exist_ok=True)
@@ -199,6 +226,9 @@ def display_info() -> None:
             print(f"目前瞬时错误数为: {error_count}", end=" | ")
             now = time.strftime("%H:%M:%S", time.localtime())
             print(f"当前时间: {now}")
+            print(storage_manager.summary())
+            if archive_mover.enabled:
+                print(archive_mover.summary())
 
             if len(recording) == 0:
                 time.sleep(5)
@@ -214,9 +244,13 @@ def display_info() -> None:
                 for recording_live in no_repeat_recording:
                     rt, qa = recording_time_list[recording_live]
                     have_record_time = now_time - rt
+                    progress = ffmpeg_supervisor.get_progress(recording_live)
+                    progress_info = f" | {progress.summary()}" if progress else ""
                     print(
-                        f"{recording_live}[{qa}] 正在录制中 {str(have_record_time).split('.')[0]}"
+                        f"{recording_live}[{qa}] 正在录制中 {str(have_record_time).split('.')[0]}{progress_info}"
                     )
+                if postprocess_pool.pending or postprocess_pool.running:
+                    print(postprocess_pool.summary())
 
                 # print('\n本软件已运行：'+str(now_time - start_display_time).split('.')[0])
                 print("x" * 60)
@@ -287,7 +321,7 @@ def segment_video(
     segment_format: str,
     segment_time: str,
     is_original_delete: bool = True,
-) -> None:
+) -> bool:
     try:
         if (
             os.path.exists(converts_file_path)
@@ -295,6 +329,7 @@ def segment_video(
         ):
             ffmpeg_command = [
                 "ffmpeg",
+                "-y",
                 "-i",
                 converts_file_path,
                 "-c:v",
@@ -315,8 +350,9 @@ def segment_video(
                 "+frag_keyframe+empty_moov",
                 segment_save_file_path,
             ]
-            _output = subprocess.check_output(
+            run_low_priority(
                 ffmpeg_command,
+                PRIORITY_REMUX,
                 stderr=subprocess.STDOUT,
                 startupinfo=get_startup_info(os_type),
             )
@@ -324,101 +360,214 @@ def segment_video(
                 time.sleep(1)
                 if os.path.exists(converts_file_path):
                     os.remove(converts_file_path)
+                record_catalog.remove_file(converts_file_path)
+        return True
     except subprocess.CalledProcessError as e:
         logger.error(f"Error occurred during conversion: {e}")
+        return False
     except Exception as e:
         logger.error(f"An unknown error occurred: {e}")
+        return False
+
+
+def merge_record_parts(save_file_path: str, part_paths: list) -> None:
+    part_paths = [
+        p for p in part_paths if os.path.exists(p) and os.path.getsize(p) > 0
+    ]
+    if len(part_paths) < 2:
+        return
+    file_root, file_ext = os.path.splitext(save_file_path)
+    list_file_path = f"{file_root}_parts.txt"
+    merged_file_path = f"{file_root}_merged{file_ext}"
+    try:
+        with open(list_file_path, "w", encoding="utf-8") as f:
+            for path in part_paths:
+                escaped_path = os.path.abspath(path).replace("'", "'\\''")
+                f.write(f"file '{escaped_path}'\n")
+        ffmpeg_command = [
+            "ffmpeg",
+            "-y",
+            "-f",
+            "concat",
+            "-safe",
+            "0",
+            "-i",
+            list_file_path,
+            "-c",
+            "copy",
+            "-map",
+            "0",
+            merged_file_path,
+        ]
+        run_low_priority(
+            ffmpeg_command,
+            PRIORITY_REMUX,
+            stderr=subprocess.STDOUT,
+            startupinfo=get_startup_info(os_type),
+        )
+        os.replace(merged_file_path, save_file_path)
+        for path in part_paths:
+            if path != save_file_path and os.path.exists(path):
+                os.remove(path)
+                record_catalog.remove_file(path)
+    except subprocess.CalledProcessError as e:
+        logger.error(f"合并录制分段失败: {e.output.decode(errors='ignore')}")
+    finally:
+        if os.path.exists(list_file_path):
+            os.remove(list_file_path)
 
 
-def converts_mp4(converts_file_path: str, is_original_delete: bool = True) -> None:
+def converts_mp4(converts_file_path: str, is_original_delete: bool = True) -> bool:
     try:
         if (
             os.path.exists(converts_file_path)
             and os.path.getsize(converts_file_path) > 0
         ):
-            if converts_to_h264:
+            info = conversion_planner.try_probe(
+                converts_file_path, startupinfo=get_startup_info(os_type)
+            )
+            if info:
+                plan = conversion_planner.plan_mp4(info, converts_to_h264)
+                conversion_planner.record_plan(
+                    converts_file_path, plan, info, converts_to_h264
+                )
+            else:
+                plan = conversion_planner.fallback_mp4(converts_to_h264)
+            if plan.video_encode:
                 color_obj.print_colored(
                     "正在转码为MP4格式并重新编码为h264\n", color_obj.YELLOW
                 )
-                ffmpeg_command = [
-                    "ffmpeg",
-                    "-i",
-                    converts_file_path,
-                    "-c:v",
-                    "libx264",
-                    "-preset",
-                    "veryfast",
-                    "-crf",
-                    "23",
-                    "-vf",
-                    "format=yuv420p",
-                    "-c:a",
-                    "copy",
-                    "-f",
-                    "mp4",
-                    converts_file_path.rsplit(".", maxsplit=1)[0] + ".mp4",
-                ]
             else:
                 color_obj.print_colored("正在转码为MP4格式\n", color_obj.YELLOW)
-                ffmpeg_command = [
-                    "ffmpeg",
-                    "-i",
-                    converts_file_path,
-                    "-c:v",
-                    "copy",
-                    "-c:a",
-                    "copy",
-                    "-f",
-                    "mp4",
-                    converts_file_path.rsplit(".", maxsplit=1)[0] + ".mp4",
-                ]
-            _output = subprocess.check_output(
-                ffmpeg_command,
-                stderr=subprocess.STDOUT,
-                startupinfo=get_startup_info(os_type),
+            ffmpeg_command = [
+                "ffmpeg",
+                "-y",
+                "-i",
+                converts_file_path,
+                *plan.args,
+                "-f",
+                "mp4",
+                converts_file_path.rsplit(".", maxsplit=1)[0] + ".mp4",
+            ]
+            if (
+                plan.video_encode
+                and chunked_h264
+                and transcode_chunked(converts_file_path, ffmpeg_command[-1])
+            ):
+                ffmpeg_command = None
+            if ffmpeg_command:
+                run_low_priority(
+                    ffmpeg_command,
+                    PRIORITY_ENCODE
+                    if plan.action == conversion_planner.PLAN_ENCODE
+                    else PRIORITY_REMUX,
+                    stderr=subprocess.STDOUT,
+                    startupinfo=get_startup_info(os_type),
+                )
+            record_catalog.derive_file(
+                converts_file_path,
+                converts_file_path.rsplit(".", maxsplit=1)[0] + ".mp4",
             )
+            conversion_planner.discard(converts_file_path)
             if is_original_delete:
                 time.sleep(1)
                 if os.path.exists(converts_file_path):
                     os.remove(converts_file_path)
+                record_catalog.remove_file(converts_file_path)
+        return True
     except subprocess.CalledProcessError as e:
         logger.error(f"Error occurred during conversion: {e}")
+        return False
     except Exception as e:
         logger.error(f"An unknown error occurred: {e}")
+        return False
 
 
-def converts_m4a(converts_file_path: str, is_original_delete: bool = True) -> None:
+def transcode_chunked(converts_file_path: str, output_path: str) -> bool:
+    # any failure of the chunked path leaves the single-pass encode to the caller
+    try:
+        return chunked_transcode.transcode(
+            converts_file_path,
+            output_path,
+            workers=get_chunked_h264_workers(),
+            startupinfo=get_startup_info(os_type),
+        )
+    except Exception as e:
+        logger.warning(f"分块并行转码失败, 改用单进程转码: {e}")
+        return False
+
+
+def get_chunked_h264_workers() -> int:
+    # several encodes may run side by side on the post-processing pool, so share the cores between them
+    return max(2, chunked_transcode.default_workers() // postprocess_pool.workers)
+
+
+def submit_postprocess(
+    func, *args, priority: int = PRIORITY_REMUX, max_attempts: int = 3
+) -> None:
+    if job_queue:
+        job_queue.submit(
+            func.__name__, *args, priority=priority, max_attempts=max_attempts
+        )
+    else:
+        postprocess_pool.submit(func, *args, priority=priority)
+
+
+def submit_converts_mp4(converts_file_path: str, is_original_delete: bool = True) -> None:
+    submit_postprocess(
+        converts_mp4,
+        converts_file_path,
+        is_original_delete,
+        priority=PRIORITY_ENCODE if converts_to_h264 else PRIORITY_REMUX,
+    )
+
+
+def converts_m4a(converts_file_path: str, is_original_delete: bool = True) -> bool:
     try:
         if (
             os.path.exists(converts_file_path)
             and os.path.getsize(converts_file_path) > 0
         ):
-            _output = subprocess.check_output(
+            info = conversion_planner.try_probe(
+                converts_file_path, startupinfo=get_startup_info(os_type)
+            )
+            if info:
+                plan = conversion_planner.plan_m4a(info)
+                conversion_planner.record_plan(converts_file_path, plan, info, True)
+            else:
+                plan = conversion_planner.fallback_m4a()
+            run_low_priority(
                 [
                     "ffmpeg",
                     "-i",
                     converts_file_path,
                     "-n",
-                    "-vn",
-                    "-c:a",
-                    "aac",
-                    "-bsf:a",
-                    "aac_adtstoasc",
-                    "-ab",
-                    "320k",
+                    *plan.args,
                     converts_file_path.rsplit(".", maxsplit=1)[0] + ".m4a",
                 ],
+                PRIORITY_ENCODE
+                if plan.action == conversion_planner.PLAN_ENCODE
+                else PRIORITY_REMUX,
                 stderr=subprocess.STDOUT,
                 startupinfo=get_startup_info(os_type),
             )
+            record_catalog.derive_file(
+                converts_file_path,
+                converts_file_path.rsplit(".", maxsplit=1)[0] + ".m4a",
+            )
+            conversion_planner.discard(converts_file_path)
             if is_original_delete:
                 time.sleep(1)
                 if os.path.exists(converts_file_path):
                     os.remove(converts_file_path)
+                record_catalog.remove_file(converts_file_path)
+        return True
     except subprocess.CalledProcessError as e:
         logger.error(f"Error occurred during conversion: {e}")
+        return False
     except Exception as e:
         logger.error(f"An unknown error occurred: {e}")
+        return False
 
 
 def generate_subtitles(
@@ -540,7 +689,7 @@ def push_message(record_name: str, live_url: str, content: str) -> None:
                 )
 
 
-def run_script(command: str) -> None:
+def run_script(command: str) -> bool:
     try:
         process = subprocess.Popen(
             command,
@@ -556,6 +705,7 @@ def run_script(command: str) -> None:
             print(stdout_decoded)
         if stderr_decoded.strip():
             print(stderr_decoded)
+        return process.returncode == 0
     except PermissionError as e:
         logger.error(e)
         logger.error(
@@ -566,11 +716,16 @@ def run_script(command: str) -> None:
         logger.error(
             "Please add `#!/bin/bash` at the beginning of your bash script file."
         )
+    return False
 
 
-def clear_record_info(record_name: str, record_url: str) -> None:
+def clear_record_info(
+    record_name: str, record_url: str, close_session: bool = True
+) -> None:
     global monitoring
     recording.discard(record_name)
+    if close_session and record_url in url_comments and record_sessions:
+        record_sessions.close(record_url)
     if record_url in url_comments and record_url in running_list:
         running_list.remove(record_url)
         monitoring -= 1
@@ -579,63 +734,77 @@ def clear_record_info(record_name: str, record_url: str) -> None:
         )
 
 
+def should_stop_recording(record_url: str) -> bool:
+    return (
+        record_url in url_comments
+        or exit_recording
+        or storage_manager.should_pause(record_url)
+    )
+
+
+def submit_storage_move(func, *args) -> None:
+    if job_queue:
+        job_queue.submit(func.__name__, *args, max_attempts=5)
+    else:
+        storage_move_pool.submit(func, *args)
+
+
+def pause_storage_recordings() -> None:
+    for record_url in storage_manager.paused_keys():
+        ffmpeg_supervisor.stop(record_url)
+
+
+def get_native_record_headers(platform: str, live_url: str, user_agent: str | None = None) -> dict:
+    headers = {"User-Agent": user_agent} if user_agent else {}
+    header_params = get_record_headers(platform, live_url)
+    if header_params:
+        key, value = header_params.split(":", 1)
+        headers[key] = value
+    return headers
+
+
+def open_stream_hub(record_name: str, content_type: str):
+    return stream_hubs.open(record_name, content_type) if stream_hub_port else None
+
+
 def direct_download_stream(
-    source_url: str, save_path: str, record_name: str, live_url: str, platform: str
+    source_url: str,
+    save_path: str,
+    record_name: str,
+    live_url: str,
+    platform: str,
+    proxy_address: str | None = None,
+    segment_time: float | None = None,
 ) -> bool:
+    hub = open_stream_hub(record_name, "video/x-flv")
     try:
-        with open(save_path, "wb") as f:
-            client = httpx.Client(timeout=None)
-
-            headers = {}
-            header_params = get_record_headers(platform, live_url)
-            if header_params:
-                key, value = header_params.split(":", 1)
-                headers[key] = value
-
-            with client.stream(
-                "GET", source_url, headers=headers, follow_redirects=True
-            ) as response:
-                if response.status_code != 200:
-                    logger.error(f"请求直播流失败，状态码: {response.status_code}")
-                    return False
-
-                downloaded = 0
-                chunk_size = 1024 * 16
-
-                for chunk in response.iter_bytes(chunk_size):
-                    if live_url in url_comments or exit_recording:
-                        color_obj.print_colored(
-                            f"[{record_name}]录制时已被注释或请求停止,下载中断",
-                            color_obj.YELLOW,
-                        )
-                        clear_record_info(record_name, live_url)
-                        return False
-
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                print()
-                return True
+        recorder = record_flv(
+            source_url,
+            save_path,
+            headers=get_native_record_headers(platform, live_url),
+            proxy_addr=proxy_address,
+            should_stop=lambda: should_stop_recording(live_url),
+            segment_time=segment_time,
+            hub=hub,
+        )
+        if recorder.stopped:
+            color_obj.print_colored(
+                f"[{record_name}]录制时已被注释或请求停止,下载中断",
+                color_obj.YELLOW,
+            )
+            clear_record_info(record_name, live_url)
+            return False
+        if recorder.status_code != 200:
+            logger.error(f"请求直播流失败，状态码: {recorder.status_code}")
+        return recorder.bytes_written > 0
     except Exception as e:
         logger.error(f"FLV下载错误: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
         return False
+    finally:
+        stream_hubs.close(hub)
 
 
-def check_subprocess(
-    record_name: str,
-    record_url: str,
-    ffmpeg_command: list,
-    save_type: str,
-    script_command: str | None = None,
-) -> bool:
-    save_file_path = ffmpeg_command[-1]
-    process = subprocess.Popen(
-        ffmpeg_command,
-        stdin=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        startupinfo=get_startup_info(os_type),
-    )
-
+def start_subtitles(record_name: str, save_file_path: str, save_type: str) -> None:
     subs_file_path = save_file_path.rsplit(".", maxsplit=1)[0]
     subs_thread_name = f"subs_{Path(subs_file_path).name}"
     if create_time_file and not split_video_by_time and "音频" not in save_type:
@@ -645,75 +814,527 @@ def check_subprocess(
         create_var[subs_thread_name].daemon = True
         create_var[subs_thread_name].start()
 
-    while process.poll() is None:
-        if record_url in url_comments or exit_recording:
-            color_obj.print_colored(
-                f"[{record_name}]录制时已被注释,本条线程将会退出", color_obj.YELLOW
-            )
-            clear_record_info(record_name, record_url)
-            # process.terminate()
-            if os.name == "nt":
-                if process.stdin:
-                    process.stdin.write(b"q")
-                    process.stdin.close()
-            else:
-                process.send_signal(signal.SIGINT)
-            process.wait()
-            return True
-        time.sleep(1)
 
-    return_code = process.returncode
+def handle_record_finished(
+    record_name: str,
+    save_file_path: str,
+    save_type: str,
+    script_command: str | None = None,
+) -> None:
     stop_time = time.strftime("%Y-%m-%d %H:%M:%S")
-    if return_code == 0:
-        if converts_to_mp4 and save_type == "TS":
-            if split_video_by_time:
-                file_paths = utils.get_file_paths(os.path.dirname(save_file_path))
-                prefix = os.path.basename(save_file_path).rsplit("_", maxsplit=1)[0]
-                for path in file_paths:
-                    if prefix in path:
-                        threading.Thread(
-                            target=converts_mp4, args=(path, delete_origin_file)
-                        ).start()
-            else:
-                threading.Thread(
-                    target=converts_mp4, args=(save_file_path, delete_origin_file)
-                ).start()
-        print(f"\n{record_name} {stop_time} 直播录制完成\n")
-
-        if script_command:
-            logger.debug("开始执行脚本命令!")
-            if "python" in script_command:
-                params = [
-                    f'--record_name "{record_name}"',
-                    f'--save_file_path "{save_file_path}"',
-                    f"--save_type {save_type}",
-                    f"--split_video_by_time {split_video_by_time}",
-                    f"--converts_to_mp4 {converts_to_mp4}",
-                ]
-            else:
-                params = [
-                    f'"{record_name.split(" ", maxsplit=1)[-1]}"',
-                    f'"{save_file_path}"',
-                    save_type,
-                    f"split_video_by_time:{split_video_by_time}",
-                    f"converts_to_mp4:{converts_to_mp4}",
-                ]
-            script_command = script_command.strip() + " " + " ".join(params)
+    # split segments are handed to post-processing one by one as they close
+    if converts_to_mp4 and not split_video_by_time and save_type in ("TS", "FLV"):
+        submit_converts_mp4(save_file_path, delete_origin_file)
+    if mp4_faststart and save_type == "MP4" and "%03d" not in save_file_path:
+        submit_postprocess(mp4.faststart, save_file_path)
+    print(f"\n{record_name} {stop_time} 直播录制完成\n")
+
+    if script_command:
+        logger.debug("开始执行脚本命令!")
+        if "python" in script_command:
+            params = [
+                f'--record_name "{record_name}"',
+                f'--save_file_path "{save_file_path}"',
+                f"--save_type {save_type}",
+                f"--split_video_by_time {split_video_by_time}",
+                f"--converts_to_mp4 {converts_to_mp4}",
+            ]
+        else:
+            params = [
+                f'"{record_name.split(" ", maxsplit=1)[-1]}"',
+                f'"{save_file_path}"',
+                save_type,
+                f"split_video_by_time:{split_video_by_time}",
+                f"converts_to_mp4:{converts_to_mp4}",
+            ]
+        script_command = script_command.strip() + " " + " ".join(params)
+        if job_queue:
+            # scripts may have side effects, so a failed run is not retried automatically
+            submit_postprocess(run_script, script_command, max_attempts=1)
+            logger.debug("脚本命令已加入后处理队列!")
+        else:
             run_script(script_command)
             logger.debug("脚本命令执行结束!")
 
+
+def get_candidate_urls(
+    record_url: str, record_quality: str, real_url: str, port_info: dict
+) -> list:
+    urls = [
+        port_info.get("flv_url"),
+        port_info.get("m3u8_url"),
+        *port_info.get("candidate_urls", []),
+    ]
+    cached_stream = stream_url_cache.get(record_url, record_quality)
+    if cached_stream:
+        urls.extend([cached_stream[1].get("flv_url"), cached_stream[1].get("m3u8_url")])
+
+    is_flv = ".flv" in real_url.split("?")[0]
+    candidate_urls = []
+    for url in urls:
+        if not url or url == real_url or url in candidate_urls:
+            continue
+        if ".flv" in url.split("?")[0] and patterns.get_query_param(url, "codec") == "h265":
+            continue
+        candidate_urls.append(url)
+    candidate_urls.sort(key=lambda u: (".flv" in u.split("?")[0]) != is_flv)
+    return [*candidate_urls, real_url]
+
+
+def get_ffmpeg_profile(
+    record_url: str, platform: str, overseas: bool
+) -> ffmpeg_profiles.FfmpegProfile:
+    profile_name = ffmpeg_profile_name
+    for key, name in ffmpeg_profile_rules.items():
+        if key in record_url or key in platform:
+            profile_name = name
+            break
+    return ffmpeg_profiles.get_profile(
+        profile_name, overseas, len(recording), ffmpeg_profile_scale_start
+    )
+
+
+def get_part_path(save_file_path: str, part_index: int) -> str:
+    if "_%03d" in save_file_path:
+        return save_file_path.replace("_%03d", f"_part{part_index:02d}_%03d")
+    file_root, file_ext = os.path.splitext(save_file_path)
+    return f"{file_root}_part{part_index:02d}{file_ext}"
+
+
+def get_extra_outputs(save_type: str) -> list:
+    if any(i in save_type for i in ["MP3", "M4A", "音频"]):
+        return []
+    return extra_outputs
+
+
+def merge_extra_outputs(save_file_path: str, part_paths: list, names: list) -> None:
+    for name in names:
+        merge_record_parts(
+            get_extra_output_path(save_file_path, name),
+            [get_extra_output_path(path, name) for path in part_paths],
+        )
+
+
+def convert_closed_segment(path: str) -> None:
+    if not is_extra_output_path(path):
+        submit_converts_mp4(path, delete_origin_file)
+
+
+def get_catalog_info(record_name: str, record_url: str) -> dict:
+    return {
+        "room": record_url,
+        "platform": record_platforms.get(record_url),
+        "anchor": record_name.split(" ", maxsplit=1)[-1],
+    }
+
+
+def catalog_file_opened(record_name: str, record_url: str, path: str) -> None:
+    record_catalog.open_file(path, **get_catalog_info(record_name, record_url))
+
+
+def catalog_file_closed(
+    record_name: str, record_url: str, path: str, convert: bool = False
+) -> None:
+    record_catalog.close_file(path, **get_catalog_info(record_name, record_url))
+    if convert:
+        convert_closed_segment(path)
+
+
+def catalog_record_closed(
+    record_name: str,
+    record_url: str,
+    save_file_path: str,
+    save_type: str,
+    digest: str | None = None,
+) -> None:
+    # split segments were cataloged one by one as ffmpeg closed them
+    paths = [save_file_path] if "%03d" not in save_file_path else []
+    paths += [
+        get_extra_output_path(save_file_path, name)
+        for name in get_extra_outputs(save_type)
+    ]
+    for path in paths:
+        if os.path.exists(path):
+            record_catalog.close_file(
+                path,
+                digest if path == save_file_path else None,
+                **get_catalog_info(record_name, record_url),
+            )
+
+
+def get_segment_list_path(part_path: str) -> str:
+    return os.path.splitext(part_path.replace("_%03d", ""))[0] + "_segments.txt"
+
+
+def is_append_only_output(command: list, save_type: str) -> bool:
+    # muxers that never seek back, so the output can be hashed while ffmpeg writes it
+    return save_type == "TS" or (
+        save_type == "MP4" and "+frag_keyframe+empty_moov+default_base_moof" in command
+    )
+
+
+def finish_record(
+    record_name: str,
+    record_url: str,
+    save_file_path: str,
+    save_type: str,
+    script_command: str | None = None,
+    started_at: float | None = None,
+    digest: str | None = None,
+) -> None:
+    if record_sessions and "%03d" not in save_file_path:
+        if (
+            record_hash_full_pass
+            and record_hash_algorithm
+            and not digest
+            and os.path.exists(save_file_path)
+        ):
+            # merged parts, or a muxer that patched its header, need a second full read
+            digest = f"{record_hash_algorithm}:" + utils.hash_file(
+                save_file_path, record_hash_algorithm
+            )
+        catalog_record_closed(record_name, record_url, save_file_path, save_type, digest)
+        record_sessions.add(
+            record_url,
+            record_name,
+            save_file_path,
+            save_type,
+            script_command,
+            started_at=started_at,
+            digest=digest,
+            platform=record_platforms.get(record_url),
+            anchor=record_name.split(" ", maxsplit=1)[-1],
+        )
+    else:
+        catalog_record_closed(record_name, record_url, save_file_path, save_type, digest)
+        handle_record_finished(record_name, save_file_path, save_type, script_command)
+
+
+def finish_record_session(session) -> None:
+    file_paths = session.file_paths
+    save_file_path = file_paths[0]
+    if len(file_paths) > 1:
+        logger.info(f"{session.record_name} 合并本场次 {len(file_paths)} 个录制文件")
+        merge_record_parts(save_file_path, file_paths)
+        merge_extra_outputs(
+            save_file_path, file_paths, get_extra_outputs(session.save_type)
+        )
+    session.output_path = save_file_path
+    record_catalog.add_session(
+        session.manifest_path,
+        file_paths,
+        room=session.key,
+        record_name=session.record_name,
+        platform=session.files[0]["platform"],
+        anchor=session.files[0]["anchor"],
+        save_type=session.save_type,
+        output=save_file_path,
+        started_at=session.started_at,
+    )
+    handle_record_finished(
+        session.record_name, save_file_path, session.save_type, session.script_command
+    )
+
+
+def finish_record_parts(
+    record_name: str,
+    record_url: str,
+    save_file_path: str,
+    part_paths: list,
+    save_type: str,
+    script_command: str | None = None,
+    started_at: float | None = None,
+    digest: str | None = None,
+    close_session: bool = False,
+) -> None:
+    if len(part_paths) > 1:
+        if "%03d" not in save_file_path:
+            merge_record_parts(save_file_path, part_paths)
+        merge_extra_outputs(save_file_path, part_paths, get_extra_outputs(save_type))
+        digest = None
+    finish_record(
+        record_name,
+        record_url,
+        save_file_path,
+        save_type,
+        script_command,
+        started_at,
+        digest,
+    )
+    if close_session and record_sessions:
+        # the room was commented out, so its session ends with this file
+        record_sessions.close(record_url)
+
+
+def check_subprocess(
+    record_name: str,
+    record_url: str,
+    ffmpeg_command: list,
+    save_type: str,
+    script_command: str | None = None,
+    candidate_urls: list | None = None,
+) -> bool:
+    save_file_path = ffmpeg_command[-1]
+    candidate_urls = list(candidate_urls or [])
+    output_names = get_extra_outputs(save_type)
+    part_paths = []
+    command = ffmpeg_command
+    start_time = time.time()
+
+    # catalog each split segment as soon as ffmpeg closes it, and convert it right away, instead of scanning
+    # the folder at the end
+    watch_segments = "%03d" in save_file_path
+    on_segment = functools.partial(
+        catalog_file_closed,
+        record_name,
+        record_url,
+        convert=converts_to_mp4 and save_type == "TS",
+    )
+
+    while True:
+        segment_list = get_segment_list_path(command[-1]) if watch_segments else None
+        segment_args = (
+            ["-segment_list", segment_list, "-segment_list_type", "flat"]
+            if segment_list
+            else []
+        )
+        process = ffmpeg_supervisor.start(
+            record_url,
+            [
+                command[0],
+                *PROGRESS_ARGS,
+                *command[1:-1],
+                *segment_args,
+                command[-1],
+                *build_extra_outputs(command[-1], output_names),
+            ],
+            name=record_name,
+            stall_timeout=stall_timeout or None,
+            segment_list=segment_list,
+            on_segment=on_segment,
+            hash_path=command[-1] if "%03d" not in command[-1] else None,
+            hash_algorithm=record_hash_algorithm
+            if is_append_only_output(command, save_type)
+            else None,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            startupinfo=get_startup_info(os_type),
+        )
+        for path in [
+            command[-1],
+            *(get_extra_output_path(command[-1], name) for name in output_names),
+        ]:
+            if "%03d" not in path:
+                catalog_file_opened(record_name, record_url, path)
+        if not part_paths:
+            start_subtitles(record_name, save_file_path, save_type)
+        if record_url in url_comments or exit_recording:
+            ffmpeg_supervisor.stop(record_url)
+
+        return_code = process.wait()
+        part_paths.append(command[-1])
+        if segment_list and os.path.exists(segment_list):
+            os.remove(segment_list)
+        if process.stalled and candidate_urls:
+            next_url = candidate_urls.pop(0)
+            command = list(command)
+            command[command.index("-i") + 1] = next_url
+            command[-1] = get_part_path(save_file_path, len(part_paths))
+            logger.warning(f"{record_name} 直播流卡顿, 切换线路继续录制: {next_url}")
+            stream_url_cache.invalidate(record_url)
+            continue
+        break
+
+    stop_time = time.strftime("%Y-%m-%d %H:%M:%S")
+    # commented out, exiting or out of disk space: ffmpeg exits 255 after SIGINT, but the file is complete
+    stopped = process.stop_requested and not process.stalled
+    commented = stopped and not storage_manager.should_pause(record_url)
+    if not stopped and (
+        return_code == 0 or time.time() - start_time < stream_min_valid_runtime
+    ):
+        stream_url_cache.invalidate(record_url)
+    if return_code == 0 or stopped or len(part_paths) > 1:
+        ffmpeg_supervisor.submit(
+            finish_record_parts,
+            record_name,
+            record_url,
+            save_file_path,
+            part_paths,
+            save_type,
+            script_command,
+            start_time,
+            process.digest,
+            commented and record_url in url_comments,
+        )
     else:
         color_obj.print_colored(
             f"\n{record_name} {stop_time} 直播录制出错,返回码: {return_code}\n",
             color_obj.RED,
         )
+        catalog_record_closed(record_name, record_url, save_file_path, save_type)
 
+    if commented:
+        color_obj.print_colored(
+            f"[{record_name}]录制时已被注释,本条线程将会退出", color_obj.YELLOW
+        )
+        # the session is closed by finish_record_parts, once the file has been added to it
+        clear_record_info(record_name, record_url, close_session=False)
+        return True
     recording.discard(record_name)
     return False
 
 
+def use_native_hls(real_url: str) -> bool:
+    return native_hls_record and not extra_outputs and ".m3u8" in real_url.split("?", maxsplit=1)[0]
+
+
+def check_native_hls(
+    record_name: str,
+    record_url: str,
+    real_url: str,
+    save_file_path: str,
+    save_type: str,
+    platform: str,
+    user_agent: str,
+    proxy_address: str | None = None,
+    script_command: str | None = None,
+) -> bool | None:
+    started_at = time.time()
+    start_subtitles(record_name, save_file_path, save_type)
+    hub = open_stream_hub(record_name, "video/mp2t")
+    try:
+        recorder = record_hls(
+            real_url,
+            save_file_path,
+            headers=get_native_record_headers(platform, record_url, user_agent),
+            proxy_addr=proxy_address,
+            should_stop=lambda: should_stop_recording(record_url),
+            segment_time=float(split_time) if split_video_by_time else None,
+            concurrency=native_hls_concurrency,
+            hub=hub,
+            on_file_closed=functools.partial(
+                catalog_file_closed,
+                record_name,
+                record_url,
+                convert=converts_to_mp4 and split_video_by_time,
+            ),
+            hash_algorithm=record_hash_algorithm,
+            on_file_opened=functools.partial(catalog_file_opened, record_name, record_url),
+        )
+    except UnsupportedPlaylistError as e:
+        logger.warning(f"{e}, 改用FFmpeg录制")
+        return None
+    except Exception as e:
+        stream_url_cache.invalidate(record_url)
+        color_obj.print_colored(
+            f"\n{record_name} {time.strftime('%Y-%m-%d %H:%M:%S')} 直播录制出错: {e}\n",
+            color_obj.RED,
+        )
+        recording.discard(record_name)
+        return False
+    finally:
+        stream_hubs.close(hub)
+
+    commented = recorder.stopped and not storage_manager.should_pause(record_url)
+    if not commented:
+        stream_url_cache.invalidate(record_url)
+    if recorder.segments_written:
+        finish_record(
+            record_name,
+            record_url,
+            save_file_path,
+            save_type,
+            script_command,
+            started_at,
+            recorder.file_hashes.get(save_file_path),
+        )
+    if commented:
+        # finished above, so the last file is part of the session closed here
+        color_obj.print_colored(
+            f"[{record_name}]录制时已被注释,本条线程将会退出", color_obj.YELLOW
+        )
+        clear_record_info(record_name, record_url)
+        return True
+    recording.discard(record_name)
+    return False
+
+
+def check_native_flv(
+    record_name: str,
+    record_url: str,
+    flv_url: str,
+    save_file_path: str,
+    save_type: str,
+    platform: str,
+    user_agent: str,
+    proxy_address: str | None = None,
+    script_command: str | None = None,
+) -> bool:
+    started_at = time.time()
+    start_subtitles(record_name, save_file_path, save_type)
+    hub = open_stream_hub(record_name, "video/x-flv")
+    try:
+        recorder = record_flv(
+            flv_url,
+            save_file_path,
+            headers=get_native_record_headers(platform, record_url, user_agent),
+            proxy_addr=proxy_address,
+            should_stop=lambda: should_stop_recording(record_url),
+            segment_time=float(split_time) if split_video_by_time else None,
+            hub=hub,
+            on_file_closed=functools.partial(
+                catalog_file_closed,
+                record_name,
+                record_url,
+                convert=converts_to_mp4 and split_video_by_time,
+            ),
+            hash_algorithm=record_hash_algorithm,
+            on_file_opened=functools.partial(catalog_file_opened, record_name, record_url),
+        )
+    except Exception as e:
+        stream_url_cache.invalidate(record_url)
+        color_obj.print_colored(
+            f"\n{record_name} {time.strftime('%Y-%m-%d %H:%M:%S')} 直播录制出错: {e}\n",
+            color_obj.RED,
+        )
+        recording.discard(record_name)
+        return False
+    finally:
+        stream_hubs.close(hub)
+
+    commented = recorder.stopped and not storage_manager.should_pause(record_url)
+    if not commented:
+        stream_url_cache.invalidate(record_url)
+    if recorder.bytes_written:
+        finish_record(
+            record_name,
+            record_url,
+            save_file_path,
+            save_type,
+            script_command,
+            started_at,
+            recorder.file_hashes.get(save_file_path),
+        )
+    elif not recorder.stopped:
+        color_obj.print_colored(
+            f"\n{record_name} {time.strftime('%Y-%m-%d %H:%M:%S')} 直播录制出错,状态码: {recorder.status_code}\n",
+            color_obj.RED,
+        )
+    if commented:
+        color_obj.print_colored(
+            f"[{record_name}]录制时已被注释,本条线程将会退出", color_obj.YELLOW
+        )
+        clear_record_info(record_name, record_url)
+        return True
+    recording.discard(record_name)
+    return False
+
+
+@functools.lru_cache(maxsize=1024)
 def clean_name(input_text):
-    cleaned_name = re.sub(rstr, "_", input_text.strip()).strip("_")
+    cleaned_name = patterns.FILENAME_ILLEGAL_PATTERN.sub(
+        "_", input_text.strip()
+    ).strip("_")
     cleaned_name = cleaned_name.replace("（", "(").replace("）", ")")
     if clean_emoji:
         cleaned_name = utils.remove_emojis(cleaned_name, "_").strip("_")
@@ -754,8 +1375,8 @@ def is_flv_preferred_platform(link):
 
 def select_source_url(link, stream_info):
     if is_flv_preferred_platform(link):
-        codec = utils.get_query_params(stream_info.get("flv_url"), "codec")
-        if codec and codec[0] == "h265":
+        codec = patterns.get_query_param(stream_info.get("flv_url"), "codec")
+        if codec == "h265":
             logger.warning(
                 "FLV is not supported for h265 codec, use HLS source instead"
             )
@@ -765,6 +1386,23 @@ def select_source_url(link, stream_info):
     return stream_info.get("record_url")
 
 
+def is_hedge_enabled(record_url: str) -> bool:
+    return any(pt.strip() and pt.strip() in record_url for pt in hedge_platform_list)
+
+
+def is_valid_room_data(json_data: Any) -> bool:
+    return isinstance(json_data, dict) and bool(json_data.get("anchor_name"))
+
+
+def is_valid_port_info(port_info: Any) -> bool:
+    # a definite offline answer is valid too, so offline rooms do not fire the alternate
+    if not isinstance(port_info, dict) or "is_live" not in port_info:
+        return False
+    return not port_info["is_live"] or any(
+        port_info.get(key) for key in ("record_url", "flv_url", "m3u8_url")
+    )
+
+
 def start_record(url_data: tuple, count_variable: int = -1) -> None:
     global error_count
 
@@ -800,20 +1438,48 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
             while True:
                 try:
                     port_info = []
-                    if record_url.find("douyin.com/") > -1:
+                    cached_stream = (
+                        stream_url_cache.get(record_url, record_quality)
+                        if reuse_stream_url
+                        else None
+                    )
+                    if cached_stream:
+                        platform, port_info = cached_stream
+                        logger.debug(f"使用缓存的直播流地址快速重连: {record_url}")
+
+                    elif record_url.find("douyin.com/") > -1:
                         platform = "抖音直播"
                         with semaphore:
                             if (
                                 "v.douyin.com" not in record_url
                                 and "/user/" not in record_url
                             ):
-                                json_data = asyncio.run(
-                                    spider.get_douyin_web_stream_data(
-                                        url=record_url,
-                                        proxy_addr=proxy_address,
-                                        cookies=dy_cookie,
+                                if is_hedge_enabled(record_url):
+                                    json_data = asyncio.run(
+                                        hedge.hedged_request(
+                                            lambda: spider.get_douyin_web_stream_data(
+                                                url=record_url,
+                                                proxy_addr=proxy_address,
+                                                cookies=dy_cookie,
+                                            ),
+                                            lambda: spider.get_douyin_app_stream_data(
+                                                url=record_url,
+                                                proxy_addr=proxy_address,
+                                                cookies=dy_cookie,
+                                            ),
+                                            key=platform,
+                                            delay=hedge_delay,
+                                            is_valid=is_valid_room_data,
+                                        )
+                                    )
+                                else:
+                                    json_data = asyncio.run(
+                                        spider.get_douyin_web_stream_data(
+                                            url=record_url,
+                                            proxy_addr=proxy_address,
+                                            cookies=dy_cookie,
+                                        )
                                     )
-                                )
                             else:
                                 json_data = asyncio.run(
                                     spider.get_douyin_app_stream_data(
@@ -852,13 +1518,32 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                     elif record_url.find("https://live.kuaishou.com/") > -1:
                         platform = "快手直播"
                         with semaphore:
-                            json_data = asyncio.run(
-                                spider.get_kuaishou_stream_data(
-                                    url=record_url,
-                                    proxy_addr=proxy_address,
-                                    cookies=ks_cookie,
+                            if is_hedge_enabled(record_url) and "/u/" in record_url:
+                                json_data = asyncio.run(
+                                    hedge.hedged_request(
+                                        lambda: spider.get_kuaishou_stream_data(
+                                            url=record_url,
+                                            proxy_addr=proxy_address,
+                                            cookies=ks_cookie,
+                                        ),
+                                        lambda: spider.get_kuaishou_stream_data2(
+                                            url=record_url,
+                                            proxy_addr=proxy_address,
+                                            cookies=ks_cookie,
+                                        ),
+                                        key=platform,
+                                        delay=hedge_delay,
+                                        is_valid=is_valid_room_data,
+                                    )
+                                )
+                            else:
+                                json_data = asyncio.run(
+                                    spider.get_kuaishou_stream_data(
+                                        url=record_url,
+                                        proxy_addr=proxy_address,
+                                        cookies=ks_cookie,
+                                    )
                                 )
-                            )
                             port_info = asyncio.run(
                                 stream.get_kuaishou_stream_url(
                                     json_data, record_quality
@@ -868,7 +1553,45 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                     elif record_url.find("https://www.huya.com/") > -1:
                         platform = "虎牙直播"
                         with semaphore:
-                            if record_quality not in ["OD", "BD", "UHD"]:
+                            if is_hedge_enabled(record_url):
+
+                                async def get_huya_web_port_info():
+                                    huya_json_data = await spider.get_huya_stream_data(
+                                        url=record_url,
+                                        proxy_addr=proxy_address,
+                                        cookies=hy_cookie,
+                                    )
+                                    return await stream.get_huya_stream_url(
+                                        huya_json_data, record_quality
+                                    )
+
+                                def get_huya_app_port_info():
+                                    return spider.get_huya_app_stream_url(
+                                        url=record_url,
+                                        proxy_addr=proxy_address,
+                                        cookies=hy_cookie,
+                                    )
+
+                                if record_quality not in ["OD", "BD", "UHD"]:
+                                    primary, alternate = (
+                                        get_huya_web_port_info,
+                                        get_huya_app_port_info,
+                                    )
+                                else:
+                                    primary, alternate = (
+                                        get_huya_app_port_info,
+                                        get_huya_web_port_info,
+                                    )
+                                port_info = asyncio.run(
+                                    hedge.hedged_request(
+                                        primary,
+                                        alternate,
+                                        key=f"{platform}_{primary.__name__}",
+                                        delay=hedge_delay,
+                                        is_valid=is_valid_port_info,
+                                    )
+                                )
+                            elif record_quality not in ["OD", "BD", "UHD"]:
                                 json_data = asyncio.run(
                                     spider.get_huya_stream_data(
                                         url=record_url,
@@ -1725,9 +2448,24 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                 time.sleep(push_check_seconds)
                                 continue
 
+                            admitted, refuse_reason = storage_manager.admit(
+                                record_url, platform, anchor_name
+                            )
+                            if not admitted:
+                                color_obj.print_colored(
+                                    f"[{anchor_name}]存储空间或配额不足({refuse_reason}),暂不录制",
+                                    color_obj.YELLOW,
+                                )
+                                time.sleep(delay_default)
+                                continue
+
                             real_url = select_source_url(record_url, port_info)
                             full_path = f"{default_path}/{platform}"
                             if real_url:
+                                if reuse_stream_url and not cached_stream:
+                                    stream_url_cache.put(
+                                        record_url, record_quality, platform, port_info
+                                    )
                                 now = datetime.datetime.today().strftime(
                                     "%Y-%m-%d_%H-%M-%S"
                                 )
@@ -1809,19 +2547,15 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                     "www.faceit.com",
                                 ]
 
-                                rw_timeout = "15000000"
-                                analyzeduration = "20000000"
-                                probesize = "10000000"
-                                bufsize = "8000k"
-                                max_muxing_queue_size = "1024"
-                                for pt_host in overseas_platform_host:
-                                    if pt_host in record_url:
-                                        rw_timeout = "50000000"
-                                        analyzeduration = "40000000"
-                                        probesize = "20000000"
-                                        bufsize = "15000k"
-                                        max_muxing_queue_size = "2048"
-                                        break
+                                candidate_urls = get_candidate_urls(
+                                    record_url, record_quality, real_url, port_info
+                                )
+                                profile = get_ffmpeg_profile(
+                                    record_url,
+                                    platform,
+                                    any(h in record_url for h in overseas_platform_host),
+                                )
+                                logger.debug(f"{record_name} 使用录制资源配置: {profile.name}")
 
                                 ffmpeg_command = [
                                     "ffmpeg",
@@ -1829,7 +2563,7 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                     "-v",
                                     "verbose",
                                     "-rw_timeout",
-                                    rw_timeout,
+                                    str(profile.rw_timeout),
                                     "-loglevel",
                                     "error",
                                     "-hide_banner",
@@ -1838,18 +2572,18 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                     "-protocol_whitelist",
                                     "rtmp,crypto,file,http,https,tcp,tls,udp,rtp,httpproxy",
                                     "-thread_queue_size",
-                                    "1024",
+                                    str(profile.thread_queue_size),
                                     "-analyzeduration",
-                                    analyzeduration,
+                                    str(profile.analyzeduration),
                                     "-probesize",
-                                    probesize,
+                                    str(profile.probesize),
                                     "-fflags",
                                     "+discardcorrupt",
                                     "-re",
                                     "-i",
                                     real_url,
                                     "-bufsize",
-                                    bufsize,
+                                    profile.bufsize,
                                     "-sn",
                                     "-dn",
                                     "-reconnect_delay_max",
@@ -1857,7 +2591,7 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                     "-reconnect_streamed",
                                     "-reconnect_at_eof",
                                     "-max_muxing_queue_size",
-                                    max_muxing_queue_size,
+                                    str(profile.max_muxing_queue_size),
                                     "-correct_ts_overflow",
                                     "1",
                                     "-avoid_negative_ts",
@@ -1874,6 +2608,7 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                     ffmpeg_command.insert(2, proxy_address)
 
                                 recording.add(record_name)
+                                record_platforms[record_url] = platform
                                 start_record_time = datetime.datetime.now()
                                 recording_time_list[record_name] = [
                                     start_record_time,
@@ -1917,15 +2652,24 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                 if is_flv_preferred_platform(
                                     record_url
                                 ) and port_info.get("flv_url"):
-                                    codec = utils.get_query_params(
+                                    codec = patterns.get_query_param(
                                         port_info["flv_url"], "codec"
                                     )
-                                    if codec and codec[0] == "h265":
+                                    if codec == "h265":
                                         logger.warning(
                                             "FLV is not supported for h265 codec, use TS format instead"
                                         )
                                         record_save_type = "TS"
 
+                                if (
+                                    live_fmp4
+                                    and converts_to_mp4
+                                    and not converts_to_h264
+                                    and record_save_type == "TS"
+                                ):
+                                    # 直接写入分片MP4, 录制结束后无需再转码一遍
+                                    record_save_type = "MP4"
+
                                 if only_audio_record or any(
                                     i in record_save_type for i in ["MP3", "M4A"]
                                 ):
@@ -2022,6 +2766,7 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                             ffmpeg_command,
                                             record_save_type,
                                             custom_script,
+                                            candidate_urls,
                                         )
                                         if comment_end:
                                             return
@@ -2058,6 +2803,9 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                         create_var[subs_thread_name].daemon = True
                                         create_var[subs_thread_name].start()
 
+                                    if split_video_by_time:
+                                        save_file_path = f"{full_path}/{anchor_name}_{title_in_name}{now}_%03d.flv"
+
                                     try:
                                         flv_url = port_info.get("flv_url")
                                         if flv_url:
@@ -2074,9 +2822,14 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                                 record_name,
                                                 record_url,
                                                 platform,
+                                                proxy_address,
+                                                float(split_time)
+                                                if split_video_by_time
+                                                else None,
                                             )
 
                                             if download_success:
+                                                stream_url_cache.invalidate(record_url)
                                                 record_finished = True
                                                 print(
                                                     f"\n{anchor_name} {time.strftime('%Y-%m-%d %H:%M:%S')} 直播录制完成\n"
@@ -2086,6 +2839,7 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                         else:
                                             logger.debug("未找到FLV直播流，跳过录制")
                                     except Exception as e:
+                                        stream_url_cache.invalidate(record_url)
                                         clear_record_info(record_name, record_url)
                                         color_obj.print_colored(
                                             f"\n{anchor_name} {time.strftime('%Y-%m-%d %H:%M:%S')} 直播录制出错,请检查网络\n",
@@ -2145,15 +2899,32 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                                 "flv",
                                                 "{path}".format(path=save_file_path),
                                             ]
-                                        ffmpeg_command.extend(command)
-
-                                        comment_end = check_subprocess(
-                                            record_name,
-                                            record_url,
-                                            ffmpeg_command,
-                                            record_save_type,
-                                            custom_script,
-                                        )
+                                        if (
+                                            native_flv_record
+                                            and not extra_outputs
+                                            and port_info.get("flv_url")
+                                        ):
+                                            comment_end = check_native_flv(
+                                                record_name,
+                                                record_url,
+                                                port_info["flv_url"],
+                                                save_file_path,
+                                                record_save_type,
+                                                platform,
+                                                user_agent,
+                                                proxy_address,
+                                                custom_script,
+                                            )
+                                        else:
+                                            ffmpeg_command.extend(command)
+                                            comment_end = check_subprocess(
+                                                record_name,
+                                                record_url,
+                                                ffmpeg_command,
+                                                record_save_type,
+                                                custom_script,
+                                                candidate_urls,
+                                            )
                                         if comment_end:
                                             return
 
@@ -2169,31 +2940,25 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                         if converts_to_mp4:
                                             seg_file_path = f"{full_path}/{anchor_name}_{title_in_name}{now}_%03d.mp4"
                                             if split_video_by_time:
-                                                segment_video(
+                                                submit_postprocess(
+                                                    segment_video,
                                                     save_file_path,
                                                     seg_file_path,
-                                                    segment_format="mp4",
-                                                    segment_time=split_time,
-                                                    is_original_delete=delete_origin_file,
+                                                    "mp4",
+                                                    split_time,
+                                                    delete_origin_file,
                                                 )
-                                            else:
-                                                threading.Thread(
-                                                    target=converts_mp4,
-                                                    args=(
-                                                        save_file_path,
-                                                        delete_origin_file,
-                                                    ),
-                                                ).start()
 
                                         else:
                                             seg_file_path = f"{full_path}/{anchor_name}_{title_in_name}{now}_%03d.flv"
                                             if split_video_by_time:
-                                                segment_video(
+                                                submit_postprocess(
+                                                    segment_video,
                                                     save_file_path,
                                                     seg_file_path,
-                                                    segment_format="flv",
-                                                    segment_time=split_time,
-                                                    is_original_delete=delete_origin_file,
+                                                    "flv",
+                                                    split_time,
+                                                    delete_origin_file,
                                                 )
                                     except Exception as e:
                                         logger.error(f"转码失败: {e} ")
@@ -2253,6 +3018,7 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                             ffmpeg_command,
                                             record_save_type,
                                             custom_script,
+                                            candidate_urls,
                                         )
                                         if comment_end:
                                             return
@@ -2310,6 +3076,11 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                                 "mp4",
                                                 save_file_path,
                                             ]
+                                            if live_fmp4:
+                                                command[-1:-1] = [
+                                                    "-movflags",
+                                                    "+frag_keyframe+empty_moov+default_base_moof",
+                                                ]
 
                                         ffmpeg_command.extend(command)
                                         comment_end = check_subprocess(
@@ -2318,6 +3089,7 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                             ffmpeg_command,
                                             record_save_type,
                                             custom_script,
+                                            candidate_urls,
                                         )
                                         if comment_end:
                                             return
@@ -2363,36 +3135,30 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                                 save_file_path,
                                             ]
 
-                                            ffmpeg_command.extend(command)
-                                            comment_end = check_subprocess(
-                                                record_name,
-                                                record_url,
-                                                ffmpeg_command,
-                                                record_save_type,
-                                                custom_script,
-                                            )
+                                            comment_end = None
+                                            if use_native_hls(real_url):
+                                                comment_end = check_native_hls(
+                                                    record_name,
+                                                    record_url,
+                                                    real_url,
+                                                    save_file_path,
+                                                    record_save_type,
+                                                    platform,
+                                                    user_agent,
+                                                    proxy_address,
+                                                    custom_script,
+                                                )
+                                            if comment_end is None:
+                                                ffmpeg_command.extend(command)
+                                                comment_end = check_subprocess(
+                                                    record_name,
+                                                    record_url,
+                                                    ffmpeg_command,
+                                                    record_save_type,
+                                                    custom_script,
+                                                    candidate_urls,
+                                                )
                                             if comment_end:
-                                                if converts_to_mp4:
-                                                    file_paths = utils.get_file_paths(
-                                                        os.path.dirname(save_file_path)
-                                                    )
-                                                    prefix = os.path.basename(
-                                                        save_file_path
-                                                    ).rsplit("_", maxsplit=1)[0]
-                                                    for path in file_paths:
-                                                        if prefix in path:
-                                                            try:
-                                                                threading.Thread(
-                                                                    target=converts_mp4,
-                                                                    args=(
-                                                                        path,
-                                                                        delete_origin_file,
-                                                                    ),
-                                                                ).start()
-                                                            except subprocess.CalledProcessError as e:
-                                                                logger.error(
-                                                                    f"转码失败: {e} "
-                                                                )
                                                 return
 
                                         except subprocess.CalledProcessError as e:
@@ -2426,22 +3192,30 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                                 save_file_path,
                                             ]
 
-                                            ffmpeg_command.extend(command)
-                                            comment_end = check_subprocess(
-                                                record_name,
-                                                record_url,
-                                                ffmpeg_command,
-                                                record_save_type,
-                                                custom_script,
-                                            )
+                                            comment_end = None
+                                            if use_native_hls(real_url):
+                                                comment_end = check_native_hls(
+                                                    record_name,
+                                                    record_url,
+                                                    real_url,
+                                                    save_file_path,
+                                                    record_save_type,
+                                                    platform,
+                                                    user_agent,
+                                                    proxy_address,
+                                                    custom_script,
+                                                )
+                                            if comment_end is None:
+                                                ffmpeg_command.extend(command)
+                                                comment_end = check_subprocess(
+                                                    record_name,
+                                                    record_url,
+                                                    ffmpeg_command,
+                                                    record_save_type,
+                                                    custom_script,
+                                                    candidate_urls,
+                                                )
                                             if comment_end:
-                                                threading.Thread(
-                                                    target=converts_mp4,
-                                                    args=(
-                                                        save_file_path,
-                                                        delete_origin_file,
-                                                    ),
-                                                ).start()
                                                 return
 
                                         except subprocess.CalledProcessError as e:
@@ -2455,6 +3229,7 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                 count_time = time.time()
 
                 except Exception as e:
+                    stream_url_cache.invalidate(record_url)
                     logger.error(
                         f"错误信息: {e} 发生错误的行数: {e.__traceback__.tb_lineno}"
                     )
@@ -2484,6 +3259,10 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                 else:
                     x = num
 
+                # 录制中断但直播流地址仍在有效期内时,快速重连以减少漏录
+                if reuse_stream_url and (record_url, record_quality) in stream_url_cache:
+                    x = min(x, stream_reconnect_delay)
+
                 # 这里是正常循环
                 while x:
                     x = x - 1
@@ -2728,6 +3507,112 @@ custom_script = (
     if is_run_script
     else None
 )
+reuse_stream_url = options.get(
+    read_config_value(config, "录制设置", "复用未过期的直播流地址快速重连(是/否)", "是"),
+    False,
+)
+stall_timeout = int(
+    read_config_value(config, "录制设置", "录制卡顿自动切换线路时间(秒)(0为关闭)", 15)
+)
+native_hls_record = options.get(
+    read_config_value(config, "录制设置", "使用内置HLS录制器录制TS(是/否)", "否"), False
+)
+native_flv_record = options.get(
+    read_config_value(config, "录制设置", "使用内置FLV录制器录制FLV(是/否)", "否"), False
+)
+extra_outputs = parse_extra_outputs(
+    read_config_value(config, "录制设置", "同一拉流额外输出(mp3/m4a/preview,逗号分隔)", "")
+)
+native_hls_concurrency = int(
+    read_config_value(config, "录制设置", "内置HLS录制器并发下载数", 4)
+)
+hedge_platform = read_config_value(
+    config, "录制设置", "启用对冲请求的平台(逗号分隔)", ""
+)
+hedge_platform_list = (
+    hedge_platform.replace("，", ",").split(",") if hedge_platform else []
+)
+hedge_delay = float(read_config_value(config, "录制设置", "对冲请求延迟(秒)", 3))
+loop_lag_monitor = options.get(
+    read_config_value(config, "录制设置", "调试模式检测事件循环阻塞(是/否)", "否"), False
+)
+metrics_port = int(read_config_value(config, "录制设置", "指标监听端口(0为关闭)", 0))
+ffmpeg_profile_name = read_config_value(
+    config, "录制设置", "录制资源配置(auto/balanced/low-memory/resilient)", "auto"
+).strip().lower()
+ffmpeg_profile_rules = ffmpeg_profiles.parse_profile_rules(
+    read_config_value(config, "录制设置", "按平台或直播间指定资源配置(逗号分隔)", "")
+)
+ffmpeg_profile_scale_start = int(
+    read_config_value(config, "录制设置", "自动资源配置开始缩减的同时录制数", 20)
+)
+postprocess_workers = int(
+    read_config_value(config, "录制设置", "后处理并发数(0为自动)", 0)
+)
+if postprocess_workers > 0:
+    postprocess_pool.workers = postprocess_workers
+live_fmp4 = options.get(
+    read_config_value(config, "录制设置", "录制时直接写入分片MP4(是/否)", "否"), False
+)
+record_hash_algorithm = (
+    read_config_value(config, "录制设置", "录制文件完整性哈希算法(留空为关闭)", "sha256")
+    .strip()
+    .lower()
+)
+if record_hash_algorithm and record_hash_algorithm not in hashlib.algorithms_available:
+    logger.warning(f"不支持的哈希算法 {record_hash_algorithm}, 改用 sha256")
+    record_hash_algorithm = "sha256"
+record_hash_full_pass = options.get(
+    read_config_value(config, "录制设置", "无法边录边哈希的文件完成后重读计算哈希(是/否)", "否"),
+    False,
+)
+chunked_h264 = (
+    options.get(
+        read_config_value(config, "录制设置", "h264转码分块并行(是/否)", "否"), False
+    )
+    and chunked_transcode.is_available()
+)
+mp4_faststart = options.get(
+    read_config_value(config, "录制设置", "MP4录制完成后移动moov到文件头(是/否)", "否"),
+    False,
+)
+job_db_path = os.path.join(config_dir, "jobs.db")
+catalog_db_path = os.path.join(config_dir, "catalog.db")
+record_catalog = catalog.Catalog(catalog_db_path)
+job_queue = (
+    job_store.JobQueue(job_store.JobStore(job_db_path), postprocess_pool)
+    if options.get(
+        read_config_value(config, "录制设置", "后处理任务持久化(是/否)", "是"), False
+    )
+    else None
+)
+if job_queue:
+    for job_func in (converts_mp4, segment_video, run_script, mp4.faststart):
+        job_queue.register(job_func.__name__, job_func)
+record_session_gap = int(
+    read_config_value(config, "录制设置", "断流重连合并为同一场次的间隔(秒)(0为关闭)", 180)
+)
+record_sessions = (
+    SessionManager(
+        finish_record_session,
+        record_session_gap,
+        lambda session: session.record_name in recording,
+    )
+    if record_session_gap > 0
+    else None
+)
+stream_hub_port = int(
+    read_config_value(config, "录制设置", "内置录制器本地转发端口(0为关闭)", 0)
+)
+loop_lag_threshold = float(
+    read_config_value(config, "录制设置", "事件循环阻塞告警阈值(毫秒)", 200)
+)
+if loop_lag_monitor:
+    install_loop_monitor(loop_lag_threshold)
+if metrics_port:
+    start_metrics_server(metrics_port)
+if stream_hub_port:
+    start_stream_hub_server(stream_hub_port)
 enable_proxy_platform = read_config_value(
     config,
     "录制设置",
@@ -2874,8 +3759,55 @@ else:
     video_save_type = "TS"
 
 check_path = video_save_path or default_path
+storage_manager = storage.StorageManager(
+    check_path,
+    disk_space_limit,
+    float(read_config_value(config, "录制设置", "低优先级录制暂停空间阈值(gb)", 5.0)),
+    platform_quotas=storage.parse_quotas(
+        read_config_value(config, "录制设置", "平台存储配额(逗号分隔)", "")
+    ),
+    anchor_quotas=storage.parse_quotas(
+        read_config_value(config, "录制设置", "主播存储配额(逗号分隔)", "")
+    ),
+    retention=storage.RetentionPolicy(
+        max_age_days=float(
+            read_config_value(config, "录制设置", "录制保留天数(0为不限)", 0)
+        ),
+        max_count=int(
+            read_config_value(config, "录制设置", "录制保留最大场次数(0为不限)", 0)
+        ),
+        max_total_gb=float(
+            read_config_value(config, "录制设置", "录制保留最大总容量(gb)(0为不限)", 0)
+        ),
+    ),
+    low_priority=storage.parse_names(
+        read_config_value(config, "录制设置", "低优先级录制(平台或主播或直播间,逗号分隔)", "")
+    ),
+    anchor_dirs=folder_by_author,
+    on_pause=pause_storage_recordings,
+    catalog=record_catalog,
+)
+storage_move_pool = PostProcessPool(workers=1, name="storage_move")
+archive_mover = StorageMover(
+    check_path,
+    storage.parse_names(
+        read_config_value(config, "录制设置", "归档目录(按优先顺序,逗号分隔)", "")
+    ),
+    float(read_config_value(config, "录制设置", "录制完成多少小时后归档", 24)) * 3600,
+    float(read_config_value(config, "录制设置", "归档带宽上限(MB/s)(0为不限)", 50)),
+    anchor_dirs=folder_by_author,
+    submit=submit_storage_move,
+    catalog=record_catalog,
+)
+if job_queue:
+    job_queue.register(
+        archive_mover.move_group.__name__,
+        archive_mover.move_group,
+        pool=storage_move_pool,
+    )
 if utils.check_disk_capacity(check_path, show=first_run) < disk_space_limit:
     exit_recording = True
+    ffmpeg_supervisor.stop_all()
     if not recording:
         logger.warning(
             f"Disk space remaining is below {disk_space_limit} GB. "
@@ -2885,14 +3817,22 @@ if utils.check_disk_capacity(check_path, show=first_run) < disk_space_limit:
 
 
 def contains_url(string: str) -> bool:
-    pattern = r"(https?://)?(www\.)?[a-zA-Z0-9-]+(\.[a-zA-Z0-9-]+)+(:\d+)?(/.*)?"
-    return re.search(pattern, string) is not None
+    return patterns.URL_PATTERN.search(string) is not None
 
 
 # 解析命令行参数和主循环（只在直接运行时执行）
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "jobs":
+        sys.exit(job_store.main(sys.argv[2:], job_db_path))
+    if len(sys.argv) > 1 and sys.argv[1] == "catalog":
+        sys.exit(catalog.main(sys.argv[2:], catalog_db_path))
+
     # 只在直接运行时才执行初始化
     initialize_main_program()
+    storage_manager.start()
+    archive_mover.start()
+    if job_queue:
+        job_queue.resume()
 
     parser = argparse.ArgumentParser(description="直播录制工具")
     parser.add_argument(
@@ -2958,8 +3898,8 @@ if __name__ == "__main__":
                     if is_comment_line:
                         line = line.lstrip("#")
 
-                    if re.search("[,，]", line):
-                        split_line = re.split("[,，]", line)
+                    if patterns.COMMA_PATTERN.search(line):
+                        split_line = patterns.COMMA_PATTERN.split(line)
                     else:
                         split_line = [line, ""]
 
@@ -3094,7 +4034,7 @@ if __name__ == "__main__":
                             )
 
                         if "xiaohongshu" in url:
-                            host_id = re.search("&host_id=(.*?)(?=&|$)", url)
+                            host_id = patterns.XHS_HOST_ID_PATTERN.search(url)
                             if host_id:
                                 new_url = (
                                     url.split("?")[0] + f"?host_id={host_id.group(1)}"
@@ -3106,6 +4046,7 @@ if __name__ == "__main__":
                         url_comments = [i for i in url_comments if url not in i]
                         if is_comment_line:
                             url_comments.append(url)
+                            ffmpeg_supervisor.stop(url)
                         else:
                             new_line = (quality, url, name)
                             url_tuples_list.append(new_line)
@@ -0,0 +1,250 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Keep a SQLite index of every recording file and session, written by the recorder when it opens and
+closes files, so recordings are found by anchor, platform, time range or state with an indexed query instead
+of walking the save directory.
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from .logger import logger
+
+FILE_RECORDING = 'recording'
+FILE_CLOSED = 'closed'
+FILE_ARCHIVED = 'archived'
+FILE_DELETED = 'deleted'
+FILE_STATES = (FILE_RECORDING, FILE_CLOSED, FILE_ARCHIVED, FILE_DELETED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    manifest TEXT NOT NULL UNIQUE,
+    room TEXT,
+    record_name TEXT,
+    platform TEXT,
+    anchor TEXT,
+    save_type TEXT,
+    output TEXT,
+    started_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    ext TEXT NOT NULL,
+    state TEXT NOT NULL,
+    room TEXT,
+    platform TEXT,
+    anchor TEXT,
+    session_id INTEGER,
+    size INTEGER NOT NULL DEFAULT 0,
+    hash TEXT,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_anchor ON files (anchor, started_at);
+CREATE INDEX IF NOT EXISTS files_platform ON files (platform, started_at);
+CREATE INDEX IF NOT EXISTS files_state ON files (state, started_at);
+CREATE INDEX IF NOT EXISTS files_ext ON files (ext, started_at);
+CREATE INDEX IF NOT EXISTS files_session ON files (session_id);
+"""
+
+
+def _size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class Catalog:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def open_file(self, path: str, room: str | None = None, platform: str | None = None,
+                  anchor: str | None = None, started_at: float | None = None) -> None:
+        """Record a file the recorder has started writing; reopening a path starts it over."""
+        path = os.path.abspath(path)
+        now = time.time()
+        self._execute(
+            'INSERT OR REPLACE INTO files (path, ext, state, room, platform, anchor, started_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (path, os.path.splitext(path)[1].lower(), FILE_RECORDING, room, platform, anchor, started_at or now, now))
+
+    def close_file(self, path: str, digest: str | None = None, room: str | None = None,
+                   platform: str | None = None, anchor: str | None = None, started_at: float | None = None) -> None:
+        """Record a finished file with its final size, adding it if it was never seen opening (ffmpeg segments)."""
+        path = os.path.abspath(path)
+        now = time.time()
+        self._execute(
+            'INSERT INTO files (path, ext, state, room, platform, anchor, size, hash, started_at, finished_at, '
+            'updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(path) DO UPDATE SET '
+            'state = excluded.state, size = excluded.size, hash = excluded.hash, '
+            'room = COALESCE(excluded.room, room), platform = COALESCE(excluded.platform, platform), '
+            'anchor = COALESCE(excluded.anchor, anchor), finished_at = excluded.finished_at, '
+            'updated_at = excluded.updated_at',
+            (path, os.path.splitext(path)[1].lower(), FILE_CLOSED, room, platform, anchor, _size(path), digest,
+             started_at or now, now, now))
+
+    def derive_file(self, source: str, path: str) -> None:
+        """Record a file converted from source, inheriting the room, anchor and session it belongs to."""
+        source, path = os.path.abspath(source), os.path.abspath(path)
+        now = time.time()
+        cursor = self._execute(
+            'INSERT OR REPLACE INTO files (path, ext, state, room, platform, anchor, session_id, size, started_at, '
+            'finished_at, updated_at) SELECT ?, ?, ?, room, platform, anchor, session_id, ?, started_at, ?, ? '
+            'FROM files WHERE path = ?',
+            (path, os.path.splitext(path)[1].lower(), FILE_CLOSED, _size(path), now, now, source))
+        if not cursor.rowcount:
+            self.close_file(path)
+
+    def remove_file(self, path: str) -> None:
+        self._execute('UPDATE files SET state = ?, updated_at = ? WHERE path = ?',
+                      (FILE_DELETED, time.time(), os.path.abspath(path)))
+
+    def move_file(self, source: str, destination: str) -> None:
+        source, destination = os.path.abspath(source), os.path.abspath(destination)
+        self._execute('UPDATE OR REPLACE files SET path = ?, state = ?, updated_at = ? WHERE path = ?',
+                      (destination, FILE_ARCHIVED, time.time(), source))
+        self._execute('UPDATE sessions SET manifest = ? WHERE manifest = ?', (destination, source))
+        self._execute('UPDATE sessions SET output = ? WHERE output = ?', (destination, source))
+
+    def add_session(self, manifest: str, paths: list[str], room: str | None = None, record_name: str | None = None,
+                    platform: str | None = None, anchor: str | None = None, save_type: str | None = None,
+                    output: str | None = None, started_at: float | None = None) -> int:
+        """Record a closed session and link the files it is made of."""
+        manifest = os.path.abspath(manifest)
+        now = time.time()
+        self._execute(
+            'INSERT INTO sessions (manifest, room, record_name, platform, anchor, save_type, output, started_at, '
+            'finished_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(manifest) DO UPDATE SET '
+            'output = excluded.output, finished_at = excluded.finished_at',
+            (manifest, room, record_name, platform, anchor, save_type, output and os.path.abspath(output),
+             started_at or now, now))
+        session_id = self._execute('SELECT id FROM sessions WHERE manifest = ?', (manifest,)).fetchone()[0]
+        self.close_file(manifest, room=room, platform=platform, anchor=anchor, started_at=started_at)
+        for path in [*paths, manifest]:
+            self._execute('UPDATE files SET session_id = ? WHERE path = ?', (session_id, os.path.abspath(path)))
+        return session_id
+
+    def query(self, anchor: str | None = None, platform: str | None = None, room: str | None = None,
+              state: str | tuple[str, ...] | None = None, ext: str | None = None, since: float | None = None,
+              until: float | None = None, under: str | None = None, limit: int | None = None,
+              newest_first: bool = False) -> list[dict]:
+        """Files matching every given filter, by start time. under restricts to one directory tree."""
+        clauses, params = [], []
+        for column, value in (('anchor', anchor), ('platform', platform), ('room', room), ('ext', ext)):
+            if value is not None:
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        if state is not None:
+            states = (state,) if isinstance(state, str) else tuple(state)
+            clauses.append(f"state IN ({','.join('?' * len(states))})")
+            params += states
+        if since is not None:
+            clauses.append('started_at >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('started_at < ?')
+            params.append(until)
+        if under is not None:
+            # a range on the primary key instead of LIKE, so the lookup stays on the index
+            prefix = os.path.join(os.path.abspath(under), '')
+            clauses.append('path >= ? AND path < ?')
+            params += [prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)]
+        sql = 'SELECT * FROM files'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += f" ORDER BY started_at {'DESC' if newest_first else 'ASC'}"
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return [dict(row) for row in self._execute(sql, tuple(params)).fetchall()]
+
+    def latest(self, ext: str, since: float | None = None, under: str | None = None) -> str | None:
+        """Path of the newest recording or finished file with ext, e.g. the audio file a live monitor follows."""
+        rows = self.query(state=(FILE_RECORDING, FILE_CLOSED), ext=ext.lower(), since=since, under=under,
+                          limit=1, newest_first=True)
+        return rows[0]['path'] if rows else None
+
+    def sessions(self, anchor: str | None = None, since: float | None = None, limit: int = 100) -> list[dict]:
+        clauses, params = [], []
+        if anchor is not None:
+            clauses.append('anchor = ?')
+            params.append(anchor)
+        if since is not None:
+            clauses.append('started_at >= ?')
+            params.append(since)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = self._execute(f'SELECT * FROM sessions{where} ORDER BY started_at DESC LIMIT ?', (*params, limit))
+        return [dict(row) for row in rows.fetchall()]
+
+    def is_empty(self, under: str) -> bool:
+        return not self.query(under=under, limit=1)
+
+    def import_tree(self, root: str, suffixes: tuple[str, ...]) -> int:
+        """One walk to index recordings made before the catalog existed; later lookups use the index."""
+        imported = 0
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                if not filename.lower().endswith(suffixes):
+                    continue
+                path = os.path.abspath(os.path.join(directory, filename))
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                cursor = self._execute(
+                    'INSERT OR IGNORE INTO files (path, ext, state, size, started_at, finished_at, updated_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (path, os.path.splitext(path)[1].lower(), FILE_CLOSED, stat.st_size, stat.st_mtime,
+                     stat.st_mtime, time.time()))
+                imported += cursor.rowcount
+        if imported:
+            logger.info(f"Catalog indexed {imported} existing recordings under {root}")
+        return imported
+
+
+def _parse_time(value: str) -> float:
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return time.mktime(time.strptime(value, fmt))
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError(f'invalid time: {value}')
+
+
+def main(argv: list[str], db_path: str) -> int:
+    parser = argparse.ArgumentParser(prog='catalog', description='录制文件索引')
+    parser.add_argument('--anchor')
+    parser.add_argument('--platform')
+    parser.add_argument('--state', choices=FILE_STATES)
+    parser.add_argument('--ext', help='扩展名, 如 .mp4')
+    parser.add_argument('--since', type=_parse_time, help='开始时间, 如 2024-01-01 或 "2024-01-01 20:00"')
+    parser.add_argument('--until', type=_parse_time)
+    parser.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args(argv)
+
+    catalog = Catalog(db_path)
+    rows = catalog.query(anchor=args.anchor, platform=args.platform, state=args.state, ext=args.ext,
+                         since=args.since, until=args.until, limit=args.limit, newest_first=True)
+    for row in rows:
+        started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(row['started_at']))
+        print(f"{started} {row['state']:<9} {row['size'] / 1024 ** 2:>10.1f}MB {row['platform'] or '-'} "
+              f"{row['anchor'] or '-'} {row['path']}")
+    if not rows:
+        print('no recordings')
+    return 0
@@ -0,0 +1,147 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Re-encode a long recording to H.264 in parallel. The video is split into GOP-aligned chunks with
+stream copy, every chunk is encoded by its own ffmpeg process, and the encoded chunks are concatenated
+with the original audio without another encode.
+"""
+
+import functools
+import json
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from .logger import logger
+from .postprocess import PRIORITY_ENCODE, run_low_priority
+
+X264_ARGS = ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23', '-vf', 'format=yuv420p']
+MIN_CHUNKED_DURATION = 300
+MIN_CHUNK_SECONDS = 30
+CHUNKS_PER_WORKER = 3
+THREADS_PER_CHUNK = 2
+# the encoded video is laid against the untouched source audio, so a shorter or longer concat drifts out of sync
+MAX_DURATION_DRIFT = 1.0
+
+
+@functools.lru_cache(maxsize=1)
+def is_available() -> bool:
+    """Splitting needs ffprobe, which packaged builds do not ship next to ffmpeg."""
+    return shutil.which('ffprobe') is not None
+
+
+def default_workers() -> int:
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+    return max(1, cores // THREADS_PER_CHUNK)
+
+
+def probe_keyframes(path: str, **popen_kwargs) -> list[float]:
+    """Return the timestamps of video keyframes, read from packet flags so nothing is decoded."""
+    output = subprocess.check_output([
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', path,
+    ], **popen_kwargs)
+    keyframes = []
+    for line in output.decode('utf-8', errors='ignore').splitlines():
+        pts_time, _, flags = line.partition(',')
+        if 'K' in flags and pts_time not in ('', 'N/A'):
+            keyframes.append(float(pts_time))
+    return sorted(keyframes)
+
+
+def probe_duration(path: str, **popen_kwargs) -> float | None:
+    """Duration of the first video stream, or of the container when the stream carries none (FLV, Matroska)."""
+    output = subprocess.check_output([
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'stream=duration:format=duration', '-of', 'json', path,
+    ], **popen_kwargs)
+    info = json.loads(output.decode('utf-8', errors='ignore') or '{}')
+    streams = info.get('streams') or [{}]
+    for duration in (streams[0].get('duration'), info.get('format', {}).get('duration')):
+        if duration not in (None, 'N/A'):
+            return float(duration)
+    return None
+
+
+def plan_chunks(keyframes: list[float], workers: int, min_chunk: float | None = None) -> list[float]:
+    """Pick keyframe timestamps to cut at, giving each worker a few chunks so uneven chunks even out."""
+    min_chunk = MIN_CHUNK_SECONDS if min_chunk is None else min_chunk
+    if len(keyframes) < 2:
+        return []
+    start, end = keyframes[0], keyframes[-1]
+    target = max(min_chunk, (end - start) / (workers * CHUNKS_PER_WORKER))
+    cuts = []
+    last = start
+    for keyframe in keyframes[1:]:
+        if keyframe - last >= target and end - keyframe >= min_chunk / 2:
+            cuts.append(keyframe)
+            last = keyframe
+    return cuts
+
+
+def _split(source: str, cuts: list[float], chunk_dir: str, **popen_kwargs) -> list[str]:
+    pattern = os.path.join(chunk_dir, 'source_%05d.mkv')
+    run_low_priority([
+        'ffmpeg', '-y', '-v', 'error', '-i', source, '-map', '0:v:0', '-c', 'copy',
+        '-f', 'segment', '-segment_format', 'matroska',
+        '-segment_times', ','.join(f'{cut:.6f}' for cut in cuts), pattern,
+    ], PRIORITY_ENCODE, stderr=subprocess.STDOUT, **popen_kwargs)
+    return sorted(os.path.join(chunk_dir, name) for name in os.listdir(chunk_dir) if name.startswith('source_'))
+
+
+def _encode(chunk: str, threads: int, **popen_kwargs) -> str:
+    output = chunk.replace('source_', 'encoded_')
+    run_low_priority([
+        'ffmpeg', '-y', '-v', 'error', '-i', chunk, *X264_ARGS, '-threads', str(threads), '-an', output,
+    ], PRIORITY_ENCODE, stderr=subprocess.STDOUT, **popen_kwargs)
+    return output
+
+
+def _concat(source: str, chunks: list[str], output: str, chunk_dir: str, **popen_kwargs) -> None:
+    list_path = os.path.join(chunk_dir, 'concat.txt')
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for chunk in chunks:
+            f.write(f"file '{os.path.basename(chunk)}'\n")
+    run_low_priority([
+        'ffmpeg', '-y', '-v', 'error', '-f', 'concat', '-safe', '0', '-i', list_path, '-i', source,
+        '-map', '0:v:0', '-map', '1:a?', '-c', 'copy', '-f', 'mp4', output,
+    ], PRIORITY_ENCODE, stderr=subprocess.STDOUT, **popen_kwargs)
+
+
+def transcode(source: str, output: str, workers: int | None = None, **popen_kwargs) -> bool:
+    """
+    Encode source to an H.264 MP4 at output using parallel chunks.
+    Returns False without touching output when the file is too short or has too few keyframes to be worth
+    splitting, and False after removing output when the joined video does not last as long as the source, so the
+    caller can fall back to a single encode. ffmpeg failures raise CalledProcessError.
+    """
+    workers = workers or default_workers()
+    keyframes = probe_keyframes(source, **popen_kwargs)
+    if not keyframes or keyframes[-1] - keyframes[0] < MIN_CHUNKED_DURATION:
+        return False
+    cuts = plan_chunks(keyframes, workers)
+    if not cuts:
+        return False
+
+    chunk_dir = os.path.splitext(output)[0] + '.chunks'
+    os.makedirs(chunk_dir, exist_ok=True)
+    try:
+        chunks = _split(source, cuts, chunk_dir, **popen_kwargs)
+        logger.info(f"Encoding {os.path.basename(source)} as {len(chunks)} chunks on {workers} workers")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            encoded = list(executor.map(lambda chunk: _encode(chunk, THREADS_PER_CHUNK, **popen_kwargs), chunks))
+        _concat(source, encoded, output, chunk_dir, **popen_kwargs)
+    except BaseException:
+        if os.path.exists(output):
+            os.remove(output)
+        raise
+    finally:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+
+    expected, actual = probe_duration(source, **popen_kwargs), probe_duration(output, **popen_kwargs)
+    if expected is not None and (actual is None or abs(actual - expected) > MAX_DURATION_DRIFT):
+        logger.warning(f"Chunked encode of {os.path.basename(source)} lasts {actual}s instead of {expected}s, "
+                       f"encoding it in one pass")
+        os.remove(output)
+        return False
+    return True
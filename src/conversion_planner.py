@@ -0,0 +1,180 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Probe a finished recording once, cache the stream info in a sidecar file, and choose the cheapest
+correct way to convert it: stream copy, bitstream filter only, or a full encode.
+"""
+
+import json
+import os
+import subprocess
+import threading
+from dataclasses import dataclass, field
+from .chunked_transcode import X264_ARGS
+from .logger import logger
+from .metrics import metrics
+
+SIDECAR_SUFFIX = '.probe.json'
+PLAN_COPY = 'copy'
+PLAN_BSF = 'bsf'
+PLAN_ENCODE = 'encode'
+PLAN_COST = {PLAN_COPY: 0, PLAN_BSF: 1, PLAN_ENCODE: 2}
+
+AAC_ARGS = ['-c:a', 'aac', '-ab', '320k']
+# audio codecs the mp4 muxer stores as they are
+MP4_AUDIO_CODECS = ('aac', 'mp3', 'ac3', 'eac3', 'opus', 'alac', 'flac')
+# containers that carry AAC as ADTS, which needs rewriting to an AudioSpecificConfig for mp4/m4a
+ADTS_CONTAINERS = ('mpegts', 'aac', 'hls')
+
+_stats_lock = threading.Lock()
+_plan_counts: dict[str, int] = {}
+_encode_seconds_avoided = 0.0
+
+
+@dataclass
+class StreamInfo:
+    format_name: str = ''
+    duration: float = 0.0
+    video_codec: str | None = None
+    pix_fmt: str | None = None
+    audio_codec: str | None = None
+
+    @property
+    def is_adts(self) -> bool:
+        return self.audio_codec == 'aac' and any(name in ADTS_CONTAINERS for name in self.format_name.split(','))
+
+
+@dataclass
+class ConversionPlan:
+    action: str
+    args: list[str]
+    reasons: list[str] = field(default_factory=list)
+    video_encode: bool = False
+
+    def add(self, action: str, args: list[str], reason: str) -> None:
+        self.args += args
+        self.reasons.append(reason)
+        if PLAN_COST[action] > PLAN_COST[self.action]:
+            self.action = action
+
+
+def get_sidecar_path(path: str) -> str:
+    return path + SIDECAR_SUFFIX
+
+
+def _run_ffprobe(path: str, **popen_kwargs) -> dict:
+    output = subprocess.check_output([
+        'ffprobe', '-v', 'error', '-of', 'json',
+        '-show_entries', 'format=format_name,duration:stream=codec_type,codec_name,pix_fmt', path,
+    ], **popen_kwargs)
+    return json.loads(output.decode('utf-8', errors='ignore') or '{}')
+
+
+def probe(path: str, **popen_kwargs) -> StreamInfo:
+    """Return stream info for path, from the sidecar when it still matches the file's size and mtime."""
+    stat = os.stat(path)
+    fingerprint = [stat.st_size, stat.st_mtime_ns]
+    sidecar = get_sidecar_path(path)
+    data = None
+    try:
+        with open(sidecar, encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('fingerprint') == fingerprint:
+            data = cached['probe']
+    except (OSError, ValueError, KeyError):
+        pass
+    if data is None:
+        data = _run_ffprobe(path, **popen_kwargs)
+        try:
+            with open(sidecar, 'w', encoding='utf-8') as f:
+                json.dump({'fingerprint': fingerprint, 'probe': data}, f)
+        except OSError as e:
+            logger.debug(f"Cannot write probe sidecar {sidecar}: {e}")
+
+    fmt = data.get('format', {})
+    info = StreamInfo(format_name=fmt.get('format_name', ''), duration=float(fmt.get('duration') or 0))
+    for stream in data.get('streams', []):
+        if stream.get('codec_type') == 'video' and info.video_codec is None:
+            info.video_codec, info.pix_fmt = stream.get('codec_name'), stream.get('pix_fmt')
+        elif stream.get('codec_type') == 'audio' and info.audio_codec is None:
+            info.audio_codec = stream.get('codec_name')
+    return info
+
+
+def try_probe(path: str, **popen_kwargs) -> StreamInfo | None:
+    """probe, or None when ffprobe is missing (packaged builds ship only ffmpeg) or cannot read the file."""
+    try:
+        return probe(path, **popen_kwargs)
+    except (OSError, subprocess.CalledProcessError, ValueError) as e:
+        logger.warning(f"Cannot probe {os.path.basename(path)}, converting with the fixed command: {e}")
+        return None
+
+
+def discard(path: str) -> None:
+    """Remove the sidecar of a recording that has been deleted or converted away."""
+    try:
+        os.remove(get_sidecar_path(path))
+    except OSError:
+        pass
+
+
+def _audio_args(info: StreamInfo, plan: ConversionPlan, copyable: tuple[str, ...]) -> None:
+    if info.audio_codec is None:
+        return
+    if info.audio_codec not in copyable:
+        plan.add(PLAN_ENCODE, AAC_ARGS, f'audio {info.audio_codec}->aac')
+    elif info.is_adts:
+        plan.add(PLAN_BSF, ['-c:a', 'copy', '-bsf:a', 'aac_adtstoasc'], 'audio aac adts->asc')
+    else:
+        plan.add(PLAN_COPY, ['-c:a', 'copy'], f'audio {info.audio_codec} copy')
+
+
+def plan_mp4(info: StreamInfo, h264: bool = False) -> ConversionPlan:
+    """Plan a conversion to mp4. With h264, video that is already H.264 in yuv420p is copied instead of re-encoded."""
+    plan = ConversionPlan(PLAN_COPY, [])
+    if info.video_codec is not None:
+        if h264 and not (info.video_codec == 'h264' and info.pix_fmt == 'yuv420p'):
+            plan.add(PLAN_ENCODE, X264_ARGS, f'video {info.video_codec}/{info.pix_fmt}->h264')
+            plan.video_encode = True
+        else:
+            plan.add(PLAN_COPY, ['-c:v', 'copy'], f'video {info.video_codec} copy')
+    _audio_args(info, plan, MP4_AUDIO_CODECS)
+    return plan
+
+
+def fallback_mp4(h264: bool = False) -> ConversionPlan:
+    """The fixed remux, or encode with h264, used when the source could not be probed."""
+    if h264:
+        return ConversionPlan(PLAN_ENCODE, [*X264_ARGS, '-c:a', 'copy'], ['unprobed, encode h264'], video_encode=True)
+    return ConversionPlan(PLAN_COPY, ['-c:v', 'copy', '-c:a', 'copy'], ['unprobed, copy'])
+
+
+def fallback_m4a() -> ConversionPlan:
+    """The fixed AAC encode used when the source could not be probed."""
+    return ConversionPlan(PLAN_ENCODE, ['-vn', '-c:a', 'aac', '-bsf:a', 'aac_adtstoasc', '-ab', '320k'],
+                          ['unprobed, encode aac'])
+
+
+def plan_m4a(info: StreamInfo) -> ConversionPlan:
+    """Plan an audio-only conversion to m4a, keeping AAC audio as it is."""
+    plan = ConversionPlan(PLAN_COPY, ['-vn'])
+    _audio_args(info, plan, ('aac',))
+    return plan
+
+
+def record_plan(path: str, plan: ConversionPlan, info: StreamInfo, encode_requested: bool) -> None:
+    """Log the decision, and count the media time that no longer needs an encode because the source was compatible."""
+    global _encode_seconds_avoided
+    with _stats_lock:
+        _plan_counts[plan.action] = _plan_counts.get(plan.action, 0) + 1
+        if encode_requested and plan.action != PLAN_ENCODE:
+            _encode_seconds_avoided += info.duration
+        for action, count in _plan_counts.items():
+            metrics.set('conversion_plans_total', count, {'action': action},
+                        help_text='Conversions by chosen operation')
+        metrics.set('conversion_encode_seconds_avoided_total', _encode_seconds_avoided,
+                    help_text='Media seconds stream-copied where an encode was configured')
+    saved = f", skipped encoding {info.duration:.0f}s of media" if encode_requested and plan.action != PLAN_ENCODE \
+        else ''
+    logger.info(f"Conversion plan for {os.path.basename(path)}: {plan.action} ({', '.join(plan.reasons) or 'no streams'})"
+                f"{saved}")
@@ -0,0 +1,71 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Named ffmpeg buffer/probe profiles for recordings, with an auto mode that shrinks them as
+the number of concurrent recordings grows.
+"""
+
+from dataclasses import dataclass, replace
+
+AUTO_PROFILE = 'auto'
+AUTO_SCALE_START = 20
+
+
+@dataclass(frozen=True)
+class FfmpegProfile:
+    name: str
+    rw_timeout: int
+    analyzeduration: int
+    probesize: int
+    bufsize_kb: int
+    thread_queue_size: int
+    max_muxing_queue_size: int
+
+    @property
+    def bufsize(self) -> str:
+        return f'{self.bufsize_kb}k'
+
+
+PROFILES = {
+    'low-memory': FfmpegProfile('low-memory', 15_000_000, 3_000_000, 2_000_000, 2000, 128, 256),
+    'balanced': FfmpegProfile('balanced', 15_000_000, 20_000_000, 10_000_000, 8000, 1024, 1024),
+    'resilient': FfmpegProfile('resilient', 50_000_000, 40_000_000, 20_000_000, 15000, 1024, 2048),
+}
+
+
+def scale_profile(profile: FfmpegProfile, running: int, scale_start: int = AUTO_SCALE_START) -> FfmpegProfile:
+    """Shrink buffers and probe sizes in proportion to load, never below the low-memory profile."""
+    if running <= scale_start:
+        return replace(profile, name=f'{AUTO_PROFILE}/{profile.name}')
+    factor = scale_start / running
+    floor = PROFILES['low-memory']
+    return FfmpegProfile(
+        name=f'{AUTO_PROFILE}/{profile.name}@{factor:.2f}',
+        rw_timeout=profile.rw_timeout,
+        analyzeduration=max(floor.analyzeduration, int(profile.analyzeduration * factor)),
+        probesize=max(floor.probesize, int(profile.probesize * factor)),
+        bufsize_kb=max(floor.bufsize_kb, int(profile.bufsize_kb * factor)),
+        thread_queue_size=max(floor.thread_queue_size, int(profile.thread_queue_size * factor)),
+        max_muxing_queue_size=max(floor.max_muxing_queue_size, int(profile.max_muxing_queue_size * factor)),
+    )
+
+
+def get_profile(name: str, overseas: bool = False, running: int = 0,
+                scale_start: int = AUTO_SCALE_START) -> FfmpegProfile:
+    if name in PROFILES:
+        return PROFILES[name]
+    base = PROFILES['resilient' if overseas else 'balanced']
+    if name == AUTO_PROFILE:
+        return scale_profile(base, running, scale_start)
+    return base
+
+
+def parse_profile_rules(value: str) -> dict[str, str]:
+    """Parse 'tiktok:resilient, douyin.com/123:low-memory' into {match: profile_name}."""
+    rules = {}
+    for item in value.replace('，', ',').split(','):
+        key, sep, name = item.rpartition(':')
+        key, name = key.strip(), name.strip().lower()
+        if sep and key and (name in PROFILES or name == AUTO_PROFILE):
+            rules[key] = name
+    return rules
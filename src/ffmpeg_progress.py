@@ -0,0 +1,94 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Parse the key=value stream that ffmpeg writes with -progress into per-recording stats.
+"""
+
+import time
+from dataclasses import dataclass, field
+
+PROGRESS_ARGS = ["-progress", "pipe:1", "-nostats"]
+
+
+def _to_float(value: str) -> float | None:
+    try:
+        return float(value.rstrip('x').replace('kbits/s', '').strip())
+    except ValueError:
+        return None
+
+
+def _to_int(value: str) -> int | None:
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+@dataclass
+class FfmpegProgress:
+    out_time: float = 0.0
+    total_size: int = 0
+    bitrate: float | None = None
+    speed: float | None = None
+    fps: float | None = None
+    frame: int = 0
+    drop_frames: int = 0
+    dup_frames: int = 0
+    status: str = 'starting'
+    updated_at: float = field(default_factory=time.monotonic)
+    size_changed_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.updated_at
+
+    def summary(self) -> str:
+        parts = [f"大小 {self.total_size / 1024 / 1024:.1f}MB"]
+        if self.bitrate is not None:
+            parts.append(f"码率 {self.bitrate:.0f}kbps")
+        if self.speed is not None:
+            parts.append(f"速度 {self.speed:.2f}x")
+        if self.drop_frames or self.dup_frames:
+            parts.append(f"丢帧 {self.drop_frames} 重复帧 {self.dup_frames}")
+        return ' '.join(parts)
+
+
+class ProgressParser:
+    def __init__(self, progress: FfmpegProgress | None = None):
+        self.progress = progress or FfmpegProgress()
+        self._pending = {}
+        self._partial = b''
+
+    def _apply(self) -> None:
+        values, self._pending = self._pending, {}
+        progress = self.progress
+        out_time_us = _to_int(values.get('out_time_us', values.get('out_time_ms', '')))
+        if out_time_us is not None:
+            progress.out_time = out_time_us / 1_000_000
+        total_size = _to_int(values.get('total_size', ''))
+        if total_size is not None:
+            if total_size != progress.total_size:
+                progress.size_changed_at = time.monotonic()
+            progress.total_size = total_size
+        progress.bitrate = _to_float(values.get('bitrate', 'N/A'))
+        progress.speed = _to_float(values.get('speed', 'N/A'))
+        progress.fps = _to_float(values.get('fps', 'N/A'))
+        progress.frame = _to_int(values.get('frame', '')) or progress.frame
+        progress.drop_frames = _to_int(values.get('drop_frames', '')) or 0
+        progress.dup_frames = _to_int(values.get('dup_frames', '')) or 0
+        progress.status = values.get('progress', progress.status)
+        progress.updated_at = time.monotonic()
+
+    def feed(self, data: bytes) -> bool:
+        lines = (self._partial + data).split(b'\n')
+        self._partial = lines.pop()
+        updated = False
+        for line in lines:
+            key, sep, value = line.decode('utf-8', 'ignore').strip().partition('=')
+            if not sep:
+                continue
+            self._pending[key] = value.strip()
+            if key == 'progress':
+                self._apply()
+                updated = True
+        return updated
@@ -0,0 +1,272 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Parse FLV tags from a live byte stream and write keyframe-aligned, timestamp-rebased segments.
+"""
+
+import struct
+from dataclasses import dataclass
+from typing import Callable
+from .integrity import HashingWriter
+from .stream_hub import StreamHub
+
+FLV_SIGNATURE = b'FLV'
+FLV_FILE_HEADER_SIZE = 9
+FLV_TAG_HEADER_SIZE = 11
+FLV_PREV_TAG_SIZE = 4
+
+TAG_AUDIO = 8
+TAG_VIDEO = 9
+TAG_SCRIPT = 18
+VALID_TAG_TYPES = (TAG_AUDIO, TAG_VIDEO, TAG_SCRIPT)
+
+MAX_TAG_DATA_SIZE = 8 * 1024 * 1024
+MAX_TIMESTAMP_JUMP = 10_000
+DEFAULT_FRAME_GAP = 40
+
+
+@dataclass
+class FlvTag:
+    tag_type: int
+    timestamp: int
+    data: bytes
+
+    @property
+    def is_video(self) -> bool:
+        return self.tag_type == TAG_VIDEO
+
+    @property
+    def is_audio(self) -> bool:
+        return self.tag_type == TAG_AUDIO
+
+    @property
+    def is_script(self) -> bool:
+        return self.tag_type == TAG_SCRIPT
+
+    @property
+    def is_keyframe(self) -> bool:
+        if not self.is_video or not self.data:
+            return False
+        first = self.data[0]
+        frame_type = (first >> 4) & 0x07 if first & 0x80 else first >> 4
+        return frame_type == 1 and not self.is_sequence_header
+
+    @property
+    def is_sequence_header(self) -> bool:
+        if not self.data:
+            return False
+        first = self.data[0]
+        if self.is_video:
+            if first & 0x80:
+                # Enhanced RTMP: the low nibble carries the packet type, 0 is SequenceStart
+                return first & 0x0f == 0
+            return first & 0x0f in (7, 12) and len(self.data) > 1 and self.data[1] == 0
+        if self.is_audio:
+            return first >> 4 == 10 and len(self.data) > 1 and self.data[1] == 0
+        return False
+
+    def to_bytes(self, timestamp: int | None = None) -> bytes:
+        ts = self.timestamp if timestamp is None else timestamp
+        ts = max(0, ts) & 0xFFFFFFFF
+        size = len(self.data)
+        header = struct.pack('>B', self.tag_type) + size.to_bytes(3, 'big') + \
+            (ts & 0xFFFFFF).to_bytes(3, 'big') + bytes([ts >> 24]) + b'\x00\x00\x00'
+        return header + self.data + struct.pack('>I', FLV_TAG_HEADER_SIZE + size)
+
+
+class FlvTagParser:
+    def __init__(self):
+        self.header_flags = 0x05
+        self.corrupt_bytes = 0
+        self.headers_seen = 0
+        self._buffer = bytearray()
+        self._expect_header = True
+
+    def reset(self) -> None:
+        self._buffer.clear()
+        self._expect_header = True
+
+    def _parse_file_header(self) -> bool:
+        if len(self._buffer) < FLV_FILE_HEADER_SIZE + FLV_PREV_TAG_SIZE:
+            return False
+        if self._buffer[:3] == FLV_SIGNATURE:
+            self.header_flags = self._buffer[4]
+            header_size = max(struct.unpack('>I', self._buffer[5:9])[0], FLV_FILE_HEADER_SIZE)
+            if len(self._buffer) < header_size + FLV_PREV_TAG_SIZE:
+                return False
+            del self._buffer[:header_size + FLV_PREV_TAG_SIZE]
+            self.headers_seen += 1
+        self._expect_header = False
+        return True
+
+    def _is_valid_tag_at(self, offset: int) -> int | None:
+        end = offset + FLV_TAG_HEADER_SIZE
+        if len(self._buffer) < end:
+            return None
+        tag_type = self._buffer[offset] & 0x1f
+        data_size = int.from_bytes(self._buffer[offset + 1:offset + 4], 'big')
+        if tag_type not in VALID_TAG_TYPES or data_size > MAX_TAG_DATA_SIZE or \
+                self._buffer[offset + 8:offset + 11] != b'\x00\x00\x00':
+            return -1
+        return data_size
+
+    def _resync(self) -> None:
+        for offset in range(1, len(self._buffer) - FLV_TAG_HEADER_SIZE):
+            if self._buffer[offset:offset + 3] == FLV_SIGNATURE:
+                self.corrupt_bytes += offset
+                del self._buffer[:offset]
+                self._expect_header = True
+                return
+            data_size = self._is_valid_tag_at(offset)
+            if data_size is None or data_size < 0:
+                continue
+            tail = offset + FLV_TAG_HEADER_SIZE + data_size
+            if len(self._buffer) < tail + FLV_PREV_TAG_SIZE or \
+                    struct.unpack('>I', self._buffer[tail:tail + 4])[0] == FLV_TAG_HEADER_SIZE + data_size:
+                # a candidate that is still incomplete is verified again once more data arrives
+                self.corrupt_bytes += offset
+                del self._buffer[:offset]
+                return
+        keep = FLV_TAG_HEADER_SIZE
+        self.corrupt_bytes += max(0, len(self._buffer) - keep)
+        del self._buffer[:-keep]
+
+    def feed(self, data: bytes) -> list[FlvTag]:
+        self._buffer += data
+        tags = []
+        while True:
+            if self._expect_header and not self._parse_file_header():
+                break
+            if self._buffer[:3] == FLV_SIGNATURE:
+                self._expect_header = True
+                continue
+            data_size = self._is_valid_tag_at(0)
+            if data_size is None:
+                break
+            if data_size < 0:
+                before = len(self._buffer)
+                self._resync()
+                if len(self._buffer) == before:
+                    break
+                continue
+            tag_end = FLV_TAG_HEADER_SIZE + data_size
+            if len(self._buffer) < tag_end + FLV_PREV_TAG_SIZE:
+                break
+            if struct.unpack('>I', self._buffer[tag_end:tag_end + 4])[0] != tag_end:
+                self._resync()
+                continue
+            timestamp = int.from_bytes(self._buffer[4:7], 'big') | (self._buffer[7] << 24)
+            tags.append(FlvTag(self._buffer[0] & 0x1f, timestamp, bytes(self._buffer[FLV_TAG_HEADER_SIZE:tag_end])))
+            del self._buffer[:tag_end + FLV_PREV_TAG_SIZE]
+        return tags
+
+
+class FlvSegmentWriter:
+    def __init__(self, save_path: str, segment_time: float | None = None, buffer_size: int = 1024 * 1024,
+                 hub: StreamHub | None = None, on_file_closed: Callable[[str], None] | None = None,
+                 hash_algorithm: str | None = None, on_file_opened: Callable[[str], None] | None = None):
+        self.save_path = save_path
+        self.hash_algorithm = hash_algorithm
+        self.hub = hub
+        self.on_file_closed = on_file_closed
+        self.on_file_opened = on_file_opened
+        self.segment_time = segment_time * 1000 if segment_time and '%03d' in save_path else None
+        self.buffer_size = buffer_size
+        self.parser = FlvTagParser()
+        self.file_paths: list[str] = []
+        self.file_hashes: dict[str, str] = {}
+        self.tags_written = 0
+        self.discontinuities = 0
+        self._file = None
+        self._metadata: FlvTag | None = None
+        self._video_header: FlvTag | None = None
+        self._audio_header: FlvTag | None = None
+        self._has_video = False
+        self._offset = 0
+        self._last_timeline: int | None = None
+        self._segment_start: int | None = None
+        self._headers_seen = 0
+
+    def _close_file(self) -> None:
+        self._file.close()
+        if isinstance(self._file, HashingWriter):
+            self.file_hashes[self.file_paths[-1]] = self._file.digest_text
+        self._file = None
+        if self.on_file_closed:
+            self.on_file_closed(self.file_paths[-1])
+
+    def _open_next_file(self, timeline: int) -> None:
+        if self._file:
+            self._close_file()
+        path = self.save_path.replace('%03d', f'{len(self.file_paths):03d}') if self.segment_time else self.save_path
+        self._file = open(path, 'wb', buffering=self.buffer_size)
+        if self.hash_algorithm:
+            self._file = HashingWriter(self._file, self.hash_algorithm)
+        self.file_paths.append(path)
+        if self.on_file_opened:
+            self.on_file_opened(path)
+        self._segment_start = timeline
+        self._file.write(self._stream_header())
+
+    def _stream_header(self) -> bytes:
+        header = FLV_SIGNATURE + bytes([1, self.parser.header_flags]) + struct.pack('>I', 9) + b'\x00' * 4
+        for tag in (self._metadata, self._video_header, self._audio_header):
+            if tag:
+                header += tag.to_bytes(0)
+        return header
+
+    def _to_timeline(self, tag: FlvTag) -> int:
+        new_connection = self.parser.headers_seen != self._headers_seen
+        self._headers_seen = self.parser.headers_seen
+        timeline = tag.timestamp + self._offset
+        if self._last_timeline is not None and (
+                new_connection or abs(timeline - self._last_timeline) > MAX_TIMESTAMP_JUMP):
+            self._offset = self._last_timeline + DEFAULT_FRAME_GAP - tag.timestamp
+            timeline = tag.timestamp + self._offset
+            self.discontinuities += 1
+        return timeline
+
+    def _write_tag(self, tag: FlvTag) -> None:
+        if tag.is_script:
+            if self._metadata is None:
+                self._metadata = tag
+                if self.hub:
+                    self.hub.set_header(self._stream_header())
+            return
+        if tag.is_sequence_header:
+            if tag.is_video:
+                self._video_header = tag
+                self._has_video = True
+            else:
+                self._audio_header = tag
+            if self._file:
+                self._file.write(tag.to_bytes(max(0, (self._last_timeline or 0) - self._segment_start)))
+            if self.hub:
+                self.hub.set_header(self._stream_header())
+                self.hub.publish(tag.to_bytes(self._last_timeline or 0), keyframe=False)
+            return
+
+        self._has_video = self._has_video or tag.is_video
+        timeline = self._to_timeline(tag)
+        if self._file is None:
+            if self._has_video and not tag.is_keyframe:
+                return
+            self._open_next_file(timeline)
+        elif self.segment_time and timeline - self._segment_start >= self.segment_time and \
+                (tag.is_keyframe or not self._has_video):
+            self._open_next_file(timeline)
+
+        self._file.write(tag.to_bytes(timeline - self._segment_start))
+        if self.hub and self.hub.subscriber_count:
+            # subscribers see one continuous timeline across file rotations
+            self.hub.publish(tag.to_bytes(timeline), keyframe=tag.is_keyframe or not self._has_video)
+        self._last_timeline = timeline
+        self.tags_written += 1
+
+    def write(self, data: bytes) -> None:
+        for tag in self.parser.feed(data):
+            self._write_tag(tag)
+
+    def close(self) -> None:
+        if self._file:
+            self._close_file()
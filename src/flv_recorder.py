@@ -0,0 +1,157 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Record live FLV streams in-process with coalesced writes, stall reconnects and keyframe-aligned splitting.
+"""
+
+import asyncio
+from typing import Callable
+import httpx
+from .flv import FlvSegmentWriter
+from .http_clients.async_http import get_pooled_client
+from .logger import logger
+from .recorder_loop import recorder_loop
+from .stream_hub import StreamHub
+
+OptionalStr = str | None
+OptionalDict = dict | None
+
+FLV_WRITE_SIZE = 2 * 1024 * 1024
+FLV_STALL_TIMEOUT = 15
+FLV_MAX_RECONNECTS = 3
+FLV_STOP_CHECK_INTERVAL = 1
+
+
+class FlvRecorder:
+    def __init__(
+            self,
+            url: str,
+            save_path: str,
+            headers: OptionalDict = None,
+            proxy_addr: OptionalStr = None,
+            should_stop: Callable[[], bool] | None = None,
+            segment_time: float | None = None,
+            stall_timeout: float = FLV_STALL_TIMEOUT,
+            max_reconnects: int = FLV_MAX_RECONNECTS,
+            hub: StreamHub | None = None,
+            on_file_closed: Callable[[str], None] | None = None,
+            hash_algorithm: str | None = None,
+            on_file_opened: Callable[[str], None] | None = None
+    ):
+        self.url = url
+        self.save_path = save_path
+        self.headers = headers or {}
+        self.proxy_addr = proxy_addr
+        self.should_stop = should_stop or (lambda: False)
+        self.stall_timeout = stall_timeout
+        self.max_reconnects = max_reconnects
+        self.bytes_written = 0
+        self.reconnects = 0
+        self.stopped = False
+        self.status_code: int | None = None
+        self._stop_event: asyncio.Event | None = None
+        self._buffer = bytearray()
+        self.writer = FlvSegmentWriter(save_path, segment_time, hub=hub, on_file_closed=on_file_closed,
+                                       hash_algorithm=hash_algorithm, on_file_opened=on_file_opened)
+
+    @property
+    def file_paths(self) -> list[str]:
+        return self.writer.file_paths
+
+    @property
+    def file_hashes(self) -> dict[str, str]:
+        return self.writer.file_hashes
+
+    async def _watch_stop(self) -> None:
+        while not self._stop_event.is_set():
+            if self.should_stop():
+                self.stopped = True
+                self._stop_event.set()
+                break
+            await asyncio.sleep(FLV_STOP_CHECK_INTERVAL)
+
+    async def _flush(self) -> None:
+        if self._buffer:
+            data = bytes(self._buffer)
+            self._buffer.clear()
+            await asyncio.to_thread(self.writer.write, data)
+            self.bytes_written += len(data)
+
+    async def _next_chunk(self, chunks) -> bytes | None:
+        stop_task = asyncio.ensure_future(self._stop_event.wait())
+        read_task = asyncio.ensure_future(anext(chunks))
+        try:
+            done, _ = await asyncio.wait({stop_task, read_task}, timeout=self.stall_timeout,
+                                         return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stop_task.cancel()
+        if read_task in done:
+            return read_task.result()
+        read_task.cancel()
+        if not done:
+            raise TimeoutError(f"No data for {self.stall_timeout}s")
+        return None
+
+    async def _download(self, client: httpx.AsyncClient) -> bool:
+        async with client.stream('GET', self.url, headers=self.headers, follow_redirects=True) as response:
+            self.status_code = response.status_code
+            if response.status_code != 200:
+                return False
+            chunks = response.aiter_bytes()
+            while not self._stop_event.is_set():
+                try:
+                    chunk = await self._next_chunk(chunks)
+                except StopAsyncIteration:
+                    break
+                if chunk is None:
+                    break
+                self._buffer += chunk
+                if len(self._buffer) >= FLV_WRITE_SIZE:
+                    await self._flush()
+            await self._flush()
+            return True
+
+    async def run(self) -> bool:
+        client = get_pooled_client(self.proxy_addr)
+        self._stop_event = asyncio.Event()
+        watcher = asyncio.create_task(self._watch_stop())
+        try:
+            while not self._stop_event.is_set():
+                written_before = self.bytes_written
+                try:
+                    if not await self._download(client):
+                        logger.warning(f"FLV stream request failed, status: {self.status_code} {self.url}")
+                        break
+                    if not self._stop_event.is_set():
+                        break
+                except (httpx.HTTPError, OSError, TimeoutError) as e:
+                    await self._flush()
+                    if self._stop_event.is_set():
+                        break
+                    if self.bytes_written == written_before or self.reconnects >= self.max_reconnects:
+                        logger.warning(f"FLV stream interrupted, stop recording: {e} {self.url}")
+                        break
+                    self.reconnects += 1
+                    self.writer.parser.reset()
+                    logger.debug(f"FLV stream stalled, reconnecting ({self.reconnects}): {e}")
+                    await asyncio.sleep(min(2 ** self.reconnects, 10))
+        finally:
+            watcher.cancel()
+            self._stop_event.set()
+            await self._flush()
+            await asyncio.to_thread(self.writer.close)
+        return self.writer.tags_written > 0
+
+
+def record_flv(url: str, save_path: str, headers: OptionalDict = None, proxy_addr: OptionalStr = None,
+               should_stop: Callable[[], bool] | None = None, segment_time: float | None = None,
+               stall_timeout: float = FLV_STALL_TIMEOUT, max_reconnects: int = FLV_MAX_RECONNECTS,
+               hub: StreamHub | None = None, on_file_closed: Callable[[str], None] | None = None,
+               hash_algorithm: str | None = None,
+               on_file_opened: Callable[[str], None] | None = None) -> FlvRecorder:
+    recorder = FlvRecorder(url, save_path, headers=headers, proxy_addr=proxy_addr, should_stop=should_stop,
+                           segment_time=segment_time, stall_timeout=stall_timeout, max_reconnects=max_reconnects,
+                           hub=hub, on_file_closed=on_file_closed, hash_algorithm=hash_algorithm,
+                           on_file_opened=on_file_opened)
+    recorder_loop.run(recorder.run())
+    return recorder
@@ -0,0 +1,91 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Hedge a slow primary request with an alternate endpoint and keep the first valid result.
+"""
+
+import asyncio
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Awaitable, Callable
+
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW_SIZE = 200
+
+
+class LatencyTracker:
+    def __init__(self, window_size: int = HEDGE_WINDOW_SIZE, min_samples: int = HEDGE_MIN_SAMPLES):
+        self.min_samples = min_samples
+        self._samples: dict[str, deque] = defaultdict(lambda: deque(maxlen=window_size))
+        self._lock = threading.Lock()
+
+    def record(self, key: str, latency: float) -> None:
+        with self._lock:
+            self._samples[key].append(latency)
+
+    def percentile(self, key: str, percent: float) -> float | None:
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        index = max(0, math.ceil(percent / 100 * len(samples)) - 1)
+        return samples[index]
+
+    def p95(self, key: str) -> float | None:
+        return self.percentile(key, 95)
+
+
+latency_tracker = LatencyTracker()
+
+
+def get_hedge_delay(key: str, delay: float | None, tracker: LatencyTracker = latency_tracker) -> float | None:
+    p95 = tracker.p95(key)
+    if p95 is None:
+        return delay
+    return p95 if delay is None else min(delay, p95)
+
+
+async def hedged_request(
+        primary: Callable[[], Awaitable],
+        alternate: Callable[[], Awaitable],
+        key: str,
+        delay: float | None = None,
+        is_valid: Callable[[Any], bool] = bool,
+        tracker: LatencyTracker = latency_tracker
+) -> Any:
+    start = time.monotonic()
+    primary_task = asyncio.create_task(primary())
+    primary_task.add_done_callback(
+        lambda t: tracker.record(key, time.monotonic() - start) if not t.cancelled() else None)
+
+    done, _ = await asyncio.wait({primary_task}, timeout=get_hedge_delay(key, delay, tracker))
+    if done and not primary_task.exception() and is_valid(primary_task.result()):
+        return primary_task.result()
+
+    pending = {asyncio.create_task(alternate())}
+    if not done:
+        pending.add(primary_task)
+
+    fallback_result = primary_task.result() if done and not primary_task.exception() else None
+    last_error = primary_task.exception() if done else None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception():
+                    last_error = task.exception()
+                    continue
+                result = task.result()
+                if is_valid(result):
+                    return result
+                if fallback_result is None:
+                    fallback_result = result
+    finally:
+        for task in pending:
+            task.cancel()
+
+    if fallback_result is None and last_error:
+        raise last_error
+    return fallback_result
@@ -0,0 +1,243 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Parse HLS master and media playlists and rank their variant streams.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from urllib.parse import urljoin
+from .http_clients.async_http import async_req
+from .utils import get_url_expire_time
+
+OptionalStr = str | None
+OptionalDict = dict | None
+
+MASTER_CACHE_TTL = 300
+MASTER_CACHE_MARGIN = 30
+MASTER_CACHE_SIZE = 256
+
+ATTRIBUTE_PATTERN = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^",]*)')
+CODEC_PREFERENCE = {'avc1': 3, 'avc3': 3, 'hvc1': 2, 'hev1': 2, 'av01': 1}
+
+
+@dataclass(frozen=True)
+class HlsVariant:
+    uri: str
+    bandwidth: int = 0
+    average_bandwidth: int = 0
+    resolution: tuple[int, int] = (0, 0)
+    frame_rate: float = 0.0
+    codecs: tuple[str, ...] = ()
+    attributes: dict = field(default_factory=dict, compare=False, hash=False)
+
+    @property
+    def codec_rank(self) -> int:
+        video_codecs = [CODEC_PREFERENCE[c.split('.')[0]] for c in self.codecs if c.split('.')[0] in CODEC_PREFERENCE]
+        return max(video_codecs, default=0)
+
+    def sort_key(self) -> tuple:
+        width, height = self.resolution
+        return (self.bandwidth or self.average_bandwidth, width * height, self.frame_rate, self.codec_rank)
+
+
+def parse_attribute_list(text: str) -> dict:
+    attributes = {}
+    for key, value in ATTRIBUTE_PATTERN.findall(text):
+        if value.startswith('"') and value.endswith('"'):
+            value = value[1:-1]
+        attributes[key] = value
+    return attributes
+
+
+def _to_int(value: OptionalStr) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _to_float(value: OptionalStr) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _parse_resolution(value: OptionalStr) -> tuple[int, int]:
+    if value and 'x' in value:
+        width, height = value.lower().split('x', maxsplit=1)
+        return _to_int(width), _to_int(height)
+    return 0, 0
+
+
+def parse_master_playlist(text: str, base_url: str) -> list[HlsVariant]:
+    variants = []
+    pending = None
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if not line:
+            continue
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            pending = parse_attribute_list(line.split(':', maxsplit=1)[1])
+        elif line.startswith('#'):
+            continue
+        elif pending is not None:
+            codecs = tuple(c.strip() for c in pending.get('CODECS', '').split(',') if c.strip())
+            variants.append(HlsVariant(
+                uri=urljoin(base_url, line),
+                bandwidth=_to_int(pending.get('BANDWIDTH')),
+                average_bandwidth=_to_int(pending.get('AVERAGE-BANDWIDTH')),
+                resolution=_parse_resolution(pending.get('RESOLUTION')),
+                frame_rate=_to_float(pending.get('FRAME-RATE')),
+                codecs=codecs,
+                attributes=pending,
+            ))
+            pending = None
+    return variants
+
+
+@dataclass(frozen=True)
+class HlsSegment:
+    uri: str
+    sequence: int
+    duration: float = 0.0
+    discontinuity: bool = False
+    program_date_time: OptionalStr = None
+
+
+@dataclass
+class HlsMediaPlaylist:
+    segments: list[HlsSegment] = field(default_factory=list)
+    target_duration: float = 0.0
+    media_sequence: int = 0
+    discontinuity_sequence: int = 0
+    endlist: bool = False
+    encrypted: bool = False
+    has_init_segment: bool = False
+    has_byte_range: bool = False
+
+    @property
+    def last_sequence(self) -> int | None:
+        return self.segments[-1].sequence if self.segments else None
+
+
+def is_master_playlist(text: str) -> bool:
+    return '#EXT-X-STREAM-INF' in text
+
+
+def _tag_value(line: str) -> str:
+    return line.split(':', maxsplit=1)[1] if ':' in line else ''
+
+
+def parse_media_playlist(text: str, base_url: str) -> HlsMediaPlaylist:
+    playlist = HlsMediaPlaylist()
+    sequence = None
+    duration = 0.0
+    discontinuity = False
+    program_date_time = None
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if not line:
+            continue
+        if line.startswith('#EXTINF:'):
+            duration = _to_float(_tag_value(line).split(',', maxsplit=1)[0])
+        elif line.startswith('#EXT-X-TARGETDURATION:'):
+            playlist.target_duration = _to_float(_tag_value(line))
+        elif line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+            playlist.media_sequence = _to_int(_tag_value(line))
+        elif line.startswith('#EXT-X-DISCONTINUITY-SEQUENCE:'):
+            playlist.discontinuity_sequence = _to_int(_tag_value(line))
+        elif line == '#EXT-X-DISCONTINUITY':
+            discontinuity = True
+        elif line.startswith('#EXT-X-PROGRAM-DATE-TIME:'):
+            program_date_time = _tag_value(line)
+        elif line.startswith('#EXT-X-KEY:'):
+            playlist.encrypted = parse_attribute_list(_tag_value(line)).get('METHOD', 'NONE') != 'NONE'
+        elif line.startswith('#EXT-X-MAP:'):
+            playlist.has_init_segment = True
+        elif line.startswith('#EXT-X-BYTERANGE:'):
+            playlist.has_byte_range = True
+        elif line == '#EXT-X-ENDLIST':
+            playlist.endlist = True
+        elif line.startswith('#'):
+            continue
+        else:
+            if sequence is None:
+                sequence = playlist.media_sequence
+            playlist.segments.append(HlsSegment(
+                uri=urljoin(base_url, line),
+                sequence=sequence,
+                duration=duration,
+                discontinuity=discontinuity,
+                program_date_time=program_date_time,
+            ))
+            sequence += 1
+            duration = 0.0
+            discontinuity = False
+            program_date_time = None
+    return playlist
+
+
+def rank_variants(variants: list[HlsVariant]) -> list[HlsVariant]:
+    return sorted(variants, key=HlsVariant.sort_key, reverse=True)
+
+
+class MasterPlaylistCache:
+    def __init__(self, max_size: int = MASTER_CACHE_SIZE, ttl: float = MASTER_CACHE_TTL,
+                 margin: float = MASTER_CACHE_MARGIN):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.margin = margin
+        self._items: OrderedDict[str, tuple[float, list[HlsVariant]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> list[HlsVariant] | None:
+        with self._lock:
+            item = self._items.get(url)
+            if not item:
+                return None
+            expire_at, variants = item
+            if expire_at <= time.time():
+                del self._items[url]
+                return None
+            self._items.move_to_end(url)
+            return variants
+
+    def put(self, url: str, variants: list[HlsVariant]) -> None:
+        now = time.time()
+        expire_at = now + self.ttl
+        url_expire_time = get_url_expire_time(url)
+        if url_expire_time:
+            expire_at = min(expire_at, url_expire_time - self.margin)
+        if expire_at <= now:
+            return
+        with self._lock:
+            self._items[url] = (expire_at, variants)
+            self._items.move_to_end(url)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def invalidate(self, url: str) -> None:
+        with self._lock:
+            self._items.pop(url, None)
+
+
+master_playlist_cache = MasterPlaylistCache()
+
+
+async def get_master_variants(m3u8: str, proxy: OptionalStr = None, header: OptionalDict = None,
+                              abroad: bool = False, use_cache: bool = True) -> list[HlsVariant]:
+    if use_cache:
+        variants = master_playlist_cache.get(m3u8)
+        if variants is not None:
+            return variants
+
+    resp = await async_req(url=m3u8, proxy_addr=proxy, headers=header, abroad=abroad)
+    variants = rank_variants(parse_master_playlist(resp, m3u8))
+    if variants and use_cache:
+        master_playlist_cache.put(m3u8, variants)
+    return variants
@@ -0,0 +1,301 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Record live HLS streams in-process by polling the media playlist and prefetching segments.
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from typing import Callable
+from urllib.parse import urlsplit
+import httpx
+from .hls import HlsMediaPlaylist, HlsSegment, is_master_playlist, parse_master_playlist, parse_media_playlist, \
+    rank_variants
+from .http_clients.async_http import get_pooled_client
+from .integrity import HashingWriter
+from .logger import logger
+from .recorder_loop import recorder_loop
+from .stream_hub import StreamHub
+
+OptionalStr = str | None
+OptionalDict = dict | None
+
+HLS_FETCH_CONCURRENCY = 4
+HLS_SEGMENT_RETRIES = 3
+HLS_PLAYLIST_ERROR_TIMEOUT = 30
+HLS_MIN_STALL_TIMEOUT = 30
+HLS_MIN_RELOAD_INTERVAL = 0.5
+HLS_STOP_CHECK_INTERVAL = 0.5
+# a media sequence this far behind the last one seen is a restarted stream, not a stale playlist from a lagging edge
+HLS_SEQUENCE_RESET_GAP = 10
+HLS_SEEN_SEGMENTS = 64
+
+
+class UnsupportedPlaylistError(Exception):
+    pass
+
+
+class HlsRecorder:
+    def __init__(
+            self,
+            url: str,
+            save_path: str,
+            headers: OptionalDict = None,
+            proxy_addr: OptionalStr = None,
+            should_stop: Callable[[], bool] | None = None,
+            segment_time: float | None = None,
+            concurrency: int = HLS_FETCH_CONCURRENCY,
+            hub: StreamHub | None = None,
+            on_file_closed: Callable[[str], None] | None = None,
+            hash_algorithm: str | None = None,
+            on_file_opened: Callable[[str], None] | None = None
+    ):
+        self.url = url
+        self.save_path = save_path
+        self.headers = headers or {}
+        self.proxy_addr = proxy_addr
+        self.should_stop = should_stop or (lambda: False)
+        self.segment_time = segment_time if segment_time and '%03d' in save_path else None
+        self.concurrency = max(1, concurrency)
+        self.hub = hub
+        self.on_file_closed = on_file_closed
+        self.on_file_opened = on_file_opened
+        self.hash_algorithm = hash_algorithm
+        self.manifest_path = save_path.replace('_%03d', '').rsplit('.', maxsplit=1)[0] + '.manifest.json'
+        self.media_url: OptionalStr = None
+        self.file_paths: list[str] = []
+        self.file_hashes: dict[str, str] = {}
+        self.events: list[dict] = []
+        self.segments_written = 0
+        self.bytes_written = 0
+        self.duration_written = 0.0
+        self.stopped = False
+        self._file = None
+        self._file_duration = 0.0
+        self._started_at = time.time()
+        self._seen_segments: deque[str] = deque(maxlen=HLS_SEEN_SEGMENTS)
+        self._discontinuity_sequence: int | None = None
+
+    def _stop_requested(self) -> bool:
+        if not self.stopped and self.should_stop():
+            self.stopped = True
+        return self.stopped
+
+    async def _wait(self, seconds: float) -> None:
+        deadline = time.monotonic() + seconds
+        while not self._stop_requested():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(remaining, HLS_STOP_CHECK_INTERVAL))
+
+    async def _get(self, client: httpx.AsyncClient, url: str) -> httpx.Response:
+        response = await client.get(url, headers=self.headers, follow_redirects=True)
+        response.raise_for_status()
+        return response
+
+    async def _resolve_media_url(self, client: httpx.AsyncClient) -> str:
+        response = await self._get(client, self.url)
+        if not is_master_playlist(response.text):
+            return str(response.url)
+        variants = rank_variants(parse_master_playlist(response.text, str(response.url)))
+        if not variants:
+            raise UnsupportedPlaylistError(f"No variant streams in master playlist: {self.url}")
+        return variants[0].uri
+
+    async def _fetch_playlist(self, client: httpx.AsyncClient) -> HlsMediaPlaylist:
+        response = await self._get(client, self.media_url)
+        playlist = parse_media_playlist(response.text, str(response.url))
+        if playlist.encrypted or playlist.has_init_segment or playlist.has_byte_range:
+            raise UnsupportedPlaylistError(f"Playlist needs ffmpeg (encrypted, fMP4 or byte-range): {self.url}")
+        return playlist
+
+    async def _fetch_segment(self, client: httpx.AsyncClient, segment: HlsSegment,
+                             semaphore: asyncio.Semaphore) -> bytes | None:
+        async with semaphore:
+            for attempt in range(HLS_SEGMENT_RETRIES):
+                if self._stop_requested():
+                    return None
+                try:
+                    response = await self._get(client, segment.uri)
+                    return response.content
+                except (httpx.HTTPError, OSError) as e:
+                    logger.debug(f"HLS segment {segment.sequence} fetch failed ({attempt + 1}): {e}")
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+        return None
+
+    async def _add_event(self, event_type: str, **kwargs) -> None:
+        self.events.append({'type': event_type, 'time': time.strftime('%Y-%m-%d %H:%M:%S'), **kwargs})
+        await asyncio.to_thread(self._write_manifest, self._manifest())
+
+    def _manifest(self) -> dict:
+        return {
+            'source_url': self.url,
+            'media_playlist_url': self.media_url,
+            'files': list(self.file_paths),
+            'hashes': dict(self.file_hashes),
+            'segments': self.segments_written,
+            'bytes': self.bytes_written,
+            'duration': round(self.duration_written, 3),
+            'started_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self._started_at)),
+            'updated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'events': list(self.events),
+        }
+
+    def _write_manifest(self, manifest: dict) -> None:
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.manifest_path)
+
+    def _close_file(self) -> None:
+        self._file.close()
+        if isinstance(self._file, HashingWriter):
+            self.file_hashes[self.file_paths[-1]] = self._file.digest_text
+        self._file = None
+        if self.on_file_closed:
+            self.on_file_closed(self.file_paths[-1])
+
+    def _open_next_file(self) -> None:
+        if self._file:
+            self._close_file()
+        path = self.save_path.replace('%03d', f'{len(self.file_paths):03d}') if self.segment_time else self.save_path
+        self._file = open(path, 'wb')
+        if self.hash_algorithm:
+            self._file = HashingWriter(self._file, self.hash_algorithm)
+        self._file_duration = 0.0
+        self.file_paths.append(path)
+        if self.on_file_opened:
+            self.on_file_opened(path)
+
+    def _write_segment(self, segment: HlsSegment, data: bytes) -> None:
+        if self._file is None or (self.segment_time and self._file_duration >= self.segment_time):
+            self._open_next_file()
+        self._file.write(data)
+        if self.hub:
+            self.hub.publish(data)
+        self._file_duration += segment.duration
+        self.segments_written += 1
+        self.bytes_written += len(data)
+        self.duration_written += segment.duration
+
+    async def _flush(self, queue: deque, tasks: dict, wait: bool = False) -> None:
+        while queue:
+            segment = queue[0]
+            task = tasks[segment.sequence]
+            if not task.done():
+                if not wait:
+                    break
+                await asyncio.wait({task})
+            queue.popleft()
+            tasks.pop(segment.sequence)
+            data = None if task.cancelled() else task.result()
+            if data is None:
+                if not self.stopped:
+                    await self._add_event('gap', from_sequence=segment.sequence, to_sequence=segment.sequence,
+                                          duration=segment.duration, reason='segment_fetch_failed')
+                continue
+            if segment.discontinuity:
+                await self._add_event('discontinuity', sequence=segment.sequence)
+            await asyncio.to_thread(self._write_segment, segment, data)
+
+    @staticmethod
+    def _segment_key(segment: HlsSegment) -> str:
+        # without the query, which some CDNs re-sign on every playlist reload
+        return urlsplit(segment.uri).path
+
+    def _is_sequence_reset(self, playlist: HlsMediaPlaylist, last_sequence: int | None) -> bool:
+        """Whether the media sequence started over (CDN switch or stream restart) instead of the playlist lagging."""
+        if last_sequence is None or not playlist.segments or playlist.last_sequence > last_sequence:
+            return False
+        if last_sequence - playlist.last_sequence > HLS_SEQUENCE_RESET_GAP:
+            return True
+        if self._discontinuity_sequence is not None and \
+                playlist.discontinuity_sequence != self._discontinuity_sequence:
+            return True
+        return self._segment_key(playlist.segments[-1]) not in self._seen_segments
+
+    async def run(self) -> bool:
+        client = get_pooled_client(self.proxy_addr)
+        self.media_url = await self._resolve_media_url(client)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        queue: deque[HlsSegment] = deque()
+        tasks: dict[int, asyncio.Task] = {}
+        last_sequence = None
+        last_progress = time.monotonic()
+        last_playlist_ok = time.monotonic()
+        try:
+            while not self._stop_requested():
+                try:
+                    playlist = await self._fetch_playlist(client)
+                except (httpx.HTTPError, OSError) as e:
+                    if time.monotonic() - last_playlist_ok > HLS_PLAYLIST_ERROR_TIMEOUT:
+                        logger.warning(f"HLS playlist unavailable, stop recording: {self.media_url} {e}")
+                        break
+                    await self._wait(1)
+                    continue
+                last_playlist_ok = time.monotonic()
+
+                if self._is_sequence_reset(playlist, last_sequence):
+                    logger.warning(f"HLS media sequence reset {last_sequence} -> {playlist.last_sequence}: "
+                                   f"{self.media_url}")
+                    # queued segments are keyed by sequence, so write them out before the numbers repeat
+                    await self._flush(queue, tasks, wait=True)
+                    await self._add_event('sequence_reset', from_sequence=last_sequence,
+                                          to_sequence=playlist.segments[0].sequence)
+                    last_sequence = playlist.segments[0].sequence - 1
+                self._discontinuity_sequence = playlist.discontinuity_sequence
+
+                new_segments = [s for s in playlist.segments if last_sequence is None or s.sequence > last_sequence]
+                if new_segments:
+                    if last_sequence is not None and new_segments[0].sequence > last_sequence + 1:
+                        await self._add_event('gap', from_sequence=last_sequence + 1,
+                                              to_sequence=new_segments[0].sequence - 1, reason='playlist_window')
+                    for segment in new_segments:
+                        tasks[segment.sequence] = asyncio.create_task(self._fetch_segment(client, segment, semaphore))
+                        queue.append(segment)
+                        self._seen_segments.append(self._segment_key(segment))
+                    last_sequence = new_segments[-1].sequence
+                    last_progress = time.monotonic()
+
+                await self._flush(queue, tasks)
+                if playlist.endlist:
+                    await self._flush(queue, tasks, wait=True)
+                    break
+
+                target_duration = playlist.target_duration or 2
+                if time.monotonic() - last_progress > max(target_duration * 6, HLS_MIN_STALL_TIMEOUT):
+                    logger.warning(f"HLS playlist stalled, stop recording: {self.media_url}")
+                    break
+                reload_interval = target_duration if new_segments else target_duration / 2
+                await self._wait(max(reload_interval, HLS_MIN_RELOAD_INTERVAL))
+
+            if not self.stopped:
+                await self._flush(queue, tasks, wait=True)
+            else:
+                await self._flush(queue, tasks)
+        finally:
+            for task in tasks.values():
+                task.cancel()
+            if self._file:
+                await asyncio.to_thread(self._close_file)
+            if self.file_paths:
+                await self._add_event('end', stopped=self.stopped)
+        return self.segments_written > 0
+
+
+def record_hls(url: str, save_path: str, headers: OptionalDict = None, proxy_addr: OptionalStr = None,
+               should_stop: Callable[[], bool] | None = None, segment_time: float | None = None,
+               concurrency: int = HLS_FETCH_CONCURRENCY, hub: StreamHub | None = None,
+               on_file_closed: Callable[[str], None] | None = None,
+               hash_algorithm: str | None = None,
+               on_file_opened: Callable[[str], None] | None = None) -> HlsRecorder:
+    recorder = HlsRecorder(url, save_path, headers=headers, proxy_addr=proxy_addr, should_stop=should_stop,
+                           segment_time=segment_time, concurrency=concurrency, hub=hub,
+                           on_file_closed=on_file_closed, hash_algorithm=hash_algorithm,
+                           on_file_opened=on_file_opened)
+    recorder_loop.run(recorder.run())
+    return recorder
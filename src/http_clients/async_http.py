@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import asyncio
 import httpx
 from typing import Dict, Any
 from .. import utils
@@ -6,6 +7,32 @@ from .. import utils
 OptionalStr = str | None
 OptionalDict = Dict[str, Any] | None
 
+POOL_MAX_CONNECTIONS = 200
+POOL_MAX_KEEPALIVE = 50
+_pooled_clients: dict[tuple, httpx.AsyncClient] = {}
+
+
+def get_pooled_client(proxy_addr: OptionalStr = None, verify: bool = False, http2: bool = True,
+                      timeout: int = 20) -> httpx.AsyncClient:
+    key = (id(asyncio.get_running_loop()), proxy_addr, verify, http2)
+    client = _pooled_clients.get(key)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            proxy=utils.handle_proxy_addr(proxy_addr),
+            timeout=timeout,
+            verify=verify,
+            http2=http2,
+            limits=httpx.Limits(max_connections=POOL_MAX_CONNECTIONS, max_keepalive_connections=POOL_MAX_KEEPALIVE),
+        )
+        _pooled_clients[key] = client
+    return client
+
+
+async def close_pooled_clients() -> None:
+    loop_id = id(asyncio.get_running_loop())
+    for key in [k for k in _pooled_clients if k[0] == loop_id]:
+        await _pooled_clients.pop(key).aclose()
+
 
 async def async_req(
         url: str,
@@ -0,0 +1,108 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Hash recordings while they are written, either by wrapping the file object the recorder writes to,
+or by following a file another process (ffmpeg) is appending to, so no second read pass is needed.
+"""
+
+import hashlib
+import os
+import threading
+from typing import BinaryIO
+
+DEFAULT_ALGORITHM = 'sha256'
+TAIL_READ_SIZE = 1024 * 1024
+
+
+def new_hash(algorithm: str = DEFAULT_ALGORITHM):
+    """Return a hashlib object, falling back to the default for names hashlib does not provide."""
+    try:
+        return hashlib.new(algorithm)
+    except (ValueError, TypeError):
+        return hashlib.new(DEFAULT_ALGORITHM)
+
+
+class StreamHasher:
+    def __init__(self, algorithm: str = DEFAULT_ALGORITHM):
+        self._hash = new_hash(algorithm)
+        self.size = 0
+
+    @property
+    def algorithm(self) -> str:
+        return self._hash.name
+
+    def update(self, data: bytes) -> None:
+        self._hash.update(data)
+        self.size += len(data)
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+    @property
+    def digest_text(self) -> str:
+        return f'{self.algorithm}:{self.hexdigest()}'
+
+
+class HashingWriter(StreamHasher):
+    """File wrapper that hashes every byte on its way to disk."""
+
+    def __init__(self, file: BinaryIO, algorithm: str = DEFAULT_ALGORITHM):
+        super().__init__(algorithm)
+        self.file = file
+
+    def write(self, data: bytes) -> int:
+        self.update(data)
+        return self.file.write(data)
+
+    def flush(self) -> None:
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class TailHasher(StreamHasher):
+    """Hash a file that another process is still appending to, reading only bytes not seen yet.
+
+    Polled shortly after the bytes were written, the reads are served from the page cache. poll and finish may
+    be called from different threads; finish waits for a running poll and later polls do nothing.
+    """
+
+    def __init__(self, path: str, algorithm: str = DEFAULT_ALGORITHM):
+        super().__init__(algorithm)
+        self.path = path
+        self._file: BinaryIO | None = None
+        self._lock = threading.Lock()
+        self._finished = False
+
+    def poll(self) -> int:
+        with self._lock:
+            return 0 if self._finished else self._read()
+
+    def _read(self) -> int:
+        if self._file is None:
+            try:
+                self._file = open(self.path, 'rb')
+            except OSError:
+                return 0
+        read = 0
+        while chunk := self._file.read(TAIL_READ_SIZE):
+            self.update(chunk)
+            read += len(chunk)
+        return read
+
+    def finish(self) -> str | None:
+        """Hash what is left once the writer has exited; None when the file never appeared or was rewritten."""
+        with self._lock:
+            self._finished = True
+            self._read()
+        if self._file is None:
+            return None
+        self._file.close()
+        try:
+            if os.path.getsize(self.path) != self.size:
+                # truncated or rewritten after we read it, so the streamed digest is stale
+                return None
+        except OSError:
+            return None
+        return self.digest_text
@@ -0,0 +1,223 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Persist post-processing jobs in a SQLite journal so they are retried with backoff and resumed
+after a restart, and provide the `jobs` command line to inspect and requeue them.
+"""
+
+import argparse
+import json
+import sqlite3
+import threading
+import time
+from typing import Callable
+from .logger import logger
+from .postprocess import PRIORITY_REMUX, PostProcessPool
+
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_STATES = (JOB_PENDING, JOB_RUNNING, JOB_DONE, JOB_FAILED)
+
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_BASE_DELAY = 30
+JOB_RETRY_MAX_DELAY = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    args TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    next_run_at REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    last_error TEXT,
+    dedupe_key TEXT NOT NULL UNIQUE
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, next_run_at);
+"""
+
+
+class JobStore:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def enqueue(self, kind: str, args: list, priority: int = PRIORITY_REMUX,
+                max_attempts: int = JOB_MAX_ATTEMPTS) -> int | None:
+        """
+        Add a job, or send a finished or failed job with the same kind and arguments back to pending.
+        Returns the job id, or None when the same job is already pending or running.
+        """
+        args_text = json.dumps(args, ensure_ascii=False)
+        dedupe_key = f'{kind}:{args_text}'
+        now = time.time()
+        cursor = self._execute(
+            'INSERT INTO jobs (kind, args, priority, max_attempts, created_at, updated_at, dedupe_key) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(dedupe_key) DO UPDATE SET state = ?, attempts = 0, '
+            'priority = excluded.priority, max_attempts = excluded.max_attempts, next_run_at = 0, '
+            'last_error = NULL, updated_at = excluded.updated_at WHERE state IN (?, ?)',
+            (kind, args_text, priority, max_attempts, now, now, dedupe_key, JOB_PENDING, JOB_DONE, JOB_FAILED))
+        if not cursor.rowcount:
+            return None
+        return self._execute('SELECT id FROM jobs WHERE dedupe_key = ?', (dedupe_key,)).fetchone()[0]
+
+    def get(self, job_id: int) -> dict | None:
+        row = self._execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list_jobs(self, state: str | None = None, limit: int = 100) -> list[dict]:
+        if state:
+            rows = self._execute('SELECT * FROM jobs WHERE state = ? ORDER BY id DESC LIMIT ?', (state, limit))
+        else:
+            rows = self._execute('SELECT * FROM jobs ORDER BY id DESC LIMIT ?', (limit,))
+        return [self._to_dict(row) for row in rows.fetchall()]
+
+    def counts(self) -> dict[str, int]:
+        rows = self._execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall()
+        return {state: count for state, count in rows}
+
+    def claim(self, job_id: int) -> bool:
+        cursor = self._execute('UPDATE jobs SET state = ?, updated_at = ? WHERE id = ? AND state = ?',
+                               (JOB_RUNNING, time.time(), job_id, JOB_PENDING))
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: int) -> None:
+        self._execute('UPDATE jobs SET state = ?, attempts = attempts + 1, last_error = NULL, updated_at = ? '
+                      'WHERE id = ?', (JOB_DONE, time.time(), job_id))
+
+    def fail(self, job_id: int, error: str) -> float | None:
+        """Record a failed attempt. Returns the retry time, or None once the job has used up its attempts."""
+        job = self.get(job_id)
+        if not job:
+            return None
+        attempts = job['attempts'] + 1
+        now = time.time()
+        if attempts >= job['max_attempts']:
+            self._execute('UPDATE jobs SET state = ?, attempts = ?, last_error = ?, updated_at = ? WHERE id = ?',
+                          (JOB_FAILED, attempts, error, now, job_id))
+            return None
+        next_run_at = now + min(JOB_RETRY_BASE_DELAY * 2 ** (attempts - 1), JOB_RETRY_MAX_DELAY)
+        self._execute('UPDATE jobs SET state = ?, attempts = ?, last_error = ?, next_run_at = ?, updated_at = ? '
+                      'WHERE id = ?', (JOB_PENDING, attempts, error, next_run_at, now, job_id))
+        return next_run_at
+
+    def requeue(self, job_ids: list[int] | None = None, state: str = JOB_FAILED) -> int:
+        now = time.time()
+        if job_ids:
+            marks = ','.join('?' * len(job_ids))
+            cursor = self._execute(
+                f'UPDATE jobs SET state = ?, attempts = 0, next_run_at = 0, updated_at = ? '
+                f'WHERE id IN ({marks}) AND state != ?', (JOB_PENDING, now, *job_ids, JOB_RUNNING))
+        else:
+            cursor = self._execute('UPDATE jobs SET state = ?, attempts = 0, next_run_at = 0, updated_at = ? '
+                                   'WHERE state = ?', (JOB_PENDING, now, state))
+        return cursor.rowcount
+
+    def recover(self) -> int:
+        """Return jobs interrupted by a restart to pending, since no process is running them any more."""
+        cursor = self._execute('UPDATE jobs SET state = ?, updated_at = ? WHERE state = ?',
+                               (JOB_PENDING, time.time(), JOB_RUNNING))
+        return cursor.rowcount
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> dict:
+        job = dict(row)
+        job['args'] = json.loads(job['args'])
+        return job
+
+
+class JobQueue:
+    """Run journaled jobs on a post-processing pool; handlers return False or raise to signal failure."""
+
+    def __init__(self, store: JobStore, pool: PostProcessPool):
+        self.store = store
+        self.pool = pool
+        self.handlers: dict[str, Callable] = {}
+        self.pools: dict[str, PostProcessPool] = {}
+
+    def register(self, kind: str, handler: Callable, pool: PostProcessPool | None = None) -> None:
+        """Register the handler for a job kind, optionally on its own pool so long jobs do not hold up others."""
+        self.handlers[kind] = handler
+        if pool:
+            self.pools[kind] = pool
+
+    def submit(self, kind: str, *args, priority: int = PRIORITY_REMUX, max_attempts: int = JOB_MAX_ATTEMPTS) -> None:
+        job_id = self.store.enqueue(kind, list(args), priority, max_attempts)
+        if job_id is not None:
+            self._dispatch(self.store.get(job_id))
+
+    def _dispatch(self, job: dict) -> None:
+        delay = job['next_run_at'] - time.time()
+        if delay > 0:
+            timer = threading.Timer(delay, self._dispatch, args=({**job, 'next_run_at': 0},))
+            timer.daemon = True
+            timer.start()
+            return
+        pool = self.pools.get(job['kind'], self.pool)
+        pool.submit(self._run, job['id'], priority=job['priority'], name=f"{job['kind']}#{job['id']}")
+
+    def _run(self, job_id: int) -> None:
+        if not self.store.claim(job_id):
+            return
+        job = self.store.get(job_id)
+        handler = self.handlers.get(job['kind'])
+        try:
+            if handler is None:
+                raise LookupError(f"No handler for job kind {job['kind']}")
+            if handler(*job['args']) is False:
+                raise RuntimeError('handler reported failure')
+        except Exception as e:
+            next_run_at = self.store.fail(job_id, str(e))
+            if next_run_at is None:
+                logger.error(f"Job {job['kind']}#{job_id} failed after {job['max_attempts']} attempts: {e}")
+            else:
+                logger.warning(f"Job {job['kind']}#{job_id} failed, retrying in {next_run_at - time.time():.0f}s: {e}")
+                self._dispatch(self.store.get(job_id))
+            return
+        self.store.complete(job_id)
+
+    def resume(self) -> int:
+        recovered = self.store.recover()
+        jobs = self.store.list_jobs(JOB_PENDING, limit=-1)
+        for job in reversed(jobs):
+            self._dispatch(job)
+        if jobs:
+            logger.info(f"Resumed {len(jobs)} post-processing jobs ({recovered} interrupted)")
+        return len(jobs)
+
+
+def main(argv: list[str], db_path: str) -> int:
+    parser = argparse.ArgumentParser(prog='jobs', description='后处理任务队列')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    list_parser = subparsers.add_parser('list', help='列出任务')
+    list_parser.add_argument('--state', choices=JOB_STATES)
+    list_parser.add_argument('--limit', type=int, default=50)
+    requeue_parser = subparsers.add_parser('requeue', help='重新排队任务, 下次启动时执行')
+    requeue_parser.add_argument('ids', nargs='*', type=int, help='任务ID, 省略时重新排队所有失败任务')
+    args = parser.parse_args(argv)
+
+    store = JobStore(db_path)
+    if args.command == 'list':
+        print(' '.join(f"{state}={count}" for state, count in sorted(store.counts().items())) or 'no jobs')
+        for job in store.list_jobs(args.state, args.limit):
+            updated = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(job['updated_at']))
+            error = f"  {job['last_error']}" if job['last_error'] else ''
+            print(f"{job['id']:>6} {job['state']:<8} {job['kind']:<14} attempts={job['attempts']}/{job['max_attempts']} "
+                  f"{updated} {json.dumps(job['args'], ensure_ascii=False)}{error}")
+    else:
+        print(f"requeued {store.requeue(args.ids or None)} job(s)")
+    return 0
@@ -0,0 +1,104 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Detect and report code that blocks the asyncio event loop.
+"""
+
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from .logger import logger
+
+
+class LoopLagMonitor:
+    def __init__(self, loop: asyncio.AbstractEventLoop, threshold: float = 0.2, interval: float | None = None):
+        self.loop = loop
+        self.threshold = threshold
+        self.interval = interval or max(threshold / 4, 0.01)
+        self.max_lag = 0.0
+        self.stall_count = 0
+        self._loop_thread_id = threading.get_ident()
+        self._pending_since: float | None = None
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._watch, name='loop-lag-monitor', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def _beat(self) -> None:
+        if self._pending_since is not None:
+            self.max_lag = max(self.max_lag, time.monotonic() - self._pending_since)
+        self._pending_since = None
+
+    def _watch(self) -> None:
+        reported = False
+        while not self._stop_event.wait(self.interval):
+            if self.loop.is_closed():
+                break
+            if not self.loop.is_running():
+                self._pending_since = None
+                continue
+
+            pending_since = self._pending_since
+            if pending_since is None:
+                self._pending_since = time.monotonic()
+                try:
+                    self.loop.call_soon_threadsafe(self._beat)
+                except RuntimeError:
+                    break
+                reported = False
+            elif not reported and time.monotonic() - pending_since > self.threshold:
+                self._report(time.monotonic() - pending_since)
+                reported = True
+
+    def _report(self, lag: float) -> None:
+        self.stall_count += 1
+        task_name = None
+        try:
+            task = asyncio.current_task(self.loop)
+            if task is not None:
+                task_name = f"{task.get_name()} {task.get_coro()!r}"
+        except RuntimeError:
+            pass
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = ''.join(traceback.format_stack(frame)) if frame else 'unavailable'
+        logger.warning(
+            f"Event loop blocked for {lag * 1000:.0f} ms (threshold {self.threshold * 1000:.0f} ms), "
+            f"task: {task_name}\n{stack}"
+        )
+
+
+class MonitoredEventLoopPolicy(asyncio.DefaultEventLoopPolicy):
+    def __init__(self, threshold: float = 0.2):
+        super().__init__()
+        self.threshold = threshold
+        self.monitors: list[LoopLagMonitor] = []
+
+    def new_event_loop(self) -> asyncio.AbstractEventLoop:
+        loop = super().new_event_loop()
+        monitor = LoopLagMonitor(loop, self.threshold)
+        monitor.start()
+        self.monitors.append(monitor)
+        if len(self.monitors) > 64:
+            self.monitors = [m for m in self.monitors if not m.loop.is_closed()]
+        original_close = loop.close
+
+        def close() -> None:
+            monitor.stop()
+            original_close()
+
+        loop.close = close
+        return loop
+
+
+def install_loop_monitor(threshold_ms: float = 200) -> MonitoredEventLoopPolicy:
+    policy = MonitoredEventLoopPolicy(threshold_ms / 1000)
+    asyncio.set_event_loop_policy(policy)
+    logger.debug(f"Event loop blocking detector enabled, threshold: {threshold_ms} ms")
+    return policy
@@ -0,0 +1,81 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: In-process metrics registry with an optional Prometheus text endpoint.
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .logger import logger
+
+
+def _label_key(labels: dict | None) -> tuple:
+    return tuple(sorted((labels or {}).items()))
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._values: dict[str, dict[tuple, float]] = {}
+        self._help: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def set(self, name: str, value: float, labels: dict | None = None, help_text: str = '') -> None:
+        with self._lock:
+            self._values.setdefault(name, {})[_label_key(labels)] = value
+            if help_text:
+                self._help[name] = help_text
+
+    def remove(self, labels: dict) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            for series in self._values.values():
+                series.pop(key, None)
+
+    def snapshot(self) -> dict[str, dict[tuple, float]]:
+        with self._lock:
+            return {name: dict(series) for name, series in self._values.items()}
+
+    def render(self) -> str:
+        lines = []
+        for name, series in sorted(self.snapshot().items()):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in series.items():
+                label_text = ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer | None:
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logger.error(f"Metrics server failed to start on {host}:{port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info(f"Metrics available at http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,116 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Inspect MP4 box layout and move the moov box of a finished recording to the front of the file
+(faststart) by patching chunk offsets, without demuxing or re-muxing the media data.
+"""
+
+import os
+import struct
+from typing import BinaryIO
+from .logger import logger
+
+CONTAINER_BOXES = (b'moov', b'trak', b'mdia', b'minf', b'stbl', b'edts', b'dinf', b'mvex')
+COPY_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def iter_boxes(f: BinaryIO, start: int = 0, end: int | None = None):
+    """Yield (box_type, offset, size) for the boxes between start and end."""
+    if end is None:
+        end = os.fstat(f.fileno()).st_size
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        size, box_type = struct.unpack('>I4s', f.read(8))
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+        elif size == 0:
+            size = end - offset
+        if size < 8 or offset + size > end:
+            break
+        yield box_type, offset, size
+        offset += size
+
+
+def read_layout(path: str) -> list[tuple[bytes, int, int]]:
+    with open(path, 'rb') as f:
+        return list(iter_boxes(f))
+
+
+def is_fragmented(path: str) -> bool:
+    with open(path, 'rb') as f:
+        return any(box_type == b'moof' for box_type, _, _ in iter_boxes(f))
+
+
+def _patch_chunk_offsets(data: bytearray, start: int, end: int, shift: int) -> bool:
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, offset)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            return False
+        if box_type in CONTAINER_BOXES:
+            if not _patch_chunk_offsets(data, offset + header, offset + size, shift):
+                return False
+        elif box_type in (b'stco', b'co64'):
+            count = struct.unpack_from('>I', data, offset + header + 4)[0]
+            fmt, width = ('>I', 4) if box_type == b'stco' else ('>Q', 8)
+            position = offset + header + 8
+            for _ in range(count):
+                value = struct.unpack_from(fmt, data, position)[0] + shift
+                if box_type == b'stco' and value > 0xFFFFFFFF:
+                    # would need a co64 upgrade, which changes the moov size again
+                    return False
+                struct.pack_into(fmt, data, position, value)
+                position += width
+        offset += size
+    return True
+
+
+def _copy_range(src: BinaryIO, dst: BinaryIO, offset: int, length: int) -> None:
+    src.seek(offset)
+    while length > 0:
+        chunk = src.read(min(COPY_CHUNK_SIZE, length))
+        if not chunk:
+            break
+        dst.write(chunk)
+        length -= len(chunk)
+
+
+def faststart(path: str) -> bool:
+    """Rewrite path with moov ahead of mdat. Returns True when the file is (already) faststart."""
+    layout = read_layout(path)
+    types = [box_type for box_type, _, _ in layout]
+    if b'moov' not in types or b'mdat' not in types:
+        logger.warning(f"Not a complete MP4, skip faststart: {path}")
+        return False
+    if b'moof' in types or types.index(b'moov') < types.index(b'mdat'):
+        return True
+
+    _, moov_offset, moov_size = layout[types.index(b'moov')]
+    head = layout[0] if types[0] == b'ftyp' else None
+    temp_path = path + '.faststart'
+    try:
+        with open(path, 'rb') as src:
+            src.seek(moov_offset)
+            moov = bytearray(src.read(moov_size))
+            if not _patch_chunk_offsets(moov, 0, len(moov), moov_size):
+                logger.warning(f"Chunk offsets cannot be shifted in place, skip faststart: {path}")
+                return False
+            with open(temp_path, 'wb') as dst:
+                if head:
+                    _copy_range(src, dst, head[1], head[2])
+                dst.write(moov)
+                for box in layout:
+                    if box is not head and box[0] != b'moov':
+                        _copy_range(src, dst, box[1], box[2])
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return True
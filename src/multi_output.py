@@ -0,0 +1,41 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Build extra ffmpeg outputs (audio-only, low-bitrate preview) that share the recording's single input pull.
+"""
+
+import os
+
+EXTRA_OUTPUTS = {
+    'mp3': ('.mp3', ['-map', '0:a', '-vn', '-c:a', 'libmp3lame', '-ab', '320k']),
+    'm4a': ('.m4a', ['-map', '0:a', '-vn', '-c:a', 'aac', '-ab', '320k',
+                     '-movflags', '+frag_keyframe+empty_moov', '-f', 'mp4']),
+    'preview': ('_preview.ts', ['-map', '0:v?', '-map', '0:a?', '-c:v', 'libx264', '-preset', 'veryfast',
+                                '-b:v', '600k', '-maxrate', '800k', '-bufsize', '1600k', '-vf', 'scale=-2:360',
+                                '-c:a', 'aac', '-ab', '64k', '-f', 'mpegts']),
+}
+
+
+def parse_extra_outputs(value: str) -> list[str]:
+    names = []
+    for name in value.replace('，', ',').split(','):
+        name = name.strip().lower()
+        if name in EXTRA_OUTPUTS and name not in names:
+            names.append(name)
+    return names
+
+
+def get_extra_output_path(save_file_path: str, name: str) -> str:
+    file_root = os.path.splitext(save_file_path.replace('_%03d', ''))[0]
+    return file_root + EXTRA_OUTPUTS[name][0]
+
+
+def build_extra_outputs(save_file_path: str, names: list[str]) -> list[str]:
+    args = []
+    for name in names:
+        args += [*EXTRA_OUTPUTS[name][1], get_extra_output_path(save_file_path, name)]
+    return args
+
+
+def is_extra_output_path(path: str) -> bool:
+    return path.endswith(tuple(suffix for suffix, _ in EXTRA_OUTPUTS.values()))
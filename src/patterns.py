@@ -0,0 +1,52 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Precompiled regular expressions and memoized URL helpers for hot paths.
+"""
+
+import re
+from functools import lru_cache
+from types import MappingProxyType
+from urllib.parse import parse_qs, urlsplit
+
+OptionalStr = str | None
+
+EMOJI_PATTERN = re.compile(
+    "["
+    "\U0001F1E0-\U0001F1FF"  # flags (iOS)
+    "\U0001F300-\U0001F5FF"  # symbols & pictographs
+    "\U0001F600-\U0001F64F"  # emoticons
+    "\U0001F680-\U0001F6FF"  # transport & map symbols
+    "\U0001F700-\U0001F77F"  # alchemical symbols
+    "\U0001F780-\U0001F7FF"  # Geometric Shapes Extended
+    "\U0001F800-\U0001F8FF"  # Supplemental Arrows-C
+    "\U0001F900-\U0001F9FF"  # Supplemental Symbols and Pictographs
+    "\U0001FA00-\U0001FA6F"  # Chess Symbols
+    "\U0001FA70-\U0001FAFF"  # Symbols and Pictographs Extended-A
+    "\U00002702-\U000027B0"  # Dingbats
+    "]+",
+    flags=re.UNICODE
+)
+FILENAME_ILLEGAL_PATTERN = re.compile(r"[\/\\\:\*\？?\"\<\>\|&#.。,， ~！· ]")
+URL_PATTERN = re.compile(r"(https?://)?(www\.)?[a-zA-Z0-9-]+(\.[a-zA-Z0-9-]+)+(:\d+)?(/.*)?")
+COMMA_PATTERN = re.compile("[,，]")
+JSONP_PATTERN = re.compile(r'(\w+)\((.*)\);?$')
+XHS_HOST_ID_PATTERN = re.compile("&host_id=(.*?)(?=&|$)")
+
+URL_CACHE_SIZE = 4096
+EMPTY_QUERY = MappingProxyType({})
+
+
+@lru_cache(maxsize=URL_CACHE_SIZE)
+def parse_query(url: str) -> MappingProxyType:
+    query = urlsplit(url).query
+    if not query:
+        return EMPTY_QUERY
+    return MappingProxyType({key: tuple(values) for key, values in parse_qs(query).items()})
+
+
+def get_query_param(url: OptionalStr, param_name: str) -> OptionalStr:
+    if not url:
+        return None
+    values = parse_query(url).get(param_name)
+    return values[0] if values else None
@@ -0,0 +1,157 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Run post-recording conversions on a bounded, priority-ordered worker pool at low OS priority,
+so that a backlog of remuxes and transcodes never competes with live recordings for CPU.
+"""
+
+import functools
+import itertools
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable
+from .logger import logger
+from .metrics import metrics
+
+PRIORITY_REMUX = 0
+PRIORITY_ENCODE = 10
+
+REMUX_NICE = 5
+ENCODE_NICE = 19
+DURATION_SMOOTHING = 0.3
+
+
+def default_workers() -> int:
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+    return max(1, cores // 4)
+
+
+@functools.lru_cache(maxsize=1)
+def _ionice_path() -> str | None:
+    return shutil.which('ionice') if os.name != 'nt' else None
+
+
+@functools.lru_cache(maxsize=1)
+def _nice_path() -> str | None:
+    return shutil.which('nice') if os.name != 'nt' else None
+
+
+def low_priority_command(command: list, priority: int = PRIORITY_REMUX) -> tuple[list, dict]:
+    """Return the command and Popen kwargs that run it below live recordings in CPU and IO priority."""
+    is_encode = priority >= PRIORITY_ENCODE
+    if os.name == 'nt':
+        flag = subprocess.IDLE_PRIORITY_CLASS if is_encode else subprocess.BELOW_NORMAL_PRIORITY_CLASS
+        return command, {'creationflags': flag}
+    if _ionice_path():
+        # idle IO class for encodes, lowest best-effort level for remuxes
+        command = [_ionice_path(), '-c', '3', *command] if is_encode else \
+            [_ionice_path(), '-c', '2', '-n', '7', *command]
+    if _nice_path():
+        # a wrapper rather than preexec_fn, which can deadlock the fork while other threads hold locks
+        command = [_nice_path(), '-n', str(ENCODE_NICE if is_encode else REMUX_NICE), *command]
+    return command, {}
+
+
+def run_low_priority(command: list, priority: int = PRIORITY_REMUX, **kwargs) -> bytes:
+    command, priority_kwargs = low_priority_command(command, priority)
+    return subprocess.check_output(command, **priority_kwargs, **kwargs)
+
+
+@dataclass(order=True)
+class PostProcessJob:
+    priority: int
+    sequence: int
+    name: str = field(compare=False)
+    func: Callable = field(compare=False)
+    args: tuple = field(compare=False)
+    future: Future = field(compare=False, default_factory=Future)
+    submitted_at: float = field(compare=False, default_factory=time.monotonic)
+    started_at: float | None = field(compare=False, default=None)
+
+
+class PostProcessPool:
+    def __init__(self, workers: int | None = None, name: str = 'postprocess'):
+        self.workers = workers or default_workers()
+        self.name = name
+        self._queue: queue.PriorityQueue[PostProcessJob] = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._running: dict[int, PostProcessJob] = {}
+        self._durations: dict[int, float] = {}
+        self._threads: list[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def _ensure_workers(self) -> None:
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f'{self.name}-{len(self._threads)}', daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def submit(self, func: Callable, *args, priority: int = PRIORITY_REMUX, name: str | None = None) -> Future:
+        job = PostProcessJob(priority, next(self._sequence), name or getattr(func, '__name__', 'job'), func, args)
+        self._queue.put(job)
+        self._ensure_workers()
+        self._update_metrics()
+        return job.future
+
+    def _work(self) -> None:
+        while True:
+            job = self._queue.get()
+            job.started_at = time.monotonic()
+            with self._lock:
+                self._running[job.sequence] = job
+            self._update_metrics()
+            try:
+                job.future.set_result(job.func(*job.args))
+            except Exception as e:
+                logger.error(f"Post-processing job {job.name} failed: {e}")
+                job.future.set_exception(e)
+            finally:
+                duration = time.monotonic() - job.started_at
+                with self._lock:
+                    self._running.pop(job.sequence, None)
+                    previous = self._durations.get(job.priority)
+                    self._durations[job.priority] = duration if previous is None else \
+                        previous + DURATION_SMOOTHING * (duration - previous)
+                self._update_metrics()
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def running(self) -> int:
+        return len(self._running)
+
+    def eta(self) -> float | None:
+        """Estimate seconds until the backlog drains, from the smoothed duration of past jobs per priority."""
+        with self._lock:
+            pending = [job.priority for job in list(self._queue.queue)]
+            running = list(self._running.values())
+            durations = dict(self._durations)
+        if not pending and not running:
+            return 0.0
+        if any(p not in durations for p in pending + [job.priority for job in running]):
+            return None
+        now = time.monotonic()
+        work = sum(durations[p] for p in pending)
+        work += sum(max(0.0, durations[job.priority] - (now - job.started_at)) for job in running)
+        return work / self.workers
+
+    def summary(self) -> str:
+        eta = self.eta()
+        eta_text = '未知' if eta is None else time.strftime('%H:%M:%S', time.gmtime(eta))
+        return f"后处理队列: 等待 {self.pending} 运行 {self.running}/{self.workers} 预计剩余 {eta_text}"
+
+    def _update_metrics(self) -> None:
+        metrics.set(f'{self.name}_queue_depth', self.pending, help_text=f'{self.name} jobs waiting')
+        metrics.set(f'{self.name}_running', self.running, help_text=f'{self.name} jobs running')
+
+
+postprocess_pool = PostProcessPool()
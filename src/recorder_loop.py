@@ -0,0 +1,29 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Shared background event loop that hosts the in-process stream recorders.
+"""
+
+import asyncio
+import threading
+from typing import Any
+
+
+class RecorderLoop:
+    def __init__(self, name: str = 'stream-recorder'):
+        self.name = name
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._lock = threading.Lock()
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name=self.name, daemon=True).start()
+            return self._loop
+
+    def run(self, coro) -> Any:
+        return asyncio.run_coroutine_threadsafe(coro, self.get_loop()).result()
+
+
+recorder_loop = RecorderLoop()
@@ -9,7 +9,6 @@ Copyright (c) 2023 by Hmily, All Rights Reserved.
 """
 import re
 import urllib.parse
-import execjs
 import httpx
 import urllib.request
 from . import JS_SCRIPT_PATH, utils
@@ -43,8 +42,8 @@ async def get_xbogus(url: str, headers: dict | None = None) -> str:
     if not headers or 'user-agent' not in (k.lower() for k in headers):
         headers = HEADERS
     query = urllib.parse.urlparse(url).query
-    xbogus = execjs.compile(open(f'{JS_SCRIPT_PATH}/x-bogus.js').read()).call(
-        'sign', query, headers.get("User-Agent", "user-agent"))
+    xbogus = await utils.run_blocking(
+        utils.call_js, f'{JS_SCRIPT_PATH}/x-bogus.js', 'sign', query, headers.get("User-Agent", "user-agent"))
     return xbogus
 
 
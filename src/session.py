@@ -0,0 +1,138 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Group the files a room produces across reconnects into one recording session with a manifest.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Callable
+from .logger import logger
+
+SESSION_GAP = 180
+
+
+class RecordingSession:
+    def __init__(self, key: str, record_name: str, save_type: str, script_command: str | None = None):
+        self.key = key
+        self.record_name = record_name
+        self.save_type = save_type
+        self.script_command = script_command
+        self.files: list[dict] = []
+        self.output_path: str | None = None
+        self.started_at = time.time()
+        self.last_end = self.started_at
+        self.closed = False
+
+    @property
+    def file_paths(self) -> list[str]:
+        return [item['path'] for item in self.files]
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.splitext(self.files[0]['path'])[0] + '.session.json'
+
+    def add_file(self, path: str, started_at: float | None = None, digest: str | None = None,
+                 platform: str | None = None, anchor: str | None = None) -> None:
+        self.last_end = time.time()
+        started_at = started_at or self.last_end
+        self.files.append({
+            'path': path,
+            'size': os.path.getsize(path) if os.path.exists(path) else 0,
+            'hash': digest,
+            'platform': platform,
+            'anchor': anchor,
+            'started_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started_at)),
+            'finished_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.last_end)),
+            'duration': round(self.last_end - started_at, 3),
+        })
+        self.write_manifest()
+
+    def write_manifest(self) -> None:
+        manifest = {
+            'room': self.key,
+            'record_name': self.record_name,
+            'save_type': self.save_type,
+            'state': 'closed' if self.closed else 'open',
+            'started_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started_at)),
+            'updated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'files': self.files,
+            'output': self.output_path,
+        }
+        temp_path = self.manifest_path + '.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.manifest_path)
+        except OSError as e:
+            logger.warning(f"Failed to write session manifest {self.manifest_path}: {e}")
+
+
+class SessionManager:
+    def __init__(
+            self,
+            on_close: Callable[[RecordingSession], None],
+            gap: float = SESSION_GAP,
+            is_active: Callable[[RecordingSession], bool] | None = None
+    ):
+        self.on_close = on_close
+        self.gap = gap
+        self.is_active = is_active or (lambda session: False)
+        self._sessions: dict[str, RecordingSession] = {}
+        self._lock = threading.Lock()
+
+    def add(self, key: str, record_name: str, save_file_path: str, save_type: str,
+            script_command: str | None = None, **file_info) -> RecordingSession:
+        """Attach a finished file to the room's open session, starting a new session if there is none."""
+        expired = None
+        with self._lock:
+            session = self._sessions.get(key)
+            if session and session.save_type != save_type:
+                expired = self._sessions.pop(key)
+                session = None
+            if session is None:
+                session = RecordingSession(key, record_name, save_type, script_command)
+                self._sessions[key] = session
+            session.add_file(save_file_path, **file_info)
+        if expired:
+            self._close(expired)
+        self._schedule(session)
+        return session
+
+    def _schedule(self, session: RecordingSession) -> None:
+        delay = max(0.0, session.last_end + self.gap - time.time())
+        timer = threading.Timer(delay, self._expire, args=(session,))
+        timer.daemon = True
+        timer.start()
+
+    def _expire(self, session: RecordingSession) -> None:
+        with self._lock:
+            if self._sessions.get(session.key) is not session or time.time() - session.last_end < self.gap:
+                # superseded, or a newer file pushed the deadline back
+                return
+            if self.is_active(session):
+                session.last_end = time.time()
+                retry = True
+            else:
+                del self._sessions[session.key]
+                retry = False
+        if retry:
+            self._schedule(session)
+        else:
+            self._close(session)
+
+    def close(self, key: str) -> None:
+        with self._lock:
+            session = self._sessions.pop(key, None)
+        if session:
+            self._close(session)
+
+    def _close(self, session: RecordingSession) -> None:
+        session.closed = True
+        try:
+            self.on_close(session)
+        except Exception as e:
+            logger.error(f"Failed to finish recording session {session.record_name}: {e}")
+        session.write_manifest()
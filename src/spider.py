@@ -9,6 +9,7 @@ Copyright (c) 2023-2025 by Hmily, All Rights Reserved.
 Function: Get live stream data.
 """
 
+import asyncio
 import hashlib
 import random
 import subprocess
@@ -29,6 +30,8 @@ from .utils import trace_error_decorator, generate_random_string
 from .logger import script_path
 from .room import get_sec_user_id, get_unique_id, UnsupportedUrlError
 from .http_clients.async_http import async_req
+from .hls import get_master_variants
+from .patterns import get_query_param
 from .ab_sign import ab_sign
 
 
@@ -40,29 +43,13 @@ OptionalDict = dict | None
 
 
 def get_params(url: str, params: str) -> OptionalStr:
-    parsed_url = urllib.parse.urlparse(url)
-    query_params = urllib.parse.parse_qs(parsed_url.query)
-
-    if params in query_params:
-        return query_params[params][0]
+    return get_query_param(url, params)
 
 
 async def get_play_url_list(m3u8: str, proxy: OptionalStr = None, header: OptionalDict = None,
                             abroad: bool = False) -> List[str]:
-    resp = await async_req(url=m3u8, proxy_addr=proxy, headers=header, abroad=abroad)
-    play_url_list = []
-    for i in resp.split('\n'):
-        if i.startswith('https://'):
-            play_url_list.append(i.strip())
-    if not play_url_list:
-        for i in resp.split('\n'):
-            if i.strip().endswith('m3u8'):
-                play_url_list.append(i.strip())
-    bandwidth_pattern = re.compile(r'BANDWIDTH=(\d+)')
-    bandwidth_list = bandwidth_pattern.findall(resp)
-    url_to_bandwidth = {url: int(bandwidth) for bandwidth, url in zip(bandwidth_list, play_url_list)}
-    play_url_list = sorted(play_url_list, key=lambda url: url_to_bandwidth[url], reverse=True)
-    return play_url_list
+    variants = await get_master_variants(m3u8, proxy=proxy, header=header, abroad=abroad)
+    return [variant.uri for variant in variants]
 
 
 async def get_douyin_web_stream_data(url: str, proxy_addr: OptionalStr = None, cookies: OptionalStr = None):
@@ -294,7 +281,7 @@ async def get_tiktok_stream_data(url: str, proxy_addr: OptionalStr = None, cooki
 
     for i in range(3):
         html_str = await async_req(url=url, proxy_addr=proxy_addr, headers=headers, abroad=True, http2=False)
-        time.sleep(1)
+        await asyncio.sleep(1)
         if "We regret to inform you that we have discontinued operating TikTok" in html_str:
             msg = re.search('<p>\n\\s+(We regret to inform you that we have discontinu.*?)\\.\n\\s+</p>', html_str)
             raise ConnectionError(
@@ -527,19 +514,20 @@ async def get_token_js(rid: str, did: str, proxy_addr: OptionalStr = None) -> Li
     html_str = await async_req(url=url, proxy_addr=proxy_addr)
     result = re.search(r'(vdwdae325w_64we[\s\S]*function ub98484234[\s\S]*?)function', html_str).group(1)
     func_ub9 = re.sub(r'eval.*?;}', 'strc;}', result)
-    js = execjs.compile(func_ub9)
-    res = js.call('ub98484234')
 
-    t10 = str(int(time.time()))
-    v = re.search(r'v=(\d+)', res).group(1)
-    rb = md5(rid + did + t10 + v)
+    def sign_params() -> str:
+        res = execjs.compile(func_ub9).call('ub98484234')
 
-    func_sign = re.sub(r'return rt;}\);?', 'return rt;}', res)
-    func_sign = func_sign.replace('(function (', 'function sign(')
-    func_sign = func_sign.replace('CryptoJS.MD5(cb).toString()', '"' + rb + '"')
+        t10 = str(int(time.time()))
+        v = re.search(r'v=(\d+)', res).group(1)
+        rb = md5(rid + did + t10 + v)
 
-    js = execjs.compile(func_sign)
-    params = js.call('sign', rid, did, t10)
+        func_sign = re.sub(r'return rt;}\);?', 'return rt;}', res)
+        func_sign = func_sign.replace('(function (', 'function sign(')
+        func_sign = func_sign.replace('CryptoJS.MD5(cb).toString()', '"' + rb + '"')
+        return execjs.compile(func_sign).call('sign', rid, did, t10)
+
+    params = await utils.run_blocking(sign_params)
     params_list = re.findall('=(.*?)(?=&|$)', params)
     return params_list
 
@@ -1045,31 +1033,19 @@ async def _fetch_web_stream_data_global(url: str, proxy_addr: OptionalStr = None
     if not status:
         return result
     else:
-        async def _get_url_list(m3u8: str) -> list[str]:
-            headers = {
-                'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
-                              'Chrome/141.0.0.0 Safari/537.36 Edg/141.0.0.0',
-            }
-            if cookies:
-                headers['cookie'] = cookies
-            resp = await async_req(url=m3u8, proxy_addr=proxy_addr, headers=headers)
-            play_url_list = []
-            url_prefix = '/'.join(m3u8.split('/')[0:3])
-            for i in resp.split('\n'):
-                if not i.startswith('#') and i.strip():
-                    play_url_list.append(url_prefix + i.strip())
-            bandwidth_pattern = re.compile(r'BANDWIDTH=(\d+)')
-            bandwidth_list = bandwidth_pattern.findall(resp)
-            url_to_bandwidth = {purl: int(bandwidth) for bandwidth, purl in zip(bandwidth_list, play_url_list)}
-            play_url_list = sorted(play_url_list, key=lambda purl: url_to_bandwidth[purl], reverse=True)
-            return play_url_list
+        headers = {
+            'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+                          'Chrome/141.0.0.0 Safari/537.36 Edg/141.0.0.0',
+        }
+        if cookies:
+            headers['cookie'] = cookies
 
         m3u8_url = 'https://global-media.sooplive.com/live/' + str(bj_id) + '/master.m3u8'
         result |= {
             'is_live': True,
             'title': title,
             'm3u8_url': m3u8_url,
-            'play_url_list': await _get_url_list(m3u8_url)
+            'play_url_list': await get_play_url_list(m3u8_url, proxy=proxy_addr, header=headers)
         }
     return result
 
@@ -1118,17 +1094,7 @@ async def get_sooplive_stream_data(
     result = {"anchor_name": anchor_name or '' ,"is_live": False}
 
     async def get_url_list(m3u8: str) -> List[str]:
-        resp = await async_req(url=m3u8, proxy_addr=proxy_addr, headers=headers, abroad=True)
-        play_url_list = []
-        url_prefix = m3u8.rsplit('/', maxsplit=1)[0] + '/'
-        for i in resp.split('\n'):
-            if i.startswith('auth_playlist'):
-                play_url_list.append(url_prefix + i.strip())
-        bandwidth_pattern = re.compile(r'BANDWIDTH=(\d+)')
-        bandwidth_list = bandwidth_pattern.findall(resp)
-        url_to_bandwidth = {purl: int(bandwidth) for bandwidth, purl in zip(bandwidth_list, play_url_list)}
-        play_url_list = sorted(play_url_list, key=lambda purl: url_to_bandwidth[purl], reverse=True)
-        return play_url_list
+        return await get_play_url_list(m3u8, proxy=proxy_addr, header=headers, abroad=True)
 
     if not anchor_name:
         async def handle_login() -> OptionalStr:
@@ -2222,8 +2188,8 @@ async def get_liveme_stream_url(url: str, proxy_addr: OptionalStr = None, cookie
             url = match_url.group(1)
 
     room_id = url.split("/index.html")[0].rsplit('/', maxsplit=1)[-1]
-    sign_data = execjs.compile(open(f'{JS_SCRIPT_PATH}/liveme.js').read()).call('sign', room_id,
-                                                                                f'{JS_SCRIPT_PATH}/crypto-js.min.js')
+    sign_data = await utils.run_blocking(utils.call_js, f'{JS_SCRIPT_PATH}/liveme.js', 'sign', room_id,
+                                         f'{JS_SCRIPT_PATH}/crypto-js.min.js')
     lm_s_sign = sign_data.pop("lm_s_sign")
     tongdun_black_box = sign_data.pop("tongdun_black_box")
     platform = sign_data.pop("os")
@@ -2745,8 +2711,8 @@ async def get_haixiu_stream_url(url: str, proxy_addr: OptionalStr = None, cookie
         "c": "10138100100000",
         "_st1": int(time.time() * 1000)
     }
-    ajax_data = execjs.compile(open(f'{JS_SCRIPT_PATH}/haixiu.js').read()).call('sign', params,
-                                                                                f'{JS_SCRIPT_PATH}/crypto-js.min.js')
+    ajax_data = await utils.run_blocking(utils.call_js, f'{JS_SCRIPT_PATH}/haixiu.js', 'sign', params,
+                                         f'{JS_SCRIPT_PATH}/crypto-js.min.js')
 
     params["accessToken"] = urllib.parse.unquote(urllib.parse.unquote(access_token))
     params['_ajaxData1'] = ajax_data
@@ -3066,7 +3032,7 @@ async def get_taobao_stream_url(url: str, proxy_addr: OptionalStr = None, cookie
         _m_h5_tk = re.findall('_m_h5_tk=(.*?);', headers['Cookie'])[0]
         t13 = int(time.time() * 1000)
         pre_sign_str = f'{_m_h5_tk.split("_")[0]}&{t13}&{app_key}&' + params['data']
-        sign = execjs.compile(open(f'{JS_SCRIPT_PATH}/taobao-sign.js').read()).call('sign', pre_sign_str)
+        sign = await utils.run_blocking(utils.call_js, f'{JS_SCRIPT_PATH}/taobao-sign.js', 'sign', pre_sign_str)
         params |= {'sign': sign, 't': t13}
         api = f'https://h5api.m.taobao.com/h5/mtop.mediaplatform.live.livedetail/4.0/?{urllib.parse.urlencode(params)}'
         jsonp_str, new_cookie = await async_req(url=api, proxy_addr=proxy_addr, headers=headers, timeout=20,
@@ -3250,15 +3216,17 @@ async def get_migu_stream_url(url: str, proxy_addr: OptionalStr = None, cookies:
 
         async def _get_dd_calcu(url):
             try:
-                result = subprocess.run(
-                    ["node", f"{JS_SCRIPT_PATH}/migu.js", url],
-                    capture_output=True,
-                    text=True,
-                    check=True
+                process = await asyncio.create_subprocess_exec(
+                    "node", f"{JS_SCRIPT_PATH}/migu.js", url,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
                 )
-                return result.stdout.strip()
-            except execjs.ProgramError:
+                stdout, stderr = await process.communicate()
+            except OSError:
                 raise execjs.ProgramError('Failed to execute JS code. Please check if the Node.js environment')
+            if process.returncode != 0:
+                raise subprocess.CalledProcessError(process.returncode, "node", stdout, stderr)
+            return stdout.decode().strip()
 
         ddCalcu = await _get_dd_calcu(source_url)
         real_source_url = f'{source_url}&ddCalcu={ddCalcu}&sv=10010'
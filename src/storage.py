@@ -0,0 +1,356 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Watch free space on the recording volume, enforce per-platform and per-anchor quotas, prune finished
+recordings by retention policy, and decide whether a recording may start or must pause.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+from .catalog import Catalog, FILE_CLOSED, FILE_RECORDING
+from .logger import logger
+from .metrics import metrics
+
+GB = 1024 ** 3
+STORAGE_CHECK_INTERVAL = 15
+STORAGE_SCAN_INTERVAL = 600
+# files touched this recently may still be written or post-processed
+ACTIVE_GRACE = 600
+SIDECAR_SUFFIXES = ('.session.json', '.manifest.json', '.probe.json')
+# only these are ever counted or pruned, in case the save path is shared with other files
+RECORDING_EXTENSIONS = ('.ts', '.flv', '.mkv', '.mp4', '.mp3', '.m4a', '.srt', '.ass')
+
+STATE_OK = 'ok'
+STATE_LOW = 'low'
+STATE_FULL = 'full'
+
+
+@dataclass
+class RetentionPolicy:
+    max_age_days: float = 0
+    max_count: int = 0
+    max_total_gb: float = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_age_days or self.max_count or self.max_total_gb)
+
+
+@dataclass
+class RecordingGroup:
+    """Files of one finished recording: a closed session, or a recording and its sidecars."""
+    key: str
+    paths: set[str] = field(default_factory=set)
+    size: int = 0
+    mtime: float = 0.0
+    platform: str | None = None
+    anchor: str | None = None
+    hashes: dict[str, str] = field(default_factory=dict)
+
+
+def parse_quotas(value: str) -> dict[str, float]:
+    """Parse '抖音直播:100, B站直播:50' into {name: gigabytes}."""
+    quotas = {}
+    for item in value.replace('，', ',').split(','):
+        name, sep, size = item.rpartition(':')
+        try:
+            if sep and name.strip():
+                quotas[name.strip()] = float(size)
+        except ValueError:
+            continue
+    return quotas
+
+
+def parse_names(value: str) -> list[str]:
+    return [name.strip() for name in value.replace('，', ',').split(',') if name.strip()]
+
+
+def group_key(path: str) -> str:
+    for suffix in SIDECAR_SUFFIXES:
+        if path.endswith(suffix):
+            path = path[:-len(suffix)]
+            break
+    return os.path.splitext(path)[0]
+
+
+def is_recording_file(filename: str) -> bool:
+    return filename.endswith(SIDECAR_SUFFIXES) or os.path.splitext(filename)[1].lower() in RECORDING_EXTENSIONS
+
+
+def walk_recordings(root: str) -> list[str]:
+    return [os.path.join(directory, filename) for directory, _, filenames in os.walk(root)
+            for filename in filenames if is_recording_file(filename)]
+
+
+def catalog_recordings(root: str, catalog: Catalog) -> tuple[list[str], dict[str, tuple]]:
+    """Recordings under root from the catalog, with the sidecars written next to them, and their room info."""
+    paths, origins = [], {}
+    for row in catalog.query(under=root, state=(FILE_RECORDING, FILE_CLOSED)):
+        path, key = row['path'], group_key(row['path'])
+        origins[path] = (row['platform'], row['anchor'])
+        paths.append(path)
+        paths += [path + '.probe.json', key + '.srt', key + '.ass', key + '.manifest.json', key + '.session.json']
+    return list(dict.fromkeys(paths)), origins
+
+
+def collect_recordings(root: str, anchor_dirs: bool = False, catalog: Catalog | None = None) -> list[RecordingGroup]:
+    """Group the recordings under root, oldest first. Groups of open sessions count as just modified."""
+    groups: dict[str, RecordingGroup] = {}
+    sessions: list[tuple[str, dict]] = []
+    origins: dict[str, tuple] = {}
+    if catalog:
+        paths, origins = catalog_recordings(root, catalog)
+    else:
+        paths = walk_recordings(root)
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            if path in origins:
+                # deleted behind the recorder's back
+                catalog.remove_file(path)
+            continue
+        group = groups.setdefault(group_key(path), RecordingGroup(group_key(path)))
+        group.paths.add(path)
+        group.size += stat.st_size
+        group.mtime = max(group.mtime, stat.st_mtime)
+        if path in origins:
+            group.platform = group.platform or origins[path][0]
+            group.anchor = group.anchor or origins[path][1]
+        if path.endswith('.session.json'):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    sessions.append((path, json.load(f)))
+            except (OSError, ValueError):
+                pass
+
+    # a session spans the files of several reconnects, so they are kept, pruned or moved together
+    for manifest_path, manifest in sessions:
+        session = groups.get(group_key(manifest_path))
+        if session is None:
+            continue
+        for item in manifest.get('files', []):
+            member_key = group_key(item.get('path', ''))
+            member = groups.pop(member_key, None) if member_key != session.key else None
+            if member:
+                session.paths |= member.paths
+                session.size += member.size
+                session.mtime = max(session.mtime, member.mtime)
+            # a hash is stale once the file was merged with the rest of its session
+            if item.get('hash') and os.path.exists(item['path']) and os.path.getsize(item['path']) == item.get('size'):
+                session.hashes[item['path']] = item['hash']
+            session.platform = session.platform or item.get('platform')
+            session.anchor = session.anchor or item.get('anchor')
+        if manifest.get('state') != 'closed':
+            session.mtime = time.time()
+
+    for group in groups.values():
+        parts = os.path.relpath(next(iter(group.paths)), root).split(os.sep)
+        group.platform = group.platform or (parts[0] if len(parts) > 1 else None)
+        group.anchor = group.anchor or (parts[1] if anchor_dirs and len(parts) > 2 else None)
+    return sorted(groups.values(), key=lambda g: g.mtime)
+
+
+class StorageManager:
+    def __init__(
+            self,
+            root: str,
+            hard_limit_gb: float,
+            soft_limit_gb: float = 0,
+            platform_quotas: dict[str, float] | None = None,
+            anchor_quotas: dict[str, float] | None = None,
+            retention: RetentionPolicy | None = None,
+            low_priority: list[str] | None = None,
+            anchor_dirs: bool = False,
+            on_pause: Callable[[], None] | None = None,
+            catalog: Catalog | None = None,
+    ):
+        self.root = os.path.abspath(root)
+        self.hard_limit = hard_limit_gb * GB
+        self.soft_limit = max(soft_limit_gb * GB, self.hard_limit)
+        self.platform_quotas = platform_quotas or {}
+        self.anchor_quotas = anchor_quotas or {}
+        self.retention = retention or RetentionPolicy()
+        self.low_priority = low_priority or []
+        self.anchor_dirs = anchor_dirs
+        self.on_pause = on_pause
+        self.catalog = catalog
+        self.free: int | None = None
+        self.state = STATE_OK
+        self.platform_usage: dict[str, int] = {}
+        self.anchor_usage: dict[str, int] = {}
+        self.total_usage = 0
+        self.refused: dict[str, int] = {}
+        self.last_decision: str | None = None
+        self.pruned_files = 0
+        self.pruned_bytes = 0
+        self._rooms: dict[str, tuple[str | None, str | None]] = {}
+        self._last_scan = 0.0
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='storage-manager', daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        if self.catalog:
+            try:
+                self.catalog.import_tree(self.root, RECORDING_EXTENSIONS + SIDECAR_SUFFIXES)
+            except Exception as e:
+                logger.error(f"Catalog import failed: {e}")
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Storage check failed: {e}")
+            time.sleep(STORAGE_CHECK_INTERVAL)
+
+    def check(self) -> None:
+        previous = self.state
+        self.refresh_free_space()
+        if self.state != STATE_OK or time.time() - self._last_scan >= STORAGE_SCAN_INTERVAL:
+            self.scan_and_prune()
+            self.refresh_free_space()
+        if self.state != previous:
+            self._decide(f"free space {self.free / GB:.1f} GB, state {previous} -> {self.state}")
+            if self.state != STATE_OK and self.on_pause:
+                self.on_pause()
+
+    def refresh_free_space(self) -> int:
+        """statvfs is cheap, so free space is polled rather than estimated from written bytes."""
+        self.free = shutil.disk_usage(self.root).free
+        if self.free < self.hard_limit:
+            self.state = STATE_FULL
+        elif self.free < self.soft_limit:
+            self.state = STATE_LOW
+        else:
+            self.state = STATE_OK
+        metrics.set('storage_free_bytes', self.free, help_text='Free bytes on the recording volume')
+        metrics.set('storage_state', ('ok', 'low', 'full').index(self.state),
+                    help_text='Recording volume state: 0 ok, 1 paused low priority, 2 full')
+        return self.free
+
+    def _collect(self) -> list[RecordingGroup]:
+        return collect_recordings(self.root, self.anchor_dirs, self.catalog)
+
+    def _update_usage(self, groups: list[RecordingGroup]) -> None:
+        platform_usage: dict[str, int] = {}
+        anchor_usage: dict[str, int] = {}
+        for group in groups:
+            if group.platform:
+                platform_usage[group.platform] = platform_usage.get(group.platform, 0) + group.size
+            if group.anchor:
+                anchor_usage[group.anchor] = anchor_usage.get(group.anchor, 0) + group.size
+        with self._lock:
+            self.platform_usage, self.anchor_usage = platform_usage, anchor_usage
+            self.total_usage = sum(group.size for group in groups)
+        for platform, size in platform_usage.items():
+            metrics.set('storage_usage_bytes', size, {'platform': platform},
+                        help_text='Bytes of recordings kept per platform')
+
+    def _expired(self, groups: list[RecordingGroup]) -> list[RecordingGroup]:
+        now = time.time()
+        finished = [g for g in groups if now - g.mtime >= ACTIVE_GRACE]
+        policy = self.retention
+        expired = []
+        if policy.max_age_days:
+            expired += [g for g in finished if now - g.mtime > policy.max_age_days * 86400]
+        remaining = [g for g in finished if g not in expired]
+        if policy.max_count and len(groups) - len(expired) > policy.max_count:
+            excess = len(groups) - len(expired) - policy.max_count
+            expired += remaining[:excess]
+            remaining = remaining[excess:]
+        total = sum(g.size for g in groups) - sum(g.size for g in expired)
+        if policy.max_total_gb:
+            for group in remaining:
+                if total <= policy.max_total_gb * GB:
+                    break
+                expired.append(group)
+                total -= group.size
+        # space pressure pauses or refuses recordings instead; only what the policy expires is deleted
+        return expired
+
+    def scan_and_prune(self) -> None:
+        self._last_scan = time.time()
+        groups = self._collect()
+        if self.retention.enabled:
+            for group in self._expired(groups):
+                self._prune(group)
+                groups.remove(group)
+        self._update_usage(groups)
+
+    def _prune(self, group: RecordingGroup) -> None:
+        removed = 0
+        for path in group.paths:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                if self.catalog:
+                    self.catalog.remove_file(path)
+                removed += size
+                self.pruned_files += 1
+            except OSError as e:
+                logger.warning(f"Failed to prune {path}: {e}")
+        self.pruned_bytes += removed
+        metrics.set('storage_pruned_bytes_total', self.pruned_bytes, help_text='Bytes freed by retention')
+        self._decide(f"pruned {os.path.basename(group.key)} ({removed / GB:.2f} GB)")
+
+    def _decide(self, text: str) -> None:
+        self.last_decision = f"{time.strftime('%H:%M:%S')} {text}"
+        logger.info(f"Storage: {text}")
+
+    def is_low_priority(self, key: str, platform: str | None = None, anchor: str | None = None) -> bool:
+        return any(rule in key or rule == platform or rule == anchor for rule in self.low_priority)
+
+    def admit(self, key: str, platform: str | None = None, anchor: str | None = None) -> tuple[bool, str | None]:
+        """Return whether the room may start recording now, and the reason when it may not."""
+        self._rooms[key] = (platform, anchor)
+        if self.free is None or self.state != STATE_OK:
+            self.refresh_free_space()
+        reason = None
+        if self.state == STATE_FULL:
+            reason = 'full'
+        elif self.state == STATE_LOW and self.is_low_priority(key, platform, anchor):
+            reason = 'low_priority'
+        elif platform in self.platform_quotas and \
+                self.platform_usage.get(platform, 0) >= self.platform_quotas[platform] * GB:
+            reason = 'platform_quota'
+        elif anchor in self.anchor_quotas and self.anchor_usage.get(anchor, 0) >= self.anchor_quotas[anchor] * GB:
+            reason = 'anchor_quota'
+        if reason:
+            with self._lock:
+                self.refused[reason] = self.refused.get(reason, 0) + 1
+            metrics.set('storage_refused_total', self.refused[reason], {'reason': reason},
+                        help_text='Recordings refused by storage admission')
+        return reason is None, reason
+
+    def should_pause(self, key: str) -> bool:
+        """Whether a running recording should stop to keep the volume from filling up."""
+        if self.state == STATE_FULL:
+            return True
+        return self.state == STATE_LOW and self.is_low_priority(key, *self._rooms.get(key, (None, None)))
+
+    def paused_keys(self) -> list[str]:
+        return [key for key in list(self._rooms) if self.should_pause(key)]
+
+    def summary(self) -> str:
+        free = '未知' if self.free is None else f"{self.free / GB:.1f}GB"
+        text = f"存储: 剩余 {free} 停止阈值 {self.hard_limit / GB:.1f}GB"
+        if self.soft_limit > self.hard_limit:
+            text += f" 低优先级暂停阈值 {self.soft_limit / GB:.1f}GB"
+        if self.state != STATE_OK:
+            text += ' | 空间不足, 已停止全部录制' if self.state == STATE_FULL else ' | 低优先级录制已暂停'
+        if self.refused:
+            text += f" | 拒绝录制 {sum(self.refused.values())} 次"
+        if self.pruned_files:
+            text += f" | 已清理 {self.pruned_files} 个文件 {self.pruned_bytes / GB:.2f}GB"
+        if self.last_decision:
+            text += f" | 最近: {self.last_decision}"
+        return text
@@ -0,0 +1,231 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Migrate finished recordings from the recording volume to archive roots in the background, using
+a rename on the same filesystem or a throttled in-kernel copy otherwise, and delete the source only after
+the copy is verified against the recorded hash.
+"""
+
+import errno
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Callable
+from . import storage
+from .catalog import Catalog
+from .logger import logger
+from .metrics import metrics
+from .utils import hash_file
+
+MOVE_SCAN_INTERVAL = 600
+MOVE_CHUNK_SIZE = 8 * 1024 * 1024
+MOVE_FREE_RESERVE = storage.GB
+PART_SUFFIX = '.moving'
+VERIFY_ALGORITHM = 'sha256'
+# errors meaning this fast path is unavailable for the pair of files, not that the copy failed
+UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF}
+
+
+class Throttle:
+    def __init__(self, bytes_per_second: float = 0):
+        self.rate = bytes_per_second
+        self.started = time.monotonic()
+        self.sent = 0
+
+    def consume(self, size: int) -> None:
+        if not self.rate:
+            return
+        self.sent += size
+        ahead = self.sent / self.rate - (time.monotonic() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def _copy_chunks(fd_in: int, fd_out: int, offset: int, size: int, throttle: Throttle) -> None:
+    methods = [name for name in ('copy_file_range', 'sendfile') if hasattr(os, name)]
+    while offset < size:
+        count = min(MOVE_CHUNK_SIZE, size - offset)
+        method = methods[0] if methods else 'read'
+        try:
+            if method == 'copy_file_range':
+                copied = os.copy_file_range(fd_in, fd_out, count, offset, offset)
+            elif method == 'sendfile':
+                os.lseek(fd_out, offset, os.SEEK_SET)
+                copied = os.sendfile(fd_out, fd_in, offset, count)
+            else:
+                os.lseek(fd_in, offset, os.SEEK_SET)
+                os.lseek(fd_out, offset, os.SEEK_SET)
+                copied = os.write(fd_out, os.read(fd_in, count))
+        except OSError as e:
+            if methods and e.errno in UNSUPPORTED_ERRNOS:
+                methods.pop(0)
+                continue
+            raise
+        if copied == 0:
+            raise OSError(f"source shrank while copying at offset {offset}")
+        offset += copied
+        throttle.consume(copied)
+
+
+def copy_file(source: str, destination: str, bandwidth: float = 0) -> None:
+    """Copy source to destination through a partial file, resuming a partial copy left by an earlier run."""
+    part_path = destination + PART_SUFFIX
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    size = os.path.getsize(source)
+    with open(source, 'rb') as fin, open(part_path, 'r+b' if os.path.exists(part_path) else 'wb') as fout:
+        offset = os.fstat(fout.fileno()).st_size
+        if offset > size:
+            fout.truncate(0)
+            offset = 0
+        _copy_chunks(fin.fileno(), fout.fileno(), offset, size, Throttle(bandwidth))
+        fout.flush()
+        os.fsync(fout.fileno())
+    os.replace(part_path, destination)
+    shutil.copystat(source, destination)
+
+
+def _rewrite_manifest(path: str, source_root: str, archive_root: str) -> None:
+    """Point a moved session manifest at the archived files."""
+    def relocate(value):
+        if isinstance(value, str) and value.startswith(source_root + os.sep):
+            return os.path.join(archive_root, os.path.relpath(value, source_root))
+        return value
+
+    with open(path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    for item in manifest.get('files', []):
+        item['path'] = relocate(item.get('path'))
+    manifest['output'] = relocate(manifest.get('output'))
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+
+class StorageMover:
+    def __init__(
+            self,
+            source_root: str,
+            archive_roots: list[str],
+            min_age: float,
+            bandwidth_mb: float = 0,
+            anchor_dirs: bool = False,
+            submit: Callable | None = None,
+            catalog: Catalog | None = None,
+    ):
+        self.source_root = os.path.abspath(source_root)
+        self.archive_roots = [os.path.abspath(root) for root in archive_roots]
+        self.min_age = min_age
+        self.bandwidth = bandwidth_mb * 1024 * 1024
+        self.anchor_dirs = anchor_dirs
+        self.submit = submit
+        self.catalog = catalog
+        self.moved_files = 0
+        self.moved_bytes = 0
+        self.failed = 0
+        self._scheduled: set[str] = set()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.archive_roots) and self.min_age >= 0
+
+    def start(self) -> None:
+        if self.enabled and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='storage-mover', daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.schedule()
+            except Exception as e:
+                logger.error(f"Archive scan failed: {e}")
+            time.sleep(MOVE_SCAN_INTERVAL)
+
+    def pick_root(self, size: int) -> str | None:
+        """Archive roots are tiers in order of preference; use the first one with room for the recording."""
+        for root in self.archive_roots:
+            try:
+                os.makedirs(root, exist_ok=True)
+                if shutil.disk_usage(root).free >= size + MOVE_FREE_RESERVE:
+                    return root
+            except OSError as e:
+                logger.warning(f"Archive root {root} unavailable: {e}")
+        return None
+
+    def schedule(self) -> int:
+        """Queue a move for every finished recording older than the policy age."""
+        now = time.time()
+        queued = 0
+        for group in storage.collect_recordings(self.source_root, self.anchor_dirs, self.catalog):
+            if now - group.mtime < max(self.min_age, storage.ACTIVE_GRACE) or group.key in self._scheduled:
+                continue
+            root = self.pick_root(group.size)
+            if root is None:
+                logger.warning(f"No archive root has room for {os.path.basename(group.key)}")
+                break
+            self._scheduled.add(group.key)
+            # session manifests move last, so an interrupted move still finds the files it lists
+            paths = sorted(group.paths, key=lambda p: p.endswith('.session.json'))
+            self.submit(self.move_group, paths, root, group.hashes)
+            queued += 1
+        return queued
+
+    def move_group(self, paths: list[str], archive_root: str, hashes: dict[str, str] | None = None) -> bool:
+        hashes = hashes or {}
+        ok = True
+        for path in paths:
+            if path.endswith('.session.json') and not ok:
+                # keep the manifest with the files that failed so the session is retried as one group
+                continue
+            destination = os.path.join(archive_root, os.path.relpath(path, self.source_root))
+            try:
+                self.move_file(path, destination, hashes.get(path))
+                if path.endswith('.session.json'):
+                    _rewrite_manifest(destination, self.source_root, archive_root)
+            except Exception as e:
+                logger.error(f"Failed to archive {path}: {e}")
+                self.failed += 1
+                ok = False
+        self._scheduled.difference_update(storage.group_key(path) for path in paths)
+        metrics.set('storage_moved_bytes_total', self.moved_bytes, help_text='Bytes moved to archive roots')
+        metrics.set('storage_move_failures_total', self.failed, help_text='Files that failed to archive')
+        return ok
+
+    def move_file(self, source: str, destination: str, expected_hash: str | None = None) -> None:
+        if not os.path.exists(source):
+            if os.path.exists(destination):
+                return  # finished before a restart
+            raise FileNotFoundError(source)
+        size = os.path.getsize(source)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        if os.stat(source).st_dev == os.stat(os.path.dirname(destination)).st_dev:
+            os.replace(source, destination)
+        else:
+            copy_file(source, destination, self.bandwidth)
+            self.verify(source, destination, expected_hash)
+            os.remove(source)
+        if self.catalog:
+            self.catalog.move_file(source, destination)
+        self.moved_files += 1
+        self.moved_bytes += size
+        logger.info(f"Archived {source} -> {destination}")
+
+    @staticmethod
+    def verify(source: str, destination: str, expected_hash: str | None) -> None:
+        """Check the copy against the hash taken while recording, or against the source when there is none."""
+        if expected_hash:
+            algorithm, _, expected = expected_hash.partition(':')
+        else:
+            algorithm, expected = VERIFY_ALGORITHM, hash_file(source, VERIFY_ALGORITHM)
+        actual = hash_file(destination, algorithm)
+        if actual != expected:
+            os.remove(destination)
+            raise OSError(f"hash mismatch after copy ({algorithm} {actual} != {expected})")
+
+    def summary(self) -> str:
+        text = f"归档: 已移动 {self.moved_files} 个文件 {self.moved_bytes / storage.GB:.2f}GB"
+        if self.failed:
+            text += f" 失败 {self.failed}"
+        return text
@@ -67,6 +67,7 @@ async def get_douyin_stream_url(json_data: dict, video_quality: str, proxy_addr:
             index = quality_index + 1 if quality_index < 4 else quality_index - 1
             m3u8_url = m3u8_url_list[index]
             flv_url = flv_url_list[index]
+        nearest_indexes = sorted(range(len(flv_url_list)), key=lambda i: abs(i - quality_index))
         result |= {
             'is_live': True,
             'title': json_data['title'],
@@ -74,6 +75,7 @@ async def get_douyin_stream_url(json_data: dict, video_quality: str, proxy_addr:
             'm3u8_url': m3u8_url,
             'flv_url': flv_url,
             'record_url': m3u8_url or flv_url,
+            'candidate_urls': [u for i in nearest_indexes for u in (m3u8_url_list[i], flv_url_list[i]) if u],
         }
     return result
 
@@ -0,0 +1,69 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Cache resolved live stream info per room until its CDN URLs expire.
+"""
+
+import threading
+import time
+from .utils import get_url_expire_time
+
+STREAM_CACHE_MARGIN = 60
+STREAM_CACHE_MAX_TTL = 3600
+STREAM_URL_KEYS = ('record_url', 'm3u8_url', 'flv_url')
+
+
+class StreamUrlCache:
+    def __init__(self, margin: float = STREAM_CACHE_MARGIN, max_ttl: float = STREAM_CACHE_MAX_TTL):
+        self.margin = margin
+        self.max_ttl = max_ttl
+        self._items: dict[tuple[str, str], tuple[float, str, dict]] = {}
+        self._lock = threading.Lock()
+
+    def get_expire_time(self, port_info: dict) -> float | None:
+        expire_times = []
+        for key in STREAM_URL_KEYS:
+            url = port_info.get(key)
+            if url and isinstance(url, str):
+                expire_time = get_url_expire_time(url)
+                if not expire_time:
+                    return None
+                expire_times.append(expire_time)
+        return min(expire_times) if expire_times else None
+
+    def get(self, record_url: str, quality: str) -> tuple[str, dict] | None:
+        key = (record_url, quality)
+        with self._lock:
+            item = self._items.get(key)
+            if not item:
+                return None
+            expire_at, platform, port_info = item
+            if expire_at <= time.time():
+                del self._items[key]
+                return None
+            return platform, dict(port_info)
+
+    def put(self, record_url: str, quality: str, platform: str, port_info: dict) -> bool:
+        if not port_info or not port_info.get('is_live'):
+            return False
+        url_expire_time = self.get_expire_time(port_info)
+        if not url_expire_time:
+            return False
+        now = time.time()
+        expire_at = min(now + self.max_ttl, url_expire_time - self.margin)
+        if expire_at <= now:
+            return False
+        with self._lock:
+            self._items[(record_url, quality)] = (expire_at, platform, dict(port_info))
+        return True
+
+    def invalidate(self, record_url: str, quality: str | None = None) -> None:
+        with self._lock:
+            for key in [k for k in self._items if k[0] == record_url and (quality is None or k[1] == quality)]:
+                del self._items[key]
+
+    def __contains__(self, key: tuple[str, str]) -> bool:
+        return self.get(*key) is not None
+
+
+stream_url_cache = StreamUrlCache()
@@ -0,0 +1,227 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Fan out the byte stream of an in-progress recording to in-process and local HTTP subscribers.
+"""
+
+import json
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote
+from .logger import logger
+from .metrics import metrics
+
+HUB_SUBSCRIBER_BUFFER = 8 * 1024 * 1024
+
+
+class HubSubscriber:
+    def __init__(self, hub: 'StreamHub', max_buffer: int = HUB_SUBSCRIBER_BUFFER):
+        self.hub = hub
+        self.max_buffer = max_buffer
+        self.buffered = 0
+        self.started = False
+        self.dropped = False
+        self.closed = False
+        self._chunks: deque[bytes] = deque()
+        self._cond = threading.Condition()
+
+    def _put(self, chunks: list[bytes]) -> bool:
+        size = sum(len(chunk) for chunk in chunks)
+        with self._cond:
+            if self.closed:
+                return False
+            if self.buffered + size > self.max_buffer:
+                # a slow consumer is cut off instead of holding back the recorder or growing without bound
+                self.dropped = True
+                self.closed = True
+                self._chunks.clear()
+                self._cond.notify_all()
+                return False
+            self._chunks.extend(chunks)
+            self.buffered += size
+            self._cond.notify_all()
+            return True
+
+    def _finish(self) -> None:
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def read(self, timeout: float | None = None) -> bytes | None:
+        """Return the next chunk, b'' once the stream has ended, or None if nothing arrived within timeout."""
+        with self._cond:
+            if not self._chunks and not self.closed:
+                self._cond.wait(timeout)
+            if self._chunks:
+                chunk = self._chunks.popleft()
+                self.buffered -= len(chunk)
+                return chunk
+            return b'' if self.closed else None
+
+    def __iter__(self):
+        while (chunk := self.read()) != b'':
+            if chunk:
+                yield chunk
+
+    def close(self) -> None:
+        self.hub.unsubscribe(self)
+
+
+class StreamHub:
+    def __init__(self, name: str, content_type: str, max_buffer: int = HUB_SUBSCRIBER_BUFFER):
+        self.name = name
+        self.content_type = content_type
+        self.max_buffer = max_buffer
+        self.header = b''
+        self.bytes_published = 0
+        self.dropped_subscribers = 0
+        self.closed = False
+        self._subscribers: list[HubSubscriber] = []
+        self._lock = threading.Lock()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def set_header(self, data: bytes) -> None:
+        self.header = data
+
+    def subscribe(self, max_buffer: int | None = None) -> HubSubscriber:
+        subscriber = HubSubscriber(self, max_buffer or self.max_buffer)
+        with self._lock:
+            if self.closed:
+                subscriber._finish()
+            else:
+                self._subscribers.append(subscriber)
+        self._update_metrics()
+        return subscriber
+
+    def unsubscribe(self, subscriber: HubSubscriber) -> None:
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+        subscriber._finish()
+        self._update_metrics()
+
+    def publish(self, data: bytes, keyframe: bool = True) -> None:
+        """Hand one chunk to every subscriber. New subscribers start with the header at the next keyframe."""
+        self.bytes_published += len(data)
+        if not self._subscribers:
+            return
+        dropped = []
+        with self._lock:
+            for subscriber in self._subscribers:
+                if not subscriber.started:
+                    if not keyframe:
+                        continue
+                    subscriber.started = True
+                    chunks = [self.header, data] if self.header else [data]
+                else:
+                    chunks = [data]
+                if not subscriber._put(chunks):
+                    dropped.append(subscriber)
+            for subscriber in dropped:
+                self._subscribers.remove(subscriber)
+        if dropped:
+            self.dropped_subscribers += len(dropped)
+            logger.warning(f"Stream hub {self.name}: dropped {len(dropped)} slow subscriber(s)")
+            self._update_metrics()
+
+    def close(self) -> None:
+        with self._lock:
+            self.closed = True
+            subscribers, self._subscribers = self._subscribers, []
+        for subscriber in subscribers:
+            subscriber._finish()
+        metrics.remove({'stream': self.name})
+
+    def _update_metrics(self) -> None:
+        if self.closed:
+            return
+        labels = {'stream': self.name}
+        metrics.set('stream_hub_subscribers', len(self._subscribers), labels, 'Live stream hub subscribers')
+        metrics.set('stream_hub_dropped_subscribers', self.dropped_subscribers, labels,
+                    'Subscribers dropped for falling behind')
+
+
+class StreamHubRegistry:
+    def __init__(self):
+        self._hubs: dict[str, StreamHub] = {}
+        self._lock = threading.Lock()
+
+    def open(self, name: str, content_type: str, max_buffer: int = HUB_SUBSCRIBER_BUFFER) -> StreamHub:
+        hub = StreamHub(name, content_type, max_buffer)
+        with self._lock:
+            previous = self._hubs.get(name)
+            self._hubs[name] = hub
+        if previous:
+            previous.close()
+        return hub
+
+    def close(self, hub: StreamHub | None) -> None:
+        if hub is None:
+            return
+        with self._lock:
+            if self._hubs.get(hub.name) is hub:
+                del self._hubs[hub.name]
+        hub.close()
+
+    def get(self, name: str) -> StreamHub | None:
+        return self._hubs.get(name)
+
+    def names(self) -> list[str]:
+        return list(self._hubs)
+
+
+stream_hubs = StreamHubRegistry()
+
+
+class _StreamHubHandler(BaseHTTPRequestHandler):
+    def _send_streams(self) -> None:
+        body = json.dumps([
+            {'name': name, 'path': f"/streams/{quote(name)}"} for name in stream_hubs.names()
+        ], ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.split('?')[0].rstrip('/')
+        if path == '/streams':
+            self._send_streams()
+            return
+        hub = stream_hubs.get(unquote(path[len('/streams/'):])) if path.startswith('/streams/') else None
+        if hub is None:
+            self.send_error(404)
+            return
+        subscriber = hub.subscribe()
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', hub.content_type)
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            for chunk in subscriber:
+                self.wfile.write(chunk)
+        except OSError:
+            pass
+        finally:
+            subscriber.close()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stream_hub_server(port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer | None:
+    try:
+        server = ThreadingHTTPServer((host, port), _StreamHubHandler)
+    except OSError as e:
+        logger.error(f"Stream hub server failed to start on {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='stream-hub-server', daemon=True).start()
+    logger.info(f"Live streams available at http://{host}:{port}/streams")
+    return server
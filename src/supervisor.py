@@ -0,0 +1,359 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Function: Supervise all ffmpeg child processes from one thread, collect their -progress telemetry
+and dispatch their exit callbacks.
+"""
+
+import os
+import queue
+import selectors
+import signal
+import socket
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+from .ffmpeg_progress import FfmpegProgress, ProgressParser
+from .integrity import TailHasher
+from .logger import logger
+from .metrics import metrics
+
+SUPERVISOR_POLL_INTERVAL = 0.5
+SUPERVISOR_STOP_TIMEOUT = 30
+SUPERVISOR_CALLBACK_WORKERS = 4
+# hashing reads every recorded byte, so it runs beside the supervisor thread rather than on it
+SUPERVISOR_HASH_WORKERS = 2
+PROGRESS_READ_SIZE = 65536
+STALL_CHECK_INTERVAL = 1
+STALL_STARTUP_GRACE = 30
+
+
+class SupervisedProcess:
+    def __init__(self, key: str, process: subprocess.Popen, on_exit: Callable | None = None, name: str | None = None):
+        self.key = key
+        self.name = name or key
+        self.process = process
+        self.on_exit = on_exit
+        self.progress = FfmpegProgress()
+        self.progress_parser = ProgressParser(self.progress)
+        self.started_at = time.time()
+        self.returncode: int | None = None
+        self.stop_requested = False
+        self.stall_timeout: float | None = None
+        self.stalled = False
+        self.kill_at: float | None = None
+        self.pidfd: int | None = None
+        self.segment_list: str | None = None
+        self.on_segment: Callable[[str], None] | None = None
+        self.segments: list[str] = []
+        self._segment_list_offset = 0
+        self.hasher: TailHasher | None = None
+        self._hash_future: Future | None = None
+        self._digest_future: Future | None = None
+        self._done = threading.Event()
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def wait(self, timeout: float | None = None) -> int | None:
+        self._done.wait(timeout)
+        return self.returncode
+
+    @property
+    def digest(self) -> str | None:
+        """Digest of the output once the process has exited, waiting for the hash worker to read the rest."""
+        return self._digest_future.result() if self._digest_future else None
+
+    def read_new_segments(self) -> list[str]:
+        """Return segments the muxer has closed since the last call, read from its flat -segment_list."""
+        try:
+            with open(self.segment_list, 'rb') as f:
+                f.seek(self._segment_list_offset)
+                data = f.read()
+        except OSError:
+            return []
+        # a line is only complete once ffmpeg has written its newline
+        complete = data[:data.rfind(b'\n') + 1]
+        self._segment_list_offset += len(complete)
+        directory = os.path.dirname(self.segment_list)
+        segments = [line if os.path.isabs(line) else os.path.join(directory, line)
+                    for line in complete.decode('utf-8', errors='replace').splitlines() if line]
+        self.segments.extend(segments)
+        return segments
+
+    def is_stalled(self) -> bool:
+        if not self.stall_timeout or self.stop_requested:
+            return False
+        timeout = self.stall_timeout if self.progress.total_size else self.stall_timeout + STALL_STARTUP_GRACE
+        return time.monotonic() - self.progress.size_changed_at > timeout
+
+
+class FfmpegSupervisor:
+    def __init__(self, callback_workers: int = SUPERVISOR_CALLBACK_WORKERS, stop_timeout: float = SUPERVISOR_STOP_TIMEOUT,
+                 hash_workers: int = SUPERVISOR_HASH_WORKERS):
+        self.stop_timeout = stop_timeout
+        self.use_pidfd = hasattr(os, 'pidfd_open')
+        self._callback_workers = callback_workers
+        self._hash_workers = hash_workers
+        self._commands = queue.SimpleQueue()
+        self._processes: dict[int, SupervisedProcess] = {}
+        self._selector: selectors.BaseSelector | None = None
+        self._wake_reader: socket.socket | None = None
+        self._wake_writer: socket.socket | None = None
+        self._executor: ThreadPoolExecutor | None = None
+        self._hash_executor: ThreadPoolExecutor | None = None
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._selector = selectors.DefaultSelector()
+            self._wake_reader, self._wake_writer = socket.socketpair()
+            self._wake_reader.setblocking(False)
+            self._wake_writer.setblocking(False)
+            self._selector.register(self._wake_reader, selectors.EVENT_READ)
+            self._executor = ThreadPoolExecutor(self._callback_workers, thread_name_prefix='ffmpeg-callback')
+            self._hash_executor = ThreadPoolExecutor(self._hash_workers, thread_name_prefix='ffmpeg-hash')
+            self._thread = threading.Thread(target=self._run, name='ffmpeg-supervisor', daemon=True)
+            self._thread.start()
+
+    def _send(self, command: tuple) -> None:
+        self._ensure_started()
+        self._commands.put(command)
+        try:
+            self._wake_writer.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    def start(self, key: str, command: list, on_exit: Callable[[SupervisedProcess], None] | None = None,
+              name: str | None = None, stall_timeout: float | None = None, segment_list: str | None = None,
+              on_segment: Callable[[str], None] | None = None, hash_path: str | None = None,
+              hash_algorithm: str | None = None, **popen_kwargs) -> SupervisedProcess:
+        handle = SupervisedProcess(key, subprocess.Popen(command, **popen_kwargs), on_exit, name)
+        handle.stall_timeout = stall_timeout
+        handle.segment_list = segment_list
+        handle.on_segment = on_segment
+        if hash_path and hash_algorithm:
+            # hash the output while ffmpeg appends to it; only valid for muxers that never seek back
+            handle.hasher = TailHasher(hash_path, hash_algorithm)
+        self._send(('add', handle))
+        return handle
+
+    def submit(self, func: Callable, *args):
+        self._ensure_started()
+        return self._executor.submit(func, *args)
+
+    def stop(self, key: str) -> None:
+        if self._thread:
+            self._send(('stop', key))
+
+    def stop_all(self) -> None:
+        if self._thread:
+            self._send(('stop', None))
+
+    @property
+    def running_count(self) -> int:
+        return len(self._processes)
+
+    def get_progress(self, name: str) -> FfmpegProgress | None:
+        for handle in list(self._processes.values()):
+            if handle.name == name or handle.key == name:
+                return handle.progress
+        return None
+
+    def _add(self, handle: SupervisedProcess) -> None:
+        self._processes[handle.pid] = handle
+        metrics.set('ffmpeg_processes_running', len(self._processes), help_text='Supervised ffmpeg processes')
+        if self.use_pidfd:
+            try:
+                handle.pidfd = os.pidfd_open(handle.pid)
+                self._selector.register(handle.pidfd, selectors.EVENT_READ, handle)
+            except OSError:
+                handle.pidfd = None
+        if handle.process.stdout:
+            if os.name == 'nt':
+                # pipes are not selectable on Windows
+                threading.Thread(target=self._read_progress_blocking, args=(handle,), daemon=True).start()
+            else:
+                os.set_blocking(handle.process.stdout.fileno(), False)
+                self._selector.register(handle.process.stdout, selectors.EVENT_READ, handle)
+
+    def _on_progress(self, handle: SupervisedProcess, data: bytes) -> None:
+        if not handle.progress_parser.feed(data):
+            return
+        progress = handle.progress
+        labels = {'recording': handle.name}
+        metrics.set('ffmpeg_out_time_seconds', progress.out_time, labels, 'Recorded media duration')
+        metrics.set('ffmpeg_total_size_bytes', progress.total_size, labels, 'Bytes written by ffmpeg')
+        metrics.set('ffmpeg_bitrate_kbps', progress.bitrate or 0, labels, 'Output bitrate')
+        metrics.set('ffmpeg_speed', progress.speed or 0, labels, 'Processing speed relative to real time')
+        metrics.set('ffmpeg_drop_frames', progress.drop_frames, labels, 'Dropped frames')
+        metrics.set('ffmpeg_dup_frames', progress.dup_frames, labels, 'Duplicated frames')
+
+    def _read_progress(self, handle: SupervisedProcess) -> None:
+        try:
+            data = os.read(handle.process.stdout.fileno(), PROGRESS_READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if data:
+            self._on_progress(handle, data)
+        else:
+            self._selector.unregister(handle.process.stdout)
+            handle.process.stdout.close()
+
+    def _read_progress_blocking(self, handle: SupervisedProcess) -> None:
+        try:
+            while data := handle.process.stdout.read1(PROGRESS_READ_SIZE):
+                self._on_progress(handle, data)
+        except (OSError, ValueError):
+            pass
+
+    def _poll_output(self, handle: SupervisedProcess) -> None:
+        # one read in flight per file, so a slow disk queues no more work than there are recordings
+        if handle.hasher and (handle._hash_future is None or handle._hash_future.done()):
+            handle._hash_future = self._hash_executor.submit(self._poll_hash, handle)
+        self._poll_segments(handle)
+
+    @staticmethod
+    def _poll_hash(handle: SupervisedProcess) -> None:
+        hasher = handle.hasher
+        if hasher is None:
+            return
+        try:
+            hasher.poll()
+        except OSError as e:
+            logger.warning(f"Stop hashing {hasher.path}: {e}")
+            handle.hasher = None
+
+    @staticmethod
+    def _finish_hash(handle: SupervisedProcess, hasher: TailHasher) -> str | None:
+        if handle.hasher is None:
+            return None
+        try:
+            return hasher.finish()
+        except OSError as e:
+            logger.warning(f"Failed to finish hashing {hasher.path}: {e}")
+            return None
+
+    def _poll_segments(self, handle: SupervisedProcess) -> None:
+        if handle.segment_list and handle.on_segment:
+            for path in handle.read_new_segments():
+                self._executor.submit(self._run_segment_callback, handle, path)
+
+    @staticmethod
+    def _run_segment_callback(handle: SupervisedProcess, path: str) -> None:
+        try:
+            handle.on_segment(path)
+        except Exception as e:
+            logger.error(f"ffmpeg segment callback failed: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
+
+    def _request_stop(self, handle: SupervisedProcess) -> None:
+        if handle.stop_requested or handle.returncode is not None:
+            return
+        handle.stop_requested = True
+        handle.kill_at = time.monotonic() + self.stop_timeout
+        try:
+            if os.name == 'nt':
+                if handle.process.stdin:
+                    handle.process.stdin.write(b'q')
+                    handle.process.stdin.close()
+            else:
+                handle.process.send_signal(signal.SIGINT)
+        except OSError as e:
+            logger.debug(f"Failed to stop ffmpeg process {handle.pid}: {e}")
+
+    def _reap(self, handle: SupervisedProcess) -> None:
+        if handle.pidfd is not None:
+            self._selector.unregister(handle.pidfd)
+            os.close(handle.pidfd)
+            handle.pidfd = None
+        if handle.process.stdout and os.name != 'nt' and not handle.process.stdout.closed:
+            self._read_progress(handle)
+            if not handle.process.stdout.closed:
+                self._selector.unregister(handle.process.stdout)
+                handle.process.stdout.close()
+        self._processes.pop(handle.pid, None)
+        metrics.remove({'recording': handle.name})
+        metrics.set('ffmpeg_processes_running', len(self._processes))
+        handle.returncode = handle.process.wait()
+        # the last segment is only listed once ffmpeg has written its trailer
+        self._poll_segments(handle)
+        if handle.hasher:
+            handle._digest_future = self._hash_executor.submit(self._finish_hash, handle, handle.hasher)
+        handle._done.set()
+        if handle.on_exit:
+            self._executor.submit(self._run_callback, handle)
+
+    @staticmethod
+    def _run_callback(handle: SupervisedProcess) -> None:
+        try:
+            handle.on_exit(handle)
+        except Exception as e:
+            logger.error(f"ffmpeg exit callback failed: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
+
+    def _handle_commands(self) -> None:
+        while True:
+            try:
+                action, arg = self._commands.get_nowait()
+            except queue.Empty:
+                return
+            if action == 'add':
+                self._add(arg)
+            elif action == 'stop':
+                for handle in list(self._processes.values()):
+                    if arg is None or handle.key == arg:
+                        self._request_stop(handle)
+
+    def _next_timeout(self) -> float | None:
+        deadlines = [h.kill_at for h in self._processes.values() if h.kill_at]
+        timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+        if any(h.pidfd is None for h in self._processes.values()):
+            timeout = SUPERVISOR_POLL_INTERVAL if timeout is None else min(timeout, SUPERVISOR_POLL_INTERVAL)
+        if any(h.stall_timeout or h.segment_list or h.hasher for h in self._processes.values()):
+            timeout = STALL_CHECK_INTERVAL if timeout is None else min(timeout, STALL_CHECK_INTERVAL)
+        return timeout
+
+    def _run(self) -> None:
+        while True:
+            try:
+                for key, _ in self._selector.select(self._next_timeout()):
+                    if key.fileobj is self._wake_reader:
+                        try:
+                            while self._wake_reader.recv(4096):
+                                pass
+                        except (BlockingIOError, OSError):
+                            pass
+                    elif key.fileobj is key.data.process.stdout:
+                        if not key.fileobj.closed:
+                            self._read_progress(key.data)
+                    elif key.data.returncode is None:
+                        self._reap(key.data)
+                self._handle_commands()
+
+                now = time.monotonic()
+                for handle in list(self._processes.values()):
+                    if handle.pidfd is None and handle.process.poll() is not None:
+                        self._reap(handle)
+                        continue
+                    self._poll_output(handle)
+                    if handle.is_stalled():
+                        logger.warning(f"{handle.name} output stalled for {handle.stall_timeout}s, restarting the pull")
+                        handle.stalled = True
+                        self._request_stop(handle)
+                    elif handle.kill_at and now >= handle.kill_at:
+                        logger.warning(f"ffmpeg process {handle.pid} did not exit in {self.stop_timeout}s, killing it")
+                        handle.kill_at = None
+                        handle.process.kill()
+            except Exception as e:
+                logger.error(f"ffmpeg supervisor error: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
+                time.sleep(SUPERVISOR_POLL_INTERVAL)
+
+
+ffmpeg_supervisor = FfmpegSupervisor()
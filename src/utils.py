@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import asyncio
 import json
 import os
 import random
@@ -7,13 +8,12 @@ import string
 from pathlib import Path
 import functools
 import hashlib
-import re
 import traceback
 from typing import Any
-from urllib.parse import parse_qs, urlparse
 from collections import OrderedDict
 import execjs
 from .logger import logger
+from .patterns import EMOJI_PATTERN, JSONP_PATTERN, parse_query
 import configparser
 
 OptionalStr = str | None
@@ -51,10 +51,32 @@ def trace_error_decorator(func: callable) -> callable:
     return wrapper
 
 
+@functools.lru_cache(maxsize=None)
+def get_js_context(js_file: str) -> Any:
+    with open(js_file, encoding='utf-8') as f:
+        return execjs.compile(f.read())
+
+
+def call_js(js_file: str | Path, func_name: str, *args: Any) -> Any:
+    return get_js_context(str(js_file)).call(func_name, *args)
+
+
+async def run_blocking(func: callable, *args: Any, **kwargs: Any) -> Any:
+    return await asyncio.to_thread(func, *args, **kwargs)
+
+
+def hash_file(file_path: str | Path, algorithm: str = 'md5', chunk_size: int = 1024 * 1024) -> str:
+    file_hash = hashlib.new(algorithm)
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(file_path, 'rb', buffering=0) as fp:
+        while size := fp.readinto(buffer):
+            file_hash.update(view[:size])
+    return file_hash.hexdigest()
+
+
 def check_md5(file_path: str | Path) -> str:
-    with open(file_path, 'rb') as fp:
-        file_md5 = hashlib.md5(fp.read()).hexdigest()
-    return file_md5
+    return hash_file(file_path, 'md5')
 
 
 def dict_to_cookie_str(cookies_dict: dict) -> str:
@@ -116,23 +138,7 @@ def get_file_paths(directory: str) -> list:
 
 
 def remove_emojis(text: str, replace_text: str = '') -> str:
-    emoji_pattern = re.compile(
-        "["
-        "\U0001F1E0-\U0001F1FF"  # flags (iOS)
-        "\U0001F300-\U0001F5FF"  # symbols & pictographs
-        "\U0001F600-\U0001F64F"  # emoticons
-        "\U0001F680-\U0001F6FF"  # transport & map symbols
-        "\U0001F700-\U0001F77F"  # alchemical symbols
-        "\U0001F780-\U0001F7FF"  # Geometric Shapes Extended
-        "\U0001F800-\U0001F8FF"  # Supplemental Arrows-C
-        "\U0001F900-\U0001F9FF"  # Supplemental Symbols and Pictographs
-        "\U0001FA00-\U0001FA6F"  # Chess Symbols
-        "\U0001FA70-\U0001FAFF"  # Symbols and Pictographs Extended-A
-        "\U00002702-\U000027B0"  # Dingbats
-        "]+",
-        flags=re.UNICODE
-    )
-    return emoji_pattern.sub(replace_text, text)
+    return EMOJI_PATTERN.sub(replace_text, text)
 
 
 def remove_duplicate_lines(file_path: str | Path) -> None:
@@ -175,8 +181,7 @@ def generate_random_string(length: int) -> str:
 
 
 def jsonp_to_json(jsonp_str: str) -> OptionalDict:
-    pattern = r'(\w+)\((.*)\);?$'
-    match = re.search(pattern, jsonp_str)
+    match = JSONP_PATTERN.search(jsonp_str)
 
     if match:
         _, json_str = match.groups()
@@ -195,12 +200,31 @@ def replace_url(file_path: str | Path, old: str, new: str) -> None:
 
 
 def get_query_params(url: str, param_name: OptionalStr) -> dict | list[str]:
-    parsed_url = urlparse(url)
-    query_params = parse_qs(parsed_url.query)
+    query_params = parse_query(url)
 
     if param_name is None:
-        return query_params
+        return {key: list(values) for key, values in query_params.items()}
     else:
-        values = query_params.get(param_name, [])
-        return values
-    
\ No newline at end of file
+        values = query_params.get(param_name, ())
+        return list(values)
+
+
+URL_EXPIRE_PARAMS = ('expire', 'expires', 'deadline', 'x-expires', 'wsTime', 'txTime')
+
+
+def get_url_expire_time(url: str) -> float | None:
+    query_params = parse_query(url)
+    for param_name in URL_EXPIRE_PARAMS:
+        values = query_params.get(param_name)
+        if not values or not values[0]:
+            continue
+        value = values[0]
+        try:
+            if param_name in ('wsTime', 'txTime'):
+                return float(int(value, 16))
+            if value.isdigit():
+                timestamp = int(value)
+                return timestamp / 1000 if len(value) >= 13 else float(timestamp)
+        except ValueError:
+            continue
+    return None
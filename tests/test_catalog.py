@@ -0,0 +1,100 @@
+import os
+
+import pytest
+
+from src.catalog import FILE_ARCHIVED, FILE_CLOSED, FILE_DELETED, FILE_RECORDING, Catalog
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    return Catalog(str(tmp_path / 'catalog.db'))
+
+
+@pytest.fixture
+def recordings(catalog, tmp_path):
+    paths = {}
+    for name, platform, anchor, started_at in (
+            ('a.ts', '抖音直播', '主播A', 1000), ('b.flv', '抖音直播', '主播B', 2000),
+            ('c.ts', 'B站直播', '主播A', 3000), ('d.mp3', 'B站直播', '主播A', 4000)):
+        path = tmp_path / 'rec' / platform / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'x' * started_at)
+        catalog.open_file(str(path), room=f'room-{anchor}', platform=platform, anchor=anchor, started_at=started_at)
+        paths[name] = str(path)
+    for name in ('a.ts', 'b.flv', 'c.ts'):
+        catalog.close_file(paths[name], digest=f'sha256:{name}')
+    return paths
+
+
+def names(rows: list[dict]) -> list[str]:
+    return [os.path.basename(row['path']) for row in rows]
+
+
+def test_query_filters_combine(catalog, recordings):
+    assert names(catalog.query(anchor='主播A')) == ['a.ts', 'c.ts', 'd.mp3']
+    assert names(catalog.query(anchor='主播A', platform='B站直播', ext='.ts')) == ['c.ts']
+    assert names(catalog.query(state=FILE_RECORDING)) == ['d.mp3']
+    assert names(catalog.query(state=(FILE_RECORDING, FILE_CLOSED), since=2000, until=4000)) == ['b.flv', 'c.ts']
+    assert names(catalog.query(newest_first=True, limit=2)) == ['d.mp3', 'c.ts']
+
+
+def test_close_file_keeps_start_and_room_and_records_size_and_hash(catalog, recordings):
+    row = catalog.query(ext='.flv')[0]
+
+    assert row['state'] == FILE_CLOSED
+    assert (row['started_at'], row['room'], row['anchor']) == (2000, 'room-主播B', '主播B')
+    assert (row['size'], row['hash']) == (2000, 'sha256:b.flv')
+
+
+def test_query_under_matches_only_that_tree(catalog, recordings, tmp_path):
+    sibling = tmp_path / 'rec' / '抖音直播2' / 'e.ts'
+    catalog.close_file(str(sibling), started_at=5000)
+
+    assert names(catalog.query(under=str(tmp_path / 'rec' / '抖音直播'))) == ['a.ts', 'b.flv']
+    assert not catalog.is_empty(str(tmp_path / 'rec' / '抖音直播2'))
+    assert catalog.is_empty(str(tmp_path / 'elsewhere'))
+
+
+def test_latest_returns_newest_file_that_still_exists(catalog, recordings):
+    assert catalog.latest('.TS') == recordings['c.ts']
+    catalog.remove_file(recordings['c.ts'])
+    assert catalog.latest('.ts') == recordings['a.ts']
+    assert catalog.latest('.ts', since=2000) is None
+
+
+def test_sessions_link_files_and_follow_moves(catalog, recordings, tmp_path):
+    manifest = str(tmp_path / 'rec' / 'B站直播' / 'c.session.json')
+    output = recordings['c.ts'].replace('.ts', '.mp4')
+    session_id = catalog.add_session(manifest, [recordings['c.ts']], room='room-主播A', platform='B站直播',
+                                     anchor='主播A', output=output, started_at=3000)
+    catalog.derive_file(recordings['c.ts'], output)
+
+    linked = {os.path.basename(row['path']): row['session_id'] for row in catalog.query(platform='B站直播')}
+    assert linked == {'c.ts': session_id, 'c.mp4': session_id, 'c.session.json': session_id, 'd.mp3': None}
+
+    archived = str(tmp_path / 'archive' / 'c.session.json')
+    catalog.move_file(manifest, archived)
+    catalog.move_file(output, str(tmp_path / 'archive' / 'c.mp4'))
+    session = catalog.sessions(anchor='主播A')[0]
+    assert (session['manifest'], session['output']) == (archived, str(tmp_path / 'archive' / 'c.mp4'))
+    assert sorted(names(catalog.query(state=FILE_ARCHIVED))) == ['c.mp4', 'c.session.json']
+
+
+def test_reopening_a_path_starts_it_over(catalog, recordings):
+    catalog.open_file(recordings['a.ts'], started_at=9000)
+    row = catalog.query(ext='.ts', newest_first=True)[0]
+
+    assert (row['path'], row['state'], row['hash']) == (recordings['a.ts'], FILE_RECORDING, None)
+
+
+def test_import_tree_indexes_existing_recordings_once(catalog, tmp_path):
+    old = tmp_path / 'old'
+    (old / 'sub').mkdir(parents=True)
+    (old / 'sub' / 'x.ts').write_bytes(b'123')
+    (old / 'notes.txt').write_text('skip')
+
+    assert catalog.import_tree(str(old), ('.ts',)) == 1
+    assert catalog.import_tree(str(old), ('.ts',)) == 0
+    assert [(row['size'], row['state']) for row in catalog.query(under=str(old))] == [(3, FILE_CLOSED)]
+    catalog.remove_file(str(old / 'sub' / 'x.ts'))
+    assert catalog.query(state=FILE_DELETED)[0]['path'] == str(old / 'sub' / 'x.ts')
@@ -0,0 +1,63 @@
+import json
+import subprocess
+
+import pytest
+
+from src import chunked_transcode
+
+
+@pytest.fixture
+def fake_ffmpeg(monkeypatch, tmp_path):
+    durations = {}
+    monkeypatch.setattr(chunked_transcode, 'probe_keyframes', lambda path, **kwargs: [i * 2.0 for i in range(301)])
+    monkeypatch.setattr(chunked_transcode, '_split', lambda source, cuts, chunk_dir, **kwargs: ['a', 'b'])
+    monkeypatch.setattr(chunked_transcode, '_encode', lambda chunk, threads, **kwargs: chunk)
+
+    def concat(source, chunks, output, chunk_dir, **kwargs):
+        with open(output, 'wb') as f:
+            f.write(b'mp4')
+
+    monkeypatch.setattr(chunked_transcode, '_concat', concat)
+    monkeypatch.setattr(chunked_transcode, 'probe_duration', lambda path, **kwargs: durations.get(path))
+    return durations
+
+
+def test_transcode_keeps_output_when_durations_match(fake_ffmpeg, tmp_path):
+    source, output = str(tmp_path / 'rec.ts'), str(tmp_path / 'rec.mp4')
+    fake_ffmpeg.update({source: 600.0, output: 600.4})
+    assert chunked_transcode.transcode(source, output, workers=2)
+    assert (tmp_path / 'rec.mp4').exists()
+
+
+def test_transcode_drops_output_that_drifts_from_source(fake_ffmpeg, tmp_path):
+    source, output = str(tmp_path / 'rec.ts'), str(tmp_path / 'rec.mp4')
+    fake_ffmpeg.update({source: 600.0, output: 596.0})
+    assert not chunked_transcode.transcode(source, output, workers=2)
+    assert not (tmp_path / 'rec.mp4').exists()
+    assert not (tmp_path / 'rec.chunks').exists()
+
+
+@pytest.mark.parametrize('info, expected', [
+    ({'streams': [{'duration': '60.033'}], 'format': {'duration': '60.100'}}, 60.033),
+    ({'streams': [{}], 'format': {'duration': '60.100'}}, 60.1),
+    ({'streams': [], 'format': {}}, None),
+])
+def test_probe_duration_prefers_video_stream(monkeypatch, info, expected):
+    monkeypatch.setattr(chunked_transcode.subprocess, 'check_output',
+                        lambda command, **kwargs: json.dumps(info).encode())
+    assert chunked_transcode.probe_duration('rec.flv') == expected
+
+
+def test_transcode_removes_partial_output_and_chunks_when_a_step_fails(fake_ffmpeg, tmp_path, monkeypatch):
+    source, output = str(tmp_path / 'rec.ts'), str(tmp_path / 'rec.mp4')
+
+    def concat(source, chunks, output, chunk_dir, **kwargs):
+        with open(output, 'wb') as f:
+            f.write(b'partial')
+        raise subprocess.CalledProcessError(1, ['ffmpeg'])
+
+    monkeypatch.setattr(chunked_transcode, '_concat', concat)
+    with pytest.raises(subprocess.CalledProcessError):
+        chunked_transcode.transcode(source, output, workers=2)
+    assert not (tmp_path / 'rec.mp4').exists()
+    assert not (tmp_path / 'rec.chunks').exists()
@@ -0,0 +1,68 @@
+import json
+
+from src import conversion_planner
+from src.conversion_planner import PLAN_BSF, PLAN_COPY, PLAN_ENCODE, StreamInfo
+
+
+def ffprobe_output(format_name: str, video: tuple | None, audio: str | None) -> bytes:
+    streams = []
+    if video:
+        streams.append({'codec_type': 'video', 'codec_name': video[0], 'pix_fmt': video[1]})
+    if audio:
+        streams.append({'codec_type': 'audio', 'codec_name': audio})
+    return json.dumps({'format': {'format_name': format_name, 'duration': '60.0'}, 'streams': streams}).encode()
+
+
+def test_plan_mp4_copies_compatible_streams_and_rewrites_adts():
+    plan = conversion_planner.plan_mp4(StreamInfo('mpegts', 60, 'h264', 'yuv420p', 'aac'), h264=True)
+
+    assert plan.action == PLAN_BSF and not plan.video_encode
+    assert plan.args == ['-c:v', 'copy', '-c:a', 'copy', '-bsf:a', 'aac_adtstoasc']
+
+
+def test_plan_mp4_encodes_only_what_is_incompatible():
+    plan = conversion_planner.plan_mp4(StreamInfo('flv', 60, 'hevc', 'yuv420p', 'aac'), h264=True)
+    assert plan.action == PLAN_ENCODE and plan.video_encode
+
+    plan = conversion_planner.plan_mp4(StreamInfo('flv', 60, 'hevc', 'yuv420p', 'pcm_s16le'))
+    assert plan.action == PLAN_ENCODE and not plan.video_encode
+    assert plan.args[:2] == ['-c:v', 'copy']
+
+
+def test_probe_is_cached_in_a_sidecar_until_the_file_changes(tmp_path, monkeypatch):
+    calls = []
+
+    def check_output(command, **kwargs):
+        calls.append(command)
+        return ffprobe_output('mpegts', ('h264', 'yuv420p'), 'aac')
+
+    monkeypatch.setattr(conversion_planner.subprocess, 'check_output', check_output)
+    path = tmp_path / 'rec.ts'
+    path.write_bytes(b'ts')
+
+    assert conversion_planner.probe(str(path)).is_adts
+    assert conversion_planner.probe(str(path)).video_codec == 'h264'
+    assert len(calls) == 1
+    path.write_bytes(b'longer ts')
+    conversion_planner.probe(str(path))
+    assert len(calls) == 2
+
+    conversion_planner.discard(str(path))
+    assert not (tmp_path / 'rec.ts.probe.json').exists()
+
+
+def test_missing_ffprobe_falls_back_to_the_fixed_commands(tmp_path, monkeypatch):
+    def check_output(command, **kwargs):
+        raise FileNotFoundError(2, 'No such file or directory', 'ffprobe')
+
+    monkeypatch.setattr(conversion_planner.subprocess, 'check_output', check_output)
+    path = tmp_path / 'rec.flv'
+    path.write_bytes(b'flv')
+
+    assert conversion_planner.try_probe(str(path)) is None
+    assert not (tmp_path / 'rec.flv.probe.json').exists()
+    assert conversion_planner.fallback_mp4().args == ['-c:v', 'copy', '-c:a', 'copy']
+    assert conversion_planner.fallback_mp4().action == PLAN_COPY
+    encode = conversion_planner.fallback_mp4(h264=True)
+    assert encode.video_encode and encode.args[-2:] == ['-c:a', 'copy']
+    assert conversion_planner.fallback_m4a().args[0] == '-vn'
@@ -0,0 +1,109 @@
+import hashlib
+import struct
+
+from src.flv import TAG_AUDIO, TAG_SCRIPT, TAG_VIDEO, FlvSegmentWriter, FlvTag, FlvTagParser
+
+FILE_HEADER = b'FLV\x01\x05' + struct.pack('>I', 9) + b'\x00' * 4
+AVC_HEADER = FlvTag(TAG_VIDEO, 0, b'\x17\x00\x00\x00\x00\x01\x64')
+AAC_HEADER = FlvTag(TAG_AUDIO, 0, b'\xaf\x00\x12\x10')
+METADATA = FlvTag(TAG_SCRIPT, 0, b'\x02\x00\x0aonMetaData')
+
+
+def keyframe(timestamp: int) -> FlvTag:
+    return FlvTag(TAG_VIDEO, timestamp, b'\x17\x01\x00\x00\x00key')
+
+
+def interframe(timestamp: int) -> FlvTag:
+    return FlvTag(TAG_VIDEO, timestamp, b'\x27\x01\x00\x00\x00inter')
+
+
+def audio(timestamp: int) -> FlvTag:
+    return FlvTag(TAG_AUDIO, timestamp, b'\xaf\x01aac')
+
+
+def stream(*tags: FlvTag) -> bytes:
+    return FILE_HEADER + b''.join(tag.to_bytes() for tag in tags)
+
+
+def read_tags(path) -> list[FlvTag]:
+    parser = FlvTagParser()
+    return parser.feed(path.read_bytes())
+
+
+def test_tag_flags():
+    assert keyframe(0).is_keyframe
+    assert not interframe(0).is_keyframe
+    assert AVC_HEADER.is_sequence_header and not AVC_HEADER.is_keyframe
+    assert AAC_HEADER.is_sequence_header
+    assert not audio(0).is_sequence_header
+
+
+def test_parser_handles_data_split_at_any_byte():
+    tags = [METADATA, AVC_HEADER, keyframe(0), audio(20), interframe(40), keyframe(2000)]
+    data = stream(*tags)
+    parser = FlvTagParser()
+    parsed = []
+    for i in range(0, len(data), 7):
+        parsed += parser.feed(data[i:i + 7])
+
+    assert parsed == tags
+    assert parser.corrupt_bytes == 0
+    assert parser.headers_seen == 1
+
+
+def test_parser_resyncs_after_garbage_and_a_corrupt_tag():
+    broken = bytearray(interframe(40).to_bytes())
+    broken[-1] ^= 0xff
+    data = stream(keyframe(0)) + b'\x01garbage\xff' + bytes(broken) + audio(60).to_bytes() + keyframe(80).to_bytes()
+
+    parser = FlvTagParser()
+    tags = parser.feed(data)
+
+    assert tags == [keyframe(0), audio(60), keyframe(80)]
+    assert parser.corrupt_bytes == len(b'\x01garbage\xff') + len(broken)
+
+
+def test_parser_restarts_on_a_new_file_header():
+    parser = FlvTagParser()
+    tags = parser.feed(stream(keyframe(0), audio(20)) + stream(keyframe(0)))
+
+    assert tags == [keyframe(0), audio(20), keyframe(0)]
+    assert parser.headers_seen == 2
+
+
+def test_segment_writer_splits_on_keyframes_with_headers_and_rebased_timestamps(tmp_path):
+    closed = []
+    writer = FlvSegmentWriter(str(tmp_path / 'rec_%03d.flv'), segment_time=1, on_file_closed=closed.append)
+    writer.write(stream(METADATA, AVC_HEADER, AAC_HEADER, interframe(0), keyframe(40), audio(60),
+                        interframe(1000), audio(1100), keyframe(1200), audio(1220), interframe(1240)))
+    writer.close()
+
+    assert writer.file_paths == [str(tmp_path / 'rec_000.flv'), str(tmp_path / 'rec_001.flv')]
+    assert closed == writer.file_paths
+    first, second = (read_tags(tmp_path / f'rec_00{i}.flv') for i in range(2))
+    # the interframe before the first keyframe is dropped, the split waits for the keyframe after 1s
+    assert [(t.tag_type, t.timestamp) for t in first[3:]] == [(TAG_VIDEO, 0), (TAG_AUDIO, 20), (TAG_VIDEO, 960),
+                                                              (TAG_AUDIO, 1060)]
+    assert second[:3] == [METADATA, AVC_HEADER, AAC_HEADER]
+    assert second[3].is_keyframe and second[3].timestamp == 0
+    assert [t.timestamp for t in second[4:]] == [20, 40]
+
+
+def test_segment_writer_keeps_timeline_continuous_across_reconnects(tmp_path):
+    writer = FlvSegmentWriter(str(tmp_path / 'rec.flv'))
+    writer.write(stream(AVC_HEADER, keyframe(5000), interframe(5040)))
+    writer.write(stream(AVC_HEADER, keyframe(0), interframe(40)))
+    writer.close()
+
+    timestamps = [t.timestamp for t in read_tags(tmp_path / 'rec.flv') if not t.is_sequence_header]
+    assert timestamps == [0, 40, 80, 120]
+    assert writer.discontinuities == 1
+
+
+def test_segment_writer_records_file_hashes(tmp_path):
+    writer = FlvSegmentWriter(str(tmp_path / 'rec.flv'), hash_algorithm='sha256')
+    writer.write(stream(AVC_HEADER, keyframe(0)))
+    writer.close()
+
+    expected = 'sha256:' + hashlib.sha256((tmp_path / 'rec.flv').read_bytes()).hexdigest()
+    assert writer.file_hashes == {str(tmp_path / 'rec.flv'): expected}
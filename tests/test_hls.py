@@ -0,0 +1,104 @@
+import time
+
+from src.hls import (
+    HlsVariant, MasterPlaylistCache, is_master_playlist, parse_master_playlist, parse_media_playlist, rank_variants,
+)
+
+MASTER = """#EXTM3U
+#EXT-X-VERSION:3
+#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360,CODECS="avc1.4d401e,mp4a.40.2"
+low/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=5000000,AVERAGE-BANDWIDTH=4500000,RESOLUTION=1920x1080,FRAME-RATE=30.000,CODECS="avc1.640028,mp4a.40.2"
+https://cdn.example.com/live/high.m3u8?token=a,b
+#EXT-X-STREAM-INF:BANDWIDTH=5000000,RESOLUTION=1920x1080,FRAME-RATE=60,CODECS="avc1.640028,mp4a.40.2"
+high60/index.m3u8
+
+#EXT-X-STREAM-INF:AVERAGE-BANDWIDTH=2000000,RESOLUTION=1280x720
+mid/index.m3u8
+"""
+
+
+def test_parse_master_playlist_reads_attributes_and_resolves_uris():
+    variants = parse_master_playlist(MASTER, 'https://example.com/live/master.m3u8')
+
+    assert is_master_playlist(MASTER)
+    assert [v.uri for v in variants] == [
+        'https://example.com/live/low/index.m3u8',
+        'https://cdn.example.com/live/high.m3u8?token=a,b',
+        'https://example.com/live/high60/index.m3u8',
+        'https://example.com/live/mid/index.m3u8',
+    ]
+    high = variants[1]
+    assert high.bandwidth == 5000000
+    assert high.average_bandwidth == 4500000
+    assert high.resolution == (1920, 1080)
+    assert high.frame_rate == 30.0
+    assert high.codecs == ('avc1.640028', 'mp4a.40.2')
+    assert variants[3].bandwidth == 0
+
+
+def test_rank_variants_orders_by_bandwidth_then_resolution_and_frame_rate():
+    variants = parse_master_playlist(MASTER, 'https://example.com/live/master.m3u8')
+    ranked = rank_variants(variants)
+
+    low, high, high60, mid = variants
+    assert ranked == [high60, high, mid, low]
+
+
+def test_rank_variants_prefers_h264_over_hevc_at_equal_quality():
+    hevc = HlsVariant('hevc.m3u8', bandwidth=1000, resolution=(1280, 720), codecs=('hvc1.1.6.L93.B0',))
+    avc = HlsVariant('avc.m3u8', bandwidth=1000, resolution=(1280, 720), codecs=('avc1.64001f', 'mp4a.40.2'))
+
+    assert rank_variants([hevc, avc])[0] is avc
+
+
+def test_parse_media_playlist_numbers_segments_from_media_sequence():
+    playlist = parse_media_playlist("""#EXTM3U
+#EXT-X-TARGETDURATION:4
+#EXT-X-MEDIA-SEQUENCE:120
+#EXT-X-DISCONTINUITY-SEQUENCE:3
+#EXTINF:4.000,
+seg120.ts
+#EXT-X-DISCONTINUITY
+#EXT-X-PROGRAM-DATE-TIME:2024-01-01T20:00:00.000Z
+#EXTINF:3.5,title
+seg121.ts
+""", 'https://example.com/live/index.m3u8')
+
+    assert playlist.target_duration == 4.0
+    assert playlist.discontinuity_sequence == 3
+    assert [s.sequence for s in playlist.segments] == [120, 121]
+    assert playlist.last_sequence == 121
+    assert playlist.segments[0].uri == 'https://example.com/live/seg120.ts'
+    assert not playlist.segments[0].discontinuity
+    assert playlist.segments[1].discontinuity
+    assert playlist.segments[1].duration == 3.5
+    assert playlist.segments[1].program_date_time == '2024-01-01T20:00:00.000Z'
+    assert not playlist.endlist and not playlist.encrypted
+
+
+def test_parse_media_playlist_flags_features_the_recorder_cannot_copy():
+    playlist = parse_media_playlist("""#EXTM3U
+#EXT-X-KEY:METHOD=AES-128,URI="key.bin"
+#EXT-X-MAP:URI="init.mp4"
+#EXT-X-BYTERANGE:1000@0
+#EXTINF:2,
+seg.m4s
+#EXT-X-ENDLIST
+""", 'https://example.com/index.m3u8')
+
+    assert playlist.encrypted and playlist.has_init_segment and playlist.has_byte_range and playlist.endlist
+    assert not parse_media_playlist('#EXT-X-KEY:METHOD=NONE\n', '').encrypted
+
+
+def test_master_playlist_cache_expires_before_the_signed_url():
+    cache = MasterPlaylistCache(max_size=2, ttl=300, margin=30)
+    variants = [HlsVariant('a.m3u8')]
+
+    cache.put(f'https://example.com/a.m3u8?expires={int(time.time()) + 20}', variants)
+    assert cache.get(f'https://example.com/a.m3u8?expires={int(time.time()) + 20}') is None
+
+    for name in ('a', 'b', 'c'):
+        cache.put(f'https://example.com/{name}.m3u8', variants)
+    assert cache.get('https://example.com/a.m3u8') is None
+    assert cache.get('https://example.com/c.m3u8') == variants
@@ -0,0 +1,95 @@
+import asyncio
+import json
+
+from src import hls_recorder
+from src.hls_recorder import HlsRecorder
+
+
+def media_playlist(first: int, count: int, prefix: str, endlist: bool = False) -> str:
+    lines = ['#EXTM3U', '#EXT-X-TARGETDURATION:1', f'#EXT-X-MEDIA-SEQUENCE:{first}']
+    for sequence in range(first, first + count):
+        lines += ['#EXTINF:1.0,', f'{prefix}{sequence}.ts?token=abc']
+    if endlist:
+        lines.append('#EXT-X-ENDLIST')
+    return '\n'.join(lines) + '\n'
+
+
+class FakeResponse:
+    def __init__(self, url: str, text: str = '', content: bytes = b''):
+        self.url = url
+        self.text = text
+        self.content = content
+
+    def raise_for_status(self) -> None:
+        pass
+
+
+class FakeClient:
+    def __init__(self, playlists: list[str]):
+        self.playlists = playlists
+        self.resolved = False
+
+    async def get(self, url: str, **kwargs) -> FakeResponse:
+        if url.endswith('.m3u8'):
+            if not self.resolved:
+                # the first request only tells whether this is a master playlist
+                self.resolved = True
+                return FakeResponse(url, text=self.playlists[0])
+            text = self.playlists.pop(0) if len(self.playlists) > 1 else self.playlists[0]
+            return FakeResponse(url, text=text)
+        return FakeResponse(url, content=url.rsplit('/', 1)[-1].split('?')[0].encode())
+
+
+def record(tmp_path, monkeypatch, playlists: list[str]) -> tuple[HlsRecorder, bytes]:
+    monkeypatch.setattr(hls_recorder, 'get_pooled_client', lambda proxy: FakeClient(playlists))
+    monkeypatch.setattr(hls_recorder, 'HLS_MIN_RELOAD_INTERVAL', 0)
+
+    async def no_wait(self, seconds):
+        pass
+
+    monkeypatch.setattr(HlsRecorder, '_wait', no_wait)
+    save_path = tmp_path / 'live.ts'
+    recorder = HlsRecorder('https://cdn.example/live.m3u8', str(save_path))
+    asyncio.run(recorder.run())
+    return recorder, save_path.read_bytes()
+
+
+def test_records_each_segment_once(tmp_path, monkeypatch):
+    recorder, data = record(tmp_path, monkeypatch, [
+        media_playlist(100, 3, 'a'),
+        media_playlist(101, 3, 'a'),
+        media_playlist(102, 3, 'a', endlist=True),
+    ])
+    assert data == b'a100.tsa101.tsa102.tsa103.tsa104.ts'
+    assert recorder.segments_written == 5
+
+
+def test_sequence_reset_is_followed(tmp_path, monkeypatch):
+    recorder, data = record(tmp_path, monkeypatch, [
+        media_playlist(500, 3, 'a'),
+        # stream restarted on another CDN: numbering starts over
+        media_playlist(0, 3, 'b'),
+        media_playlist(1, 3, 'b', endlist=True),
+    ])
+    assert data == b'a500.tsa501.tsa502.tsb0.tsb1.tsb2.tsb3.ts'
+    events = json.loads((tmp_path / 'live.manifest.json').read_text(encoding='utf-8'))['events']
+    assert [e['type'] for e in events if e['type'] == 'sequence_reset'] == ['sequence_reset']
+
+
+def test_small_reset_detected_by_unseen_segment(tmp_path, monkeypatch):
+    _, data = record(tmp_path, monkeypatch, [
+        media_playlist(3, 3, 'a'),
+        media_playlist(0, 3, 'b', endlist=True),
+    ])
+    assert data == b'a3.tsa4.tsa5.tsb0.tsb1.tsb2.ts'
+
+
+def test_lagging_playlist_is_not_a_reset(tmp_path, monkeypatch):
+    recorder, data = record(tmp_path, monkeypatch, [
+        media_playlist(10, 3, 'a'),
+        # an edge serving an older copy of the same playlist
+        media_playlist(9, 3, 'a'),
+        media_playlist(11, 3, 'a', endlist=True),
+    ])
+    assert data == b'a10.tsa11.tsa12.tsa13.ts'
+    assert not [e for e in recorder.events if e['type'] == 'sequence_reset']
@@ -0,0 +1,69 @@
+import time
+
+import pytest
+
+from src import job_store
+from src.job_store import JOB_DONE, JOB_FAILED, JOB_PENDING, JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs.db'))
+
+
+def test_enqueue_dedupes_pending_jobs(store):
+    job_id = store.enqueue('converts_mp4', ['/rec/a.ts', True])
+    assert job_id is not None
+    assert store.enqueue('converts_mp4', ['/rec/a.ts', True]) is None
+    assert store.enqueue('converts_mp4', ['/rec/b.ts', True]) != job_id
+
+
+@pytest.mark.parametrize('finish', ['complete', 'fail'])
+def test_finished_job_can_be_submitted_again(store, finish):
+    job_id = store.enqueue('move_group', [['/rec/a.ts'], '/archive'], max_attempts=1)
+    assert store.claim(job_id)
+    if finish == 'complete':
+        store.complete(job_id)
+    else:
+        assert store.fail(job_id, 'disk gone') is None
+    assert store.get(job_id)['state'] in (JOB_DONE, JOB_FAILED)
+
+    assert store.enqueue('move_group', [['/rec/a.ts'], '/archive'], max_attempts=1) == job_id
+    job = store.get(job_id)
+    assert (job['state'], job['attempts'], job['last_error']) == (JOB_PENDING, 0, None)
+
+
+def test_running_job_is_not_reset(store):
+    job_id = store.enqueue('converts_mp4', ['/rec/a.ts'])
+    assert store.claim(job_id)
+    assert store.enqueue('converts_mp4', ['/rec/a.ts']) is None
+    assert not store.claim(job_id)
+
+
+def test_fail_backs_off_then_gives_up(store, monkeypatch):
+    monkeypatch.setattr(time, 'time', lambda: 1000.0)
+    job_id = store.enqueue('converts_mp4', ['/rec/a.ts'], max_attempts=3)
+    delays = []
+    for _ in range(2):
+        assert store.claim(job_id)
+        delays.append(store.fail(job_id, 'ffmpeg exited 1') - 1000.0)
+    assert delays == [job_store.JOB_RETRY_BASE_DELAY, job_store.JOB_RETRY_BASE_DELAY * 2]
+    assert store.claim(job_id)
+    assert store.fail(job_id, 'ffmpeg exited 1') is None
+    job = store.get(job_id)
+    assert (job['state'], job['attempts']) == (JOB_FAILED, 3)
+
+
+def test_recover_returns_interrupted_jobs(store):
+    job_id = store.enqueue('converts_mp4', ['/rec/a.ts'])
+    store.claim(job_id)
+    assert store.recover() == 1
+    assert store.get(job_id)['state'] == JOB_PENDING
+
+
+def test_requeue_failed(store):
+    job_id = store.enqueue('converts_mp4', ['/rec/a.ts'], max_attempts=1)
+    store.claim(job_id)
+    store.fail(job_id, 'boom')
+    assert store.requeue() == 1
+    assert store.get(job_id)['state'] == JOB_PENDING
@@ -0,0 +1,81 @@
+import struct
+
+from src import mp4
+
+
+def box(box_type: bytes, payload: bytes) -> bytes:
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def chunk_offsets(box_type: bytes, offsets: list[int]) -> bytes:
+    fmt = '>I' if box_type == b'stco' else '>Q'
+    return box(box_type, b'\x00\x00\x00\x00' + struct.pack('>I', len(offsets)) +
+               b''.join(struct.pack(fmt, offset) for offset in offsets))
+
+
+def moov(video_offsets: list[int], audio_offsets: list[int]) -> bytes:
+    def trak(table: bytes) -> bytes:
+        return box(b'trak', box(b'tkhd', b'\x00' * 12) + box(b'mdia', box(b'minf', box(b'stbl', table))))
+    return box(b'moov', box(b'mvhd', b'\x00' * 20) + trak(chunk_offsets(b'stco', video_offsets)) +
+               trak(chunk_offsets(b'co64', audio_offsets)))
+
+
+def read_offsets(data: bytes, box_type: bytes) -> list[int]:
+    position = data.index(box_type) + 8
+    count = struct.unpack_from('>I', data, position)[0]
+    fmt, width = ('>I', 4) if box_type == b'stco' else ('>Q', 8)
+    return [struct.unpack_from(fmt, data, position + 4 + i * width)[0] for i in range(count)]
+
+
+def make_recording(path, chunk_starts: list[int] = (0, 9, 20)) -> bytes:
+    ftyp = box(b'ftyp', b'isom\x00\x00\x02\x00isomiso2mp41')
+    mdat = box(b'mdat', b'video-0;audio-0;video-1;audio-1;')
+    base = len(ftyp) + 8
+    data = ftyp + mdat + moov([base + start for start in chunk_starts], [base + 8, base + 24])
+    path.write_bytes(data)
+    return data
+
+
+def test_faststart_moves_moov_ahead_and_shifts_both_offset_tables(tmp_path):
+    path = tmp_path / 'rec.mp4'
+    original = make_recording(path)
+
+    assert mp4.faststart(str(path))
+
+    data = path.read_bytes()
+    assert [box_type for box_type, _, _ in mp4.read_layout(str(path))] == [b'ftyp', b'moov', b'mdat']
+    assert len(data) == len(original)
+    for box_type in (b'stco', b'co64'):
+        before, after = read_offsets(original, box_type), read_offsets(data, box_type)
+        assert [data[offset:offset + 7] for offset in after] == [original[offset:offset + 7] for offset in before]
+    assert not (tmp_path / 'rec.mp4.faststart').exists()
+
+
+def test_faststart_leaves_faststart_and_fragmented_files_alone(tmp_path):
+    path = tmp_path / 'rec.mp4'
+    make_recording(path)
+    mp4.faststart(str(path))
+    moved = path.read_bytes()
+    assert mp4.faststart(str(path))
+    assert path.read_bytes() == moved
+
+    fragmented = tmp_path / 'frag.mp4'
+    fragmented.write_bytes(box(b'ftyp', b'iso6') + box(b'moov', b'') + box(b'moof', b'') + box(b'mdat', b'x'))
+    assert mp4.is_fragmented(str(fragmented))
+    assert mp4.faststart(str(fragmented))
+
+
+def test_faststart_refuses_stco_offsets_that_would_overflow(tmp_path):
+    path = tmp_path / 'rec.mp4'
+    original = make_recording(path, chunk_starts=[0, 0xFFFFFFFF - 64])
+
+    assert not mp4.faststart(str(path))
+    assert path.read_bytes() == original
+    assert not (tmp_path / 'rec.mp4.faststart').exists()
+
+
+def test_faststart_skips_incomplete_files(tmp_path):
+    path = tmp_path / 'rec.mp4'
+    path.write_bytes(box(b'ftyp', b'isom') + box(b'mdat', b'data'))
+
+    assert not mp4.faststart(str(path))
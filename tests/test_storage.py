@@ -0,0 +1,130 @@
+import json
+import os
+import time
+from collections import namedtuple
+
+import pytest
+
+from src import storage
+from src.catalog import Catalog
+from src.storage import GB, RetentionPolicy, StorageManager, collect_recordings
+
+DiskUsage = namedtuple('DiskUsage', 'total used free')
+
+
+@pytest.fixture
+def disk(monkeypatch):
+    usage = {'free': 100 * GB}
+    monkeypatch.setattr(storage.shutil, 'disk_usage', lambda path: DiskUsage(0, 0, usage['free']))
+    return usage
+
+
+def make_file(path, size: int, age_hours: float):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b'\0' * size)
+    mtime = time.time() - age_hours * 3600
+    os.utime(path, (mtime, mtime))
+    return str(path)
+
+
+def test_admit_refuses_by_state_priority_and_quota(disk, tmp_path):
+    manager = StorageManager(str(tmp_path), hard_limit_gb=10, soft_limit_gb=20, low_priority=['抖音直播'],
+                             platform_quotas={'B站直播': 1}, anchor_quotas={'主播A': 2})
+    manager.platform_usage = {'B站直播': 2 * GB}
+    manager.anchor_usage = {'主播A': GB}
+
+    assert manager.admit('room1', '抖音直播', '主播A') == (True, None)
+    assert manager.admit('room2', 'B站直播', '主播B') == (False, 'platform_quota')
+
+    disk['free'] = 15 * GB
+    manager.check()
+    assert manager.state == storage.STATE_LOW
+    assert manager.admit('room1', '抖音直播', '主播A') == (False, 'low_priority')
+    assert manager.admit('room3', '虎牙直播', '主播A') == (True, None)
+    assert manager.should_pause('room1') and not manager.should_pause('room3')
+
+    disk['free'] = 5 * GB
+    assert manager.admit('room3', '虎牙直播', '主播A') == (False, 'full')
+    assert manager.paused_keys() == ['room1', 'room2', 'room3']
+    assert manager.refused == {'platform_quota': 1, 'low_priority': 1, 'full': 1}
+
+
+def test_retention_prunes_oldest_finished_recordings_first(disk, tmp_path):
+    oldest = make_file(tmp_path / '抖音直播' / 'a.ts', 10, age_hours=30)
+    older = make_file(tmp_path / '抖音直播' / 'b.ts', 10, age_hours=20)
+    newer = make_file(tmp_path / '抖音直播' / 'c.ts', 10, age_hours=10)
+    active = make_file(tmp_path / '抖音直播' / 'd.ts', 10, age_hours=0)
+    manager = StorageManager(str(tmp_path), hard_limit_gb=1, retention=RetentionPolicy(max_count=2))
+
+    manager.scan_and_prune()
+
+    assert not os.path.exists(oldest) and not os.path.exists(older)
+    assert os.path.exists(newer) and os.path.exists(active)
+    assert manager.platform_usage == {'抖音直播': 20}
+
+
+def test_retention_never_prunes_recordings_still_being_written(disk, tmp_path):
+    active = make_file(tmp_path / 'a.ts', 10, age_hours=0)
+    manager = StorageManager(str(tmp_path), hard_limit_gb=1, retention=RetentionPolicy(max_age_days=0.0001))
+    disk['free'] = 0
+
+    manager.scan_and_prune()
+
+    assert os.path.exists(active)
+
+
+def test_low_space_keeps_recordings_the_policy_does_not_expire(disk, tmp_path):
+    paths = [make_file(tmp_path / f'{name}.flv', 10, age_hours=age) for name, age in (('a', 3), ('b', 2), ('c', 1))]
+    manager = StorageManager(str(tmp_path), hard_limit_gb=1, retention=RetentionPolicy(max_age_days=30))
+    disk['free'] = 0
+
+    manager.check()
+
+    assert manager.state == storage.STATE_FULL
+    assert all(os.path.exists(path) for path in paths)
+    assert manager.admit('room', '抖音直播') == (False, 'full')
+
+
+def test_sessions_are_grouped_and_pruned_together(disk, tmp_path):
+    first = make_file(tmp_path / 'rec_000.ts', 10, age_hours=5)
+    second = make_file(tmp_path / 'rec_001.ts', 10, age_hours=4)
+    manifest = tmp_path / 'rec.session.json'
+    manifest.write_text(json.dumps({'state': 'closed', 'files': [
+        {'path': first, 'platform': '抖音直播', 'anchor': '主播A'}, {'path': second}]}), encoding='utf-8')
+    mtime = time.time() - 4 * 3600
+    os.utime(manifest, (mtime, mtime))
+    make_file(tmp_path / 'other.ts', 10, age_hours=1)
+
+    groups = collect_recordings(str(tmp_path))
+    assert [(len(group.paths), group.anchor) for group in groups] == [(3, '主播A'), (1, None)]
+
+    manager = StorageManager(str(tmp_path), hard_limit_gb=1, retention=RetentionPolicy(max_count=1))
+    manager.scan_and_prune()
+    assert sorted(os.listdir(tmp_path)) == ['other.ts']
+
+
+def test_open_sessions_are_kept(disk, tmp_path):
+    part = make_file(tmp_path / 'rec_000.ts', 10, age_hours=5)
+    manifest = tmp_path / 'rec.session.json'
+    manifest.write_text(json.dumps({'state': 'recording', 'files': [{'path': part}]}), encoding='utf-8')
+    mtime = time.time() - 5 * 3600
+    os.utime(manifest, (mtime, mtime))
+
+    manager = StorageManager(str(tmp_path), hard_limit_gb=1, retention=RetentionPolicy(max_age_days=0.01))
+    manager.scan_and_prune()
+
+    assert os.path.exists(part)
+
+
+def test_catalog_backed_collection_reads_room_info(disk, tmp_path):
+    catalog = Catalog(str(tmp_path / 'catalog.db'))
+    path = make_file(tmp_path / 'rec' / 'a.flv', 10, age_hours=2)
+    catalog.close_file(path, platform='B站直播', anchor='主播B')
+    missing = str(tmp_path / 'rec' / 'gone.flv')
+    catalog.close_file(missing)
+
+    groups = collect_recordings(str(tmp_path / 'rec'), catalog=catalog)
+
+    assert [(group.paths, group.platform, group.anchor) for group in groups] == [({path}, 'B站直播', '主播B')]
+    assert {row['path']: row['state'] for row in catalog.query(under=str(tmp_path / 'rec'))} == {
+        path: 'closed', missing: 'deleted'}
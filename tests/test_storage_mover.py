@@ -0,0 +1,128 @@
+import errno
+import hashlib
+import json
+import os
+import types
+
+import pytest
+
+from src import storage_mover
+from src.storage_mover import PART_SUFFIX, StorageMover, copy_file
+
+
+def sha256(data: bytes) -> str:
+    return 'sha256:' + hashlib.sha256(data).hexdigest()
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'rec' / '抖音直播' / 'a.ts'
+    path.parent.mkdir(parents=True)
+    path.write_bytes(os.urandom(3 * 1024 * 1024 + 17))
+    return path
+
+
+@pytest.fixture
+def cross_device(monkeypatch, tmp_path):
+    """Make the archive tree look like another filesystem so moves take the copy path."""
+    stat = os.stat
+
+    def fake_stat(path, *args, **kwargs):
+        result = stat(path, *args, **kwargs)
+        if str(path).startswith(str(tmp_path / 'archive')):
+            return types.SimpleNamespace(st_dev=result.st_dev + 1, st_size=result.st_size, st_mode=result.st_mode)
+        return result
+
+    monkeypatch.setattr(storage_mover.os, 'stat', fake_stat)
+
+
+def test_copy_file_resumes_a_partial_copy(source, tmp_path, monkeypatch):
+    monkeypatch.setattr(storage_mover, 'MOVE_CHUNK_SIZE', 1024 * 1024)
+    destination = tmp_path / 'archive' / 'a.ts'
+    destination.parent.mkdir()
+    data = source.read_bytes()
+    # a marker in the partial file proves its bytes were kept rather than copied again
+    (tmp_path / 'archive' / ('a.ts' + PART_SUFFIX)).write_bytes(b'X' * 1024 + data[1024:2 * 1024 * 1024])
+
+    copy_file(str(source), str(destination))
+
+    copied = destination.read_bytes()
+    assert copied[:1024] == b'X' * 1024 and copied[1024:] == data[1024:]
+    assert not (tmp_path / 'archive' / ('a.ts' + PART_SUFFIX)).exists()
+    assert os.path.getmtime(destination) == os.path.getmtime(source)
+
+
+def test_copy_file_restarts_a_partial_copy_longer_than_the_source(source, tmp_path):
+    destination = tmp_path / 'archive' / 'a.ts'
+    destination.parent.mkdir()
+    (tmp_path / 'archive' / ('a.ts' + PART_SUFFIX)).write_bytes(b'X' * (source.stat().st_size + 1))
+
+    copy_file(str(source), str(destination))
+
+    assert destination.read_bytes() == source.read_bytes()
+
+
+def test_copy_file_falls_back_when_kernel_copy_is_unsupported(source, tmp_path, monkeypatch):
+    def unsupported(*args):
+        raise OSError(errno.EXDEV, 'cross-device')
+
+    monkeypatch.setattr(storage_mover.os, 'copy_file_range', unsupported, raising=False)
+    monkeypatch.setattr(storage_mover.os, 'sendfile', unsupported, raising=False)
+    destination = tmp_path / 'archive' / 'a.ts'
+
+    copy_file(str(source), str(destination))
+
+    assert destination.read_bytes() == source.read_bytes()
+
+
+def test_move_file_verifies_the_copy_against_the_recorded_hash(source, tmp_path, cross_device):
+    mover = StorageMover(str(tmp_path / 'rec'), [str(tmp_path / 'archive')], min_age=0)
+    destination = tmp_path / 'archive' / '抖音直播' / 'a.ts'
+    data = source.read_bytes()
+
+    mover.move_file(str(source), str(destination), sha256(data))
+
+    assert not source.exists() and destination.read_bytes() == data
+    assert mover.moved_files == 1 and mover.moved_bytes == len(data)
+
+
+def test_move_file_keeps_the_source_when_verification_fails(source, tmp_path, cross_device):
+    mover = StorageMover(str(tmp_path / 'rec'), [str(tmp_path / 'archive')], min_age=0)
+    destination = tmp_path / 'archive' / '抖音直播' / 'a.ts'
+
+    with pytest.raises(OSError, match='hash mismatch'):
+        mover.move_file(str(source), str(destination), sha256(b'something else'))
+
+    assert source.exists() and not destination.exists()
+    assert mover.moved_files == 0
+
+
+def test_move_group_moves_the_manifest_last_and_points_it_at_the_archive(tmp_path):
+    rec, archive = tmp_path / 'rec', tmp_path / 'archive'
+    part = rec / 'room' / 'rec_000.ts'
+    part.parent.mkdir(parents=True)
+    part.write_bytes(b'data')
+    manifest = rec / 'room' / 'rec.session.json'
+    manifest.write_text(json.dumps({'state': 'closed', 'output': str(part), 'files': [{'path': str(part)}]}),
+                        encoding='utf-8')
+    mover = StorageMover(str(rec), [str(archive)], min_age=0)
+
+    assert mover.move_group([str(part), str(manifest)], str(archive))
+
+    moved = json.loads((archive / 'room' / 'rec.session.json').read_text(encoding='utf-8'))
+    assert moved['files'][0]['path'] == moved['output'] == str(archive / 'room' / 'rec_000.ts')
+    assert (archive / 'room' / 'rec_000.ts').read_bytes() == b'data'
+    assert not part.exists() and not manifest.exists()
+
+
+def test_move_group_keeps_the_manifest_when_a_file_fails(tmp_path):
+    rec, archive = tmp_path / 'rec', tmp_path / 'archive'
+    (rec / 'room').mkdir(parents=True)
+    manifest = rec / 'room' / 'rec.session.json'
+    manifest.write_text('{}', encoding='utf-8')
+    mover = StorageMover(str(rec), [str(archive)], min_age=0)
+
+    assert not mover.move_group([str(rec / 'room' / 'missing.ts'), str(manifest)], str(archive))
+
+    assert manifest.exists()
+    assert mover.failed == 1
@@ -0,0 +1,46 @@
+import hashlib
+import threading
+
+from src.integrity import TailHasher
+from src.supervisor import FfmpegSupervisor
+
+
+def test_digest_covers_output_written_until_exit(tmp_path):
+    output = tmp_path / 'out.ts'
+    supervisor = FfmpegSupervisor()
+    script = f'for i in $(seq 1 20); do head -c 65536 /dev/urandom >> {output}; sleep 0.05; done'
+    process = supervisor.start('room', ['sh', '-c', script], hash_path=str(output), hash_algorithm='sha256')
+
+    assert process.wait(30) == 0
+    assert process.digest == 'sha256:' + hashlib.sha256(output.read_bytes()).hexdigest()
+    supervisor.stop_all()
+
+
+def test_hashing_runs_off_the_supervisor_thread(tmp_path, monkeypatch):
+    threads = set()
+    poll = TailHasher.poll
+
+    def record_poll(self):
+        threads.add(threading.current_thread().name)
+        return poll(self)
+
+    monkeypatch.setattr(TailHasher, 'poll', record_poll)
+    output = tmp_path / 'out.flv'
+    supervisor = FfmpegSupervisor()
+    script = f'for i in $(seq 1 15); do printf data >> {output}; sleep 0.1; done'
+    process = supervisor.start('room', ['sh', '-c', script], hash_path=str(output), hash_algorithm='sha256')
+
+    assert process.wait(30) == 0
+    assert process.digest == 'sha256:' + hashlib.sha256(output.read_bytes()).hexdigest()
+    assert threads and all(name.startswith('ffmpeg-hash') for name in threads)
+    supervisor.stop_all()
+
+
+def test_finish_ignores_later_polls(tmp_path):
+    path = tmp_path / 'out.ts'
+    path.write_bytes(b'abc')
+    hasher = TailHasher(str(path), 'sha256')
+    digest = hasher.finish()
+    path.write_bytes(b'abcdef')
+    assert hasher.poll() == 0
+    assert digest == 'sha256:' + hashlib.sha256(b'abc').hexdigest()